@@ -1,9 +1,503 @@
+import startup_profile  # 起動時間の計測（最初に import する）
 import customtkinter as ctk
 from tkinter import filedialog, messagebox, Toplevel, Label, Entry
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+# pandas と matplotlib は起動を速くするため、初めて使う関数の中で import する
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import numpy as np
+from live_feed import LiveFeedReader  # 共有メモリ配信の購読
+from run_archive import RunArchive  # 測定アーカイブ（.vdrun）
+from run_events import read_events, detect_events, events_sidecar_path, GAP_COLUMN  # 記録されたイベントの読み込みと推定
+from figure_export import FigureExporter, EXPORT_FILETYPES  # グラフ画像の書き出し（ワーカープロセス）
+startup_profile.mark("import")
+
+# タイムスタンプ設定の初期値（名前: 色）
+TIMESTAMP_COLORS = {
+    "start temperature": "green",
+    "end temperature": "orange",
+    "start vapor deposition": "blue",
+    "end vapor deposition": "red"
+}
+
+# PNG保存時のファイル名サフィックス（グラフの順番と対応）
+# タブ名 → グラフの属性名の接頭辞（self.vac_fig など）
+GRAPH_TABS = {"真空度": "vac", "温度＆電圧": "temp", "真空度 (指定秒から)": "vac_off", "温度＆電圧 (指定秒から)": "temp_off"}
+GRAPH_SUFFIXES = ["_vac", "_temp", "_vac_offset", "_temp_offset"]
+
+# 測定値の列名（acquisition.py の EXPORT_COLUMNS と同じ）
+CHANNEL_COLUMNS = ["ピラニ1", "ピラニ2", "電離真空計", "熱電対", "ヒーター電圧"]
+# チャンネルごとの値を読み終えた時刻（epoch秒、acquisition.py の TIME_COLUMNS）の列と、それを経過秒にした列の接尾辞
+TIME_SUFFIX = "(時刻)"
+ELAPSED_SUFFIX = "(経過)"
+
+# 追従モードの設定
+LIVE_LOG_DIR = "live_logs"      # acquisition.py が測定中のCSVログを書き出すフォルダ
+FOLLOW_INTERVAL_MS = 2000       # 追記分を読みに行く間隔（ミリ秒）
+
+# min/max ピラミッドの設定
+# ビューアーで開ける測定ファイル（一括描画もこの拡張子のファイルを対象にする）
+RUN_FILETYPES = [("Excel files", "*.xlsx *.xls"), ("CSV files", "*.csv"), ("測定アーカイブ", "*.vdrun")]
+PYRAMID_CHANNELS = ["電離真空計", "熱電対", "ヒーター電圧"]
+PYRAMID_FACTOR = 4          # 1段ごとの間引き率
+PYRAMID_MIN_POINTS = 2000   # この点数以下になったら段の生成をやめる
+# キャッシュの形式。x軸や段の作り方を変えたら上げる（2: チャンネルごとの経過時間を x にした）
+PYRAMID_CACHE_VERSION = 2
+
+
+def make_timestamp_settings(times=None):
+    """タイムスタンプ設定の辞書を作成する。times は {名前: 秒} の辞書（省略可）。"""
+    times = times or {}
+    return {key: {"time": times.get(key), "color": color} for key, color in TIMESTAMP_COLORS.items()}
+
+
+def read_table(file_path):
+    """
+    Excel / CSV の測定ファイルを DataFrame で読む。
+    CSV は Epoch 列があれば Timestamp 列（文字列）を読まず、時刻の列は float64 の値をそのまま復元する。
+    """
+    import pandas as pd
+    if not file_path.lower().endswith(".csv"):
+        return pd.read_excel(file_path)
+    with open(file_path, encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f), [])
+    usecols = [c for c in header if c != "Timestamp"] if "Epoch" in header else None
+    return pd.read_csv(file_path, encoding="utf-8-sig", usecols=usecols, float_precision="round_trip")
+
+
+def add_channel_elapsed(df, start):
+    """チャンネルごとの時刻の列があれば、start（epoch秒）からの経過秒の列（"熱電対(経過)" など）を追加する。"""
+    for c in CHANNEL_COLUMNS:
+        if c + TIME_SUFFIX in df.columns:
+            df[c + ELAPSED_SUFFIX] = (df[c + TIME_SUFFIX] - start).fillna(df["Elapsed"])
+
+
+def elapsed_column(data, column):
+    """column の値を描くときの x（経過秒）の列名。チャンネルごとの時刻が無いファイルは行の "Elapsed"。"""
+    name = column + ELAPSED_SUFFIX
+    return name if name in data.columns else "Elapsed"
+
+
+def add_elapsed_column(df):
+    """
+    先頭からの経過秒を "Elapsed" 列として追加する（チャンネルごとの時刻があればその経過秒の列も）。
+    Epoch 列（数値の秒）があればそのまま使い、古い形式のファイルは Timestamp 列の文字列を変換する。
+    """
+    if "Epoch" in df.columns:
+        start = df["Epoch"].iloc[0]
+        df["Elapsed"] = df["Epoch"] - start
+        add_channel_elapsed(df, start)
+        return df
+    import pandas as pd
+    df["Timestamp"] = pd.to_datetime(df["Timestamp"])
+    df["Elapsed"] = (df["Timestamp"] - df["Timestamp"].iloc[0]).dt.total_seconds()
+    return df
+
+
+class MinMaxPyramid:
+    """
+    1チャンネル分の min/max ピラミッド。
+    levels[0] は元データ、levels[k] は PYRAMID_FACTOR**k 点ごとの (先頭x, 最小値, 最大値)。
+    間引いても各区間の最小・最大を残すので、圧力スパイクは表示から消えない。
+    """
+    def __init__(self, levels):
+        self.levels = levels
+
+    @classmethod
+    def build(cls, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        levels = [(x, y, y)]
+        while len(levels[-1][0]) > PYRAMID_MIN_POINTS:
+            px, pmin, pmax = levels[-1]
+            idx = np.arange(0, len(px), PYRAMID_FACTOR)
+            levels.append((px[idx], np.fmin.reduceat(pmin, idx), np.fmax.reduceat(pmax, idx)))
+        return cls(levels)
+
+    def select(self, x0, x1, pixels):
+        """x0〜x1 の範囲を横幅 pixels で描くのに十分な段を選び、(x, y) を返す。"""
+        x = self.levels[0][0]
+        n = np.searchsorted(x, x1, "right") - np.searchsorted(x, x0, "left")
+        level = 0
+        while level + 1 < len(self.levels) and n / PYRAMID_FACTOR ** level > max(pixels, 1):
+            level += 1
+        lx, lmin, lmax = self.levels[level]
+        # 範囲の外側1点ずつも含めて、端で線が途切れないようにする
+        i0 = max(np.searchsorted(lx, x0, "right") - 1, 0)
+        i1 = min(np.searchsorted(lx, x1, "right") + 1, len(lx))
+        if level == 0:
+            return lx[i0:i1], lmin[i0:i1]
+        return np.repeat(lx[i0:i1], 2), np.column_stack((lmin[i0:i1], lmax[i0:i1])).ravel()
+
+
+def load_or_build_pyramids(file_path, data, cache=True):
+    """
+    PYRAMID_CHANNELS の各列について min/max ピラミッドを作成する。
+    "<ファイル名>.pyramid.npz" にキャッシュし、元ファイルもキャッシュの形式（PYRAMID_CACHE_VERSION）も
+    変わっていなければそれを読み込む。
+    ファイルの一部だけを読み込んだ場合は cache=False にする。
+    """
+    channels = [c for c in PYRAMID_CHANNELS if c in data.columns]
+    if not cache:
+        return {c: MinMaxPyramid.build(data[elapsed_column(data, c)], data[c]) for c in channels}
+    cache_path = file_path + ".pyramid.npz"
+    stat = os.stat(file_path)
+    source_key = np.array([PYRAMID_CACHE_VERSION, stat.st_mtime, stat.st_size])
+    try:
+        with np.load(cache_path) as npz:
+            if np.array_equal(npz["source"], source_key) and list(npz["channels"]) == channels:
+                return {c: MinMaxPyramid([tuple(npz[f"c{i}_l{k}"]) for k in range(int(npz[f"c{i}_levels"]))])
+                        for i, c in enumerate(channels)}
+    except (OSError, KeyError, ValueError):
+        pass
+    pyramids = {c: MinMaxPyramid.build(data[elapsed_column(data, c)], data[c]) for c in channels}
+    arrays = {"source": source_key, "channels": np.array(channels)}
+    for i, c in enumerate(channels):
+        levels = pyramids[c].levels
+        arrays[f"c{i}_levels"] = np.array(len(levels))
+        for k, level in enumerate(levels):
+            arrays[f"c{i}_l{k}"] = np.vstack(level)
+    try:
+        with open(cache_path, "wb") as f:
+            np.savez(f, **arrays)
+    except OSError as e:
+        print(f"ピラミッドのキャッシュ保存に失敗しました: {e}")
+    return pyramids
+
+
+class FollowBuffer:
+    """
+    追従モード用の列バッファ。容量を倍々に増やすので、行の追加は償却 O(1)。
+    column() は コピーせずにビューを返す。
+    """
+    def __init__(self, columns, capacity=1024):
+        self.columns = columns
+        self.size = 0
+        self.arrays = {c: np.empty(capacity) for c in columns}
+
+    def append_rows(self, rows):
+        need = self.size + len(rows)
+        capacity = len(self.arrays[self.columns[0]])
+        if need > capacity:
+            while capacity < need:
+                capacity *= 2
+            for c in self.columns:
+                grown = np.empty(capacity)
+                grown[:self.size] = self.arrays[c][:self.size]
+                self.arrays[c] = grown
+        block = np.array(rows, dtype=float).reshape(-1, len(self.columns))
+        for i, c in enumerate(self.columns):
+            self.arrays[c][self.size:need] = block[:, i]
+        self.size = need
+
+    def column(self, name):
+        return self.arrays[name][:self.size]
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({c: self.column(c).copy() for c in self.columns})
+
+
+def load_archive(file_path, t0=None, t1=None):
+    """
+    測定アーカイブ（.vdrun）を読み込み、(DataFrame, [(経過秒, ラベル, 色), ...]) を返す。
+    t0, t1 は測定開始からの経過秒で、指定すると範囲に重なるチャンクだけを展開する。
+    Elapsed は範囲の先頭ではなく測定開始からの経過秒（イベントの時刻と揃えるため）。
+    """
+    import pandas as pd
+    archive = RunArchive(file_path)
+    time_range = archive.time_range()
+    start = archive.meta.get("start_time") or (time_range[0] if time_range else 0.0)
+    columns = archive.read_window(None if t0 is None else start + t0, None if t1 is None else start + t1)
+    df = pd.DataFrame({"Epoch": columns.pop("time"), **columns})
+    df["Elapsed"] = df["Epoch"] - start
+    add_channel_elapsed(df, start)
+    events = [(e["t"] - start, e["label"], e["color"]) for e in archive.events]
+    return df, events
+
+
+def series_xy(data, column, offset=0.0, pyramids=None, ax=None):
+    """
+    グラフに描く (x, y) を返す。x はその列の値を測った時刻の経過秒から offset 秒を引いた値。
+    pyramids にその列があれば、軸の表示幅に合わせてピラミッドから間引いた値を使う。
+    """
+    elapsed = elapsed_column(data, column)
+    if pyramids and column in pyramids:
+        x_last = float(data[elapsed].iloc[-1])
+        x, y = pyramids[column].select(offset, x_last, ax.bbox.width)
+        return x - offset, y
+    selected = data[data[elapsed] >= offset]
+    return selected[elapsed] - offset, selected[column]
+
+
+def _draw_vac_graph(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids, lines):
+    # --- 真空度タブ（常に全データを表示） ---
+    vac_ax = axes["vac"]
+    vac_ax.clear()
+    if "Elapsed" in data.columns and "電離真空計" in data.columns:
+        line, = vac_ax.semilogy(*series_xy(data, "電離真空計", 0.0, pyramids, vac_ax),
+                                marker='o', linestyle='-', label="Ion Gauge")
+        lines.append((vac_ax, line, "電離真空計", 0.0))
+        # すべてのタイムスタンプ（4つ）を表示
+        for label_text, setting in timestamp_settings.items():
+            t_val = setting["time"]
+            color = setting["color"]
+            if t_val is not None:
+                vac_ax.axvline(x=t_val, color=color, linestyle='--', alpha=0.7)
+                y_max = data["電離真空計"].max() if not data["電離真空計"].empty else 1
+                vac_ax.text(t_val, y_max, label_text, rotation=45, fontsize=9, color=color)
+    vac_ax.set_xlabel("Time [s]")
+    vac_ax.set_xlim(left=0)
+    vac_ax.set_ylabel("Vacuum [Pa]")
+    vac_ax.set_title("degree of vacuum")
+    vac_ax.legend()
+    vac_ax.figure.tight_layout()
+
+
+def _draw_temp_graph(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids, lines):
+    # --- 温度＆電圧タブ（基礎データ全体、全4タイムスタンプ表示） ---
+    temp_ax = axes["temp"]
+    temp_ax2 = axes["temp2"]
+    temp_ax.clear()
+    temp_ax2.clear()
+    if "Elapsed" in data.columns and "熱電対" in data.columns:
+        line, = temp_ax.plot(*series_xy(data, "熱電対", 0.0, pyramids, temp_ax), 'r-', marker='o', label="Temperature [℃]")
+        lines.append((temp_ax, line, "熱電対", 0.0))
+        temp_ax.axhline(200, color='red', linestyle='--', linewidth=2, label="Target 200℃")
+    if "Elapsed" in data.columns and "ヒーター電圧" in data.columns:
+        line, = temp_ax2.plot(*series_xy(data, "ヒーター電圧", 0.0, pyramids, temp_ax2), 'b-', marker='x', label="Voltage [V]")
+        lines.append((temp_ax2, line, "ヒーター電圧", 0.0))
+    # すべてのタイムスタンプ表示
+    for label_text, setting in timestamp_settings.items():
+        t_val = setting["time"]
+        color = setting["color"]
+        if t_val is not None:
+            temp_ax.axvline(x=t_val, color=color, linestyle='--', alpha=0.7)
+            # y座標は温度軸の上部（例:380℃）
+            temp_ax.text(t_val, 380, label_text, rotation=45, fontsize=9, color=color)
+    temp_ax.set_xlabel("Time [s]")
+    temp_ax.set_xlim(left=0)
+    temp_ax.set_ylabel("Temperature [℃]", color='r')
+    temp_ax.set_ylim(0, 400)
+    temp_ax.set_yticks(range(0, 401, 50))
+    temp_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
+    temp_ax2.set_ylim(0, 50)
+    temp_ax2.set_yticks(range(0, 51, 5))
+    temp_ax2.yaxis.set_label_position("right")
+    temp_ax2.yaxis.tick_right()
+    temp_ax.legend(loc="upper left")
+    temp_ax2.legend(loc="upper right")
+    temp_ax.set_title("Temperature and Voltage")
+    temp_ax.figure.tight_layout()
+
+
+def _draw_vac_offset_graph(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids, lines):
+    # --- 追加タブ：真空度 (指定秒から)  ---
+    vac_off_ax = axes["vac_off"]
+    vac_off_ax.clear()
+    if "Elapsed" in data.columns and "電離真空計" in data.columns:
+        # 指定秒以降のデータを抽出し、オフセットを引いて調整
+        df_vac = data[data["Elapsed"] >= vacuum_offset]
+        if not df_vac.empty:
+            line, = vac_off_ax.semilogy(*series_xy(data, "電離真空計", vacuum_offset, pyramids, vac_off_ax),
+                                        marker='o', linestyle='-', label="ionization vacuum gauge")
+            lines.append((vac_off_ax, line, "電離真空計", vacuum_offset))
+            # タイムスタンプは "start vapor deposition" と "end vapor deposition" のみ表示
+            for label_text, setting in timestamp_settings.items():
+                if label_text in ["start vapor deposition", "end vapor deposition"]:
+                    t_val = setting["time"]
+                    color = setting["color"]
+                    if t_val is not None and t_val >= vacuum_offset:
+                        # 調整したx値
+                        vac_off_ax.axvline(x=t_val - vacuum_offset, color=color, linestyle='--', alpha=0.7)
+                        y_max = df_vac["電離真空計"].max() if not df_vac["電離真空計"].empty else 1
+                        vac_off_ax.text(t_val - vacuum_offset, y_max, label_text, rotation=45, fontsize=9, color=color)
+    vac_off_ax.set_xlabel("Time [s]")
+    vac_off_ax.set_xlim(left=0)
+    vac_off_ax.set_ylabel("Vacuum [Pa]")
+    vac_off_ax.set_title("degree of vacuum")
+    vac_off_ax.legend()
+    vac_off_ax.figure.tight_layout()
+
+
+def _draw_temp_offset_graph(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids, lines):
+    # --- 追加タブ：温度＆電圧 (指定秒から) ---
+    temp_off_ax = axes["temp_off"]
+    temp_off_ax2 = axes["temp_off2"]
+    temp_off_ax.clear()
+    temp_off_ax2.clear()
+    if "Elapsed" in data.columns and "熱電対" in data.columns:
+        df_temp = data[data["Elapsed"] >= temp_offset]
+        if not df_temp.empty:
+            line, = temp_off_ax.plot(*series_xy(data, "熱電対", temp_offset, pyramids, temp_off_ax),
+                                     'r-', marker='o', label="Temperature [℃]")
+            lines.append((temp_off_ax, line, "熱電対", temp_offset))
+            temp_off_ax.axhline(200, color='red', linestyle='--', linewidth=2, label="Target 200℃")
+            # タイムスタンプは "start vapor deposition" と "end vapor deposition" のみ表示
+            for label_text, setting in timestamp_settings.items():
+                if label_text in ["start vapor deposition", "end vapor deposition"]:
+                    t_val = setting["time"]
+                    color = setting["color"]
+                    if t_val is not None and t_val >= temp_offset:
+                        temp_off_ax.axvline(x=t_val - temp_offset, color=color, linestyle='--', alpha=0.7)
+                        temp_off_ax.text(t_val - temp_offset, 380, label_text, rotation=45, fontsize=9, color=color)
+    if "Elapsed" in data.columns and "ヒーター電圧" in data.columns:
+        df_volt = data[data["Elapsed"] >= temp_offset]
+        if not df_volt.empty:
+            line, = temp_off_ax2.plot(*series_xy(data, "ヒーター電圧", temp_offset, pyramids, temp_off_ax2),
+                                      'b-', marker='x', label="Voltage [V]")
+            lines.append((temp_off_ax2, line, "ヒーター電圧", temp_offset))
+    temp_off_ax.set_xlabel("Time [s]")
+    temp_off_ax.set_xlim(left=0)
+    temp_off_ax.set_ylabel("Temperature [℃]", color='r')
+    temp_off_ax.set_ylim(0, 400)
+    temp_off_ax.set_yticks(range(0, 401, 50))
+    temp_off_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
+    temp_off_ax2.set_ylim(0, 50)
+    temp_off_ax2.set_yticks(range(0, 51, 5))
+    temp_off_ax2.yaxis.set_label_position("right")
+    temp_off_ax2.yaxis.tick_right()
+    temp_off_ax.legend(loc="upper left")
+    temp_off_ax2.legend(loc="upper right")
+    temp_off_ax.set_title("Temperature and Voltage")
+    temp_off_ax.figure.tight_layout()
+
+
+def draw_graphs(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids=None):
+    """
+    読み込んだデータを4つのグラフ軸に描画する（キャンバスの再描画は呼び出し側で行う）。
+
+    Parameters:
+        data (DataFrame): "Elapsed" 列を含む測定データ
+        timestamp_settings (dict): タイムスタンプ設定（{名前: {"time": 秒, "color": 色}}）
+        vacuum_offset (float): 真空度 (指定秒から) 用オフセット
+        temp_offset (float): 温度＆電圧 (指定秒から) 用オフセット
+        axes (dict): "vac", "temp", "temp2", "vac_off", "temp_off", "temp_off2" の各軸（None の軸のグラフは描かない）
+        pyramids (dict): 列名→MinMaxPyramid（省略時は全点を描画）
+
+    Returns:
+        list: ズーム時に差し替える系列 (軸, Line2D, 列名, オフセット) のリスト
+    """
+    lines = []
+    for key, draw in (("vac", _draw_vac_graph), ("temp", _draw_temp_graph),
+                      ("vac_off", _draw_vac_offset_graph), ("temp_off", _draw_temp_offset_graph)):
+        # まだ作成していないグラフ（軸が None または無い）は描かない
+        if axes.get(key) is not None:
+            draw(data, timestamp_settings, vacuum_offset, temp_offset, axes, pyramids, lines)
+    return lines
+
+
+def run_timestamps(file_path, data, events=None):
+    """
+    測定ファイルのイベントの時刻 {名前: 経過秒} を返す。
+    測定中に記録されたイベント（Excel の Events シート・測定ログのサイドカー）を使い、
+    記録が無ければ記録値（ヒーター電圧・温度・真空度、記録間隔）から推定する。
+    events（経過秒のイベント）を渡すとファイルからは読まない（.vdrun は load_archive() が読む）。
+    """
+    if events is None:
+        recorded = read_events(file_path)
+        if recorded is not None and "Epoch" in data.columns and len(data):
+            start = float(data["Epoch"].iloc[0])
+            events = [(t - start, label, color) for t, label, color in recorded]
+    if not events:
+        import pandas as pd
+        columns = [pd.to_numeric(data[c], errors="coerce").to_numpy() if c in data.columns else None
+                   for c in ("ヒーター電圧", "熱電対", "電離真空計")]
+        events = detect_events(data["Elapsed"].to_numpy(dtype=float), *columns, adaptive=GAP_COLUMN in data.columns)
+        if events:
+            print(f"{os.path.basename(file_path)}: イベントの記録が無いため、記録値から推定しました")
+    return {label: t for t, label, _ in events}
+
+
+def load_run_settings(file_path, data, events=None):
+    """
+    測定ファイルのタイムスタンプ（run_timestamps()、events はアーカイブに記録されたイベント）と、同名のサイドカーJSON（例: run1.xlsx → run1.json）の
+    タイムスタンプ・オフセットの設定を読み込む。JSON の値が優先で、JSON が無ければオフセットは 0。
+
+    JSONの形式:
+        {"timestamps": {"start vapor deposition": 1200, ...},
+         "vacuum_offset": 0, "temp_offset": 0}
+    """
+    sidecar = os.path.splitext(file_path)[0] + ".json"
+    settings = {}
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            settings = json.load(f)
+    timestamps = run_timestamps(file_path, data, events)
+    timestamps.update(settings.get("timestamps", {}))
+    return (make_timestamp_settings(timestamps),
+            float(settings.get("vacuum_offset", 0.0)),
+            float(settings.get("temp_offset", 0.0)))
+
+
+def batch_output_paths(file_path, out_dir, ext=".png"):
+    """1つの測定ファイルに対応する出力画像パスのリストを返す（GRAPH_SUFFIXES の順）。"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return [os.path.join(out_dir, stem + suffix + ext) for suffix in GRAPH_SUFFIXES]
+
+
+def is_up_to_date(file_path, out_dir, ext=".png"):
+    """出力画像がすべて存在し、測定ファイル・サイドカーより新しければ True を返す。"""
+    sources = [file_path, os.path.splitext(file_path)[0] + ".json", events_sidecar_path(file_path)]
+    source_mtime = max(os.path.getmtime(p) for p in sources if os.path.exists(p))
+    for path in batch_output_paths(file_path, out_dir, ext):
+        if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+            return False
+    return True
+
+
+def render_run(file_path, out_dir, ext=".png"):
+    """
+    1つの測定ファイルを読み込み、4つのグラフを Agg で描画して保存する（ワーカープロセス用）。
+    pyplot を使わず Figure を直接生成するので、Tk なしで動作する。
+    """
+    from matplotlib.figure import Figure
+    if file_path.lower().endswith(".vdrun"):
+        data, events = load_archive(file_path)
+    else:
+        data, events = add_elapsed_column(read_table(file_path)), None
+    timestamp_settings, vacuum_offset, temp_offset = load_run_settings(file_path, data, events)
+    figs = [Figure(figsize=(5,3)) for _ in GRAPH_SUFFIXES]
+    vac_ax, temp_ax, vac_off_ax, temp_off_ax = [fig.subplots() for fig in figs]
+    axes = {"vac": vac_ax, "temp": temp_ax, "temp2": temp_ax.twinx(),
+            "vac_off": vac_off_ax, "temp_off": temp_off_ax, "temp_off2": temp_off_ax.twinx()}
+    draw_graphs(data, timestamp_settings, vacuum_offset, temp_offset, axes)
+    paths = batch_output_paths(file_path, out_dir, ext)
+    for fig, path in zip(figs, paths):
+        fig.savefig(path)
+    return paths
+
+
+def batch_report(run_dir, out_dir=None, workers=None, force=False, ext=".png"):
+    """
+    フォルダ内の全測定ファイル（RUN_FILETYPES の拡張子。イベントのサイドカーは除く）について
+    グラフ画像をプロセスプールで一括生成する。
+    出力が最新のファイルはスキップする（force=True で全件再生成）。
+    """
+    out_dir = out_dir or run_dir
+    os.makedirs(out_dir, exist_ok=True)
+    patterns = [p for _, pattern in RUN_FILETYPES for p in pattern.split()]
+    files = sorted(f for p in patterns for f in glob.glob(os.path.join(run_dir, p))
+                   if not f.lower().endswith(".events.csv"))
+    targets = [f for f in files if force or not is_up_to_date(f, out_dir, ext)]
+    print(f"{len(files)} 件中 {len(targets)} 件を描画します（{len(files) - len(targets)} 件は最新のためスキップ）")
+    if not targets:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {f: pool.submit(render_run, f, out_dir, ext) for f in targets}
+        for file_path, future in futures.items():
+            try:
+                future.result()
+                print(f"保存完了: {os.path.basename(file_path)}")
+            except Exception as e:
+                print(f"描画エラー: {os.path.basename(file_path)}: {e}")
+
+
 
 class ExcelGraphViewer(ctk.CTk):
     def __init__(self):
@@ -11,16 +505,30 @@ class ExcelGraphViewer(ctk.CTk):
         self.title("Excel Graph Viewer")
         self.geometry("1200x700")
         # タイムスタンプ設定（既存）
-        self.timestamp_settings = {
-            "start temperature": {"time": None, "color": "green"},
-            "end temperature": {"time": None, "color": "orange"},
-            "start vapor deposition": {"time": None, "color": "blue"},
-            "end vapor deposition": {"time": None, "color": "red"}
-        }
+        self.timestamp_settings = make_timestamp_settings()
+        # グラフ画像の保存はワーカープロセスで行う
+        self.exporter = FigureExporter()
         # 新たにオフセット（開始秒数）の設定
         self.vacuum_offset = 0.0  # 真空度 (指定秒から) 用オフセット
         self.temp_offset = 0.0    # 温度＆電圧 (指定秒から) 用オフセット
+        # ズーム・パン用の min/max ピラミッドと、差し替え対象の系列
+        self.pyramids = None
+        self.pyramid_lines = []
+        # 次の追従の描画で全体を描き直す（グラフの作成・イベントの変更・追従の開始のとき）
+        self.redraw_needed = True
+        # 追従モード（測定中のCSVログを追記分だけ読み込む）
+        self.follow_path = None
+        self.follow_job = None
+        self.follow_offset = 0
+        self.follow_header = None
+        self.follow_t0 = None
+        self.follow_buffer = None
+        # 共有メモリ購読（同じPCで測定中の MeasurementApp から読む）
+        self.follow_feed = None
+        self.follow_feed_count = 0
         self.create_layout()
+        startup_profile.mark("layout")
+        self.after_idle(self.on_first_idle)
 
     def create_layout(self):
         # 上部：操作パネル（PNG保存、タイムスタンプ設定、開始秒数設定、終了ボタン）
@@ -42,6 +550,11 @@ class ExcelGraphViewer(ctk.CTk):
         ctk.CTkButton(self.left_frame, text="終了", command=self.quit,
                       fg_color="red", hover_color="darkred").pack(padx=10, pady=5)
         ctk.CTkButton(self.left_frame, text="Excelファイルを開く", command=self.load_data).pack(padx=10, pady=5)
+        ctk.CTkButton(self.left_frame, text="アーカイブの範囲を開く", command=self.open_archive_window).pack(padx=10, pady=5)
+        self.follow_button = ctk.CTkButton(self.left_frame, text="追従モード", command=self.toggle_follow)
+        self.follow_button.pack(padx=10, pady=5)
+        self.feed_button = ctk.CTkButton(self.left_frame, text="共有メモリ購読", command=self.toggle_feed_follow)
+        self.feed_button.pack(padx=10, pady=5)
         
         
         # 右側：タブ付きグラフ表示エリア（5タブ）
@@ -54,27 +567,48 @@ class ExcelGraphViewer(ctk.CTk):
         self.tabview.add("真空度 (指定秒から)")
         self.tabview.add("温度＆電圧 (指定秒から)")
 
-        # 真空度タブ用グラフ（常に全データを表示）
-        self.vac_fig, self.vac_ax = plt.subplots(figsize=(5,3))
-        self.vac_canvas = FigureCanvasTkAgg(self.vac_fig, master=self.tabview.tab("真空度"))
-        self.vac_canvas.get_tk_widget().pack(fill="both", expand=True)
+        # グラフはタブを初めて表示したときに create_figure() で作成する
+        self.tabview.configure(command=self.on_tab_changed)
+        self.vac_fig = self.vac_ax = self.vac_canvas = None
+        self.temp_fig = self.temp_ax = self.temp_ax2 = self.temp_canvas = None
+        self.vac_off_fig = self.vac_off_ax = self.vac_off_canvas = None
+        self.temp_off_fig = self.temp_off_ax = self.temp_off_ax2 = self.temp_off_canvas = None
 
-        # 温度＆電圧タブ用グラフ（双軸）
-        self.temp_fig, self.temp_ax = plt.subplots(figsize=(5,3))
-        self.temp_ax2 = self.temp_ax.twinx()
-        self.temp_canvas = FigureCanvasTkAgg(self.temp_fig, master=self.tabview.tab("温度＆電圧"))
-        self.temp_canvas.get_tk_widget().pack(fill="both", expand=True)
+    def on_tab_changed(self):
+        self.create_figure(self.tabview.get())
 
-        # 追加タブ：真空度 (指定秒から)
-        self.vac_off_fig, self.vac_off_ax = plt.subplots(figsize=(5,3))
-        self.vac_off_canvas = FigureCanvasTkAgg(self.vac_off_fig, master=self.tabview.tab("真空度 (指定秒から)"))
-        self.vac_off_canvas.get_tk_widget().pack(fill="both", expand=True)
+    def create_figure(self, tab_name):
+        """
+        指定したタブのグラフを作成する（作成済みなら何もしない）。matplotlib もここで初めて import する。
+        データを読み込み済みなら、作成したグラフにも描画する。
+        """
+        prefix = GRAPH_TABS[tab_name]
+        if getattr(self, prefix + "_fig") is not None:
+            return
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        fig = Figure(figsize=(5,3))
+        ax = fig.subplots()
+        canvas = FigureCanvasTkAgg(fig, master=self.tabview.tab(tab_name))
+        NavigationToolbar2Tk(canvas, self.tabview.tab(tab_name))
+        canvas.get_tk_widget().pack(fill="both", expand=True)
+        setattr(self, prefix + "_fig", fig)
+        setattr(self, prefix + "_ax", ax)
+        setattr(self, prefix + "_canvas", canvas)
+        if prefix in ("temp", "temp_off"):
+            # 温度＆電圧は双軸
+            setattr(self, prefix + "_ax2", ax.twinx())
+        if hasattr(self, "data"):
+            self.plot_graphs()
+        else:
+            self.redraw_needed = True
 
-        # 追加タブ：温度＆電圧 (指定秒から)
-        self.temp_off_fig, self.temp_off_ax = plt.subplots(figsize=(5,3))
-        self.temp_off_ax2 = self.temp_off_ax.twinx()
-        self.temp_off_canvas = FigureCanvasTkAgg(self.temp_off_fig, master=self.tabview.tab("温度＆電圧 (指定秒から)"))
-        self.temp_off_canvas.get_tk_widget().pack(fill="both", expand=True)
+    def on_first_idle(self):
+        """ウィンドウが表示され操作可能になった時点で、表示中のタブのグラフを作成し起動時間を記録する。"""
+        startup_profile.mark("window ready")
+        self.on_tab_changed()
+        startup_profile.mark("first figure")
+        startup_profile.report("ExcelGraphViewer")
 
     def open_offset_window(self):
         """開始秒数設定ウィンドウ"""
@@ -184,6 +718,8 @@ class ExcelGraphViewer(ctk.CTk):
             label (str): 表示するラベル
             color (str): ラインとラベルの色
         """
+        if graph_name in GRAPH_TABS:
+            self.create_figure(graph_name)
         # 対象のグラフ軸を選択
         if graph_name == "真空度":
             ax = self.vac_ax
@@ -210,165 +746,306 @@ class ExcelGraphViewer(ctk.CTk):
         canvas.draw()
 
     def load_data(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
+        file_path = filedialog.askopenfilename(filetypes=RUN_FILETYPES)
         if not file_path:
             return
+        self.stop_follow()
+        if file_path.lower().endswith(".vdrun"):
+            self.load_archive_data(file_path)
+            return
         try:
-            self.data = pd.read_excel(file_path)
+            self.data = read_table(file_path)
         except Exception as e:
             messagebox.showerror("エラー", f"Excelファイルの読み込みに失敗しました: {e}")
             return
         try:
-            self.data["Timestamp"] = pd.to_datetime(self.data["Timestamp"])
-            self.data["Elapsed"] = (self.data["Timestamp"] - self.data["Timestamp"].iloc[0]).dt.total_seconds()
+            add_elapsed_column(self.data)
         except Exception as e:
             messagebox.showerror("エラー", f"Timestamp列の変換に失敗しました: {e}")
             return
+        # 記録されたイベント（無ければ推定したイベント）をタイムスタンプ設定にする
+        self.timestamp_settings = make_timestamp_settings(run_timestamps(file_path, self.data))
+        self.pyramids = load_or_build_pyramids(file_path, self.data)
+        self.plot_graphs()
+
+    def load_archive_data(self, file_path, t0=None, t1=None):
+        """測定アーカイブを読み込み、記録された（無ければ推定した）イベントをタイムスタンプ設定にして描画する。"""
+        try:
+            self.data, events = load_archive(file_path, t0, t1)
+        except Exception as e:
+            messagebox.showerror("エラー", f"アーカイブの読み込みに失敗しました: {e}")
+            return
+        if self.data.empty:
+            messagebox.showwarning("警告", "指定した範囲にデータがありません。")
+            return
+        self.timestamp_settings = make_timestamp_settings(run_timestamps(file_path, self.data, events))
+        windowed = t0 is not None or t1 is not None
+        if windowed:
+            # 範囲の先頭を (指定秒から) タブの開始位置にする
+            self.vacuum_offset = self.temp_offset = float(t0 or 0.0)
+        self.pyramids = load_or_build_pyramids(file_path, self.data, cache=not windowed)
         self.plot_graphs()
 
+    def open_archive_window(self):
+        """測定アーカイブを時間範囲（測定開始からの秒）を指定して開く。"""
+        file_path = filedialog.askopenfilename(filetypes=[("測定アーカイブ", "*.vdrun")])
+        if not file_path:
+            return
+        win = Toplevel(self)
+        win.title("アーカイブの範囲")
+        win.geometry("300x150")
+        Label(win, text="開始秒数（空欄で先頭から）:").grid(row=0, column=0, padx=10, pady=5, sticky="w")
+        start_entry = Entry(win)
+        start_entry.grid(row=0, column=1, padx=10, pady=5)
+        Label(win, text="終了秒数（空欄で最後まで）:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
+        end_entry = Entry(win)
+        end_entry.grid(row=1, column=1, padx=10, pady=5)
+        def open_range():
+            try:
+                t0 = float(start_entry.get()) if start_entry.get().strip() else None
+                t1 = float(end_entry.get()) if end_entry.get().strip() else None
+            except ValueError:
+                messagebox.showerror("入力エラー", "秒数は数値で入力してください。")
+                return
+            win.destroy()
+            self.stop_follow()
+            self.load_archive_data(file_path, t0, t1)
+        ctk.CTkButton(win, text="開く", command=open_range,
+                      fg_color="#4CAF50", hover_color="#388E3C").grid(row=2, column=0, columnspan=2, pady=10)
+
+    def toggle_follow(self):
+        """追従モードの開始／停止を切り替える。"""
+        if self.follow_path is not None:
+            self.stop_follow()
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("測定ログ", "*.csv")],
+                                               initialdir=LIVE_LOG_DIR if os.path.isdir(LIVE_LOG_DIR) else None)
+        if not file_path:
+            return
+        self.stop_follow()
+        self.follow_path = file_path
+        self.follow_offset = 0
+        self.follow_header = None
+        self.follow_t0 = None
+        self.follow_buffer = None
+        self.pyramids = None
+        self.pyramid_lines = []
+        self.redraw_needed = True
+        self.follow_button.configure(text="追従停止")
+        self.poll_follow()
+
+    def toggle_feed_follow(self):
+        """同じPCで測定中の MeasurementApp の共有メモリ配信を購読する（追従モードと同じ描画経路を使う）。"""
+        if self.follow_feed is not None:
+            self.stop_follow()
+            return
+        self.stop_follow()
+        try:
+            self.follow_feed = LiveFeedReader()
+        except (FileNotFoundError, ValueError) as e:
+            messagebox.showerror("エラー", f"共有メモリ配信が見つかりません（測定中か確認してください）: {e}")
+            return
+        self.follow_feed_count = 0
+        self.follow_buffer = FollowBuffer(["Elapsed"] + self.follow_feed.channels)
+        self.pyramids = None
+        self.pyramid_lines = []
+        self.redraw_needed = True
+        self.feed_button.configure(text="購読停止")
+        self.poll_follow()
+
+    def read_feed_rows(self):
+        """共有メモリから前回以降のサンプルを読み、記録されたイベントをタイムスタンプ設定に反映する。"""
+        rows, self.follow_feed_count = self.follow_feed.read_since(self.follow_feed_count)
+        self.apply_follow_events(self.follow_feed.read_events())
+        return rows
+
+    def apply_follow_events(self, events):
+        """追従中に記録されたイベント（経過秒）をタイムスタンプ設定に反映する。"""
+        for t, label, _ in events:
+            if label in self.timestamp_settings and self.timestamp_settings[label]["time"] != t:
+                self.timestamp_settings[label]["time"] = t
+                # マーカーを描き直すため、次の描画は全体を描き直す
+                self.redraw_needed = True
+
+    def stop_follow(self):
+        if self.follow_job is not None:
+            self.after_cancel(self.follow_job)
+            self.follow_job = None
+        if self.follow_buffer is not None:
+            self.data = self.follow_buffer.to_dataframe()
+        if self.follow_feed is not None:
+            self.follow_feed.close()
+            self.follow_feed = None
+        self.follow_path = None
+        self.follow_buffer = None
+        self.follow_button.configure(text="追従モード")
+        self.feed_button.configure(text="共有メモリ購読")
+
+    def read_follow_rows(self):
+        """
+        前回読んだ位置から後ろに追記されたバイトだけを読み、完結した行を数値の行に変換して返す。
+        書き込み途中の最終行は次回に回す。
+        """
+        with open(self.follow_path, "rb") as f:
+            f.seek(self.follow_offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return []
+        text = chunk[:end + 1].decode("utf-8-sig" if self.follow_offset == 0 else "utf-8", errors="replace")
+        self.follow_offset += end + 1
+        rows = []
+        for record in csv.reader(io.StringIO(text)):
+            if not record:
+                continue
+            if self.follow_header is None:
+                self.follow_header = record
+                channels = [c for c in CHANNEL_COLUMNS if c in record]
+                self.follow_buffer = FollowBuffer(["Elapsed"] + channels
+                                                  + [c + ELAPSED_SUFFIX for c in channels if c + TIME_SUFFIX in record])
+                continue
+            values = dict(zip(self.follow_header, record))
+            try:
+                if "Epoch" in values:
+                    t = float(values["Epoch"])
+                else:
+                    t = datetime.strptime(values["Timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (KeyError, ValueError):
+                continue
+            if self.follow_t0 is None:
+                self.follow_t0 = t
+            row = [t - self.follow_t0]
+            for c in self.follow_buffer.columns[1:]:
+                if c.endswith(ELAPSED_SUFFIX):
+                    try:
+                        row.append(float(values[c[:-len(ELAPSED_SUFFIX)] + TIME_SUFFIX]) - self.follow_t0)
+                    except (KeyError, ValueError):
+                        row.append(row[0])
+                    continue
+                try:
+                    row.append(float(values[c]))
+                except (KeyError, ValueError):
+                    row.append(float("nan"))
+            rows.append(row)
+        if self.follow_t0 is not None:
+            # 測定ログのサイドカーに記録されたイベント
+            recorded = read_events(self.follow_path) or []
+            self.apply_follow_events([(t - self.follow_t0, label, color) for t, label, color in recorded])
+        return rows
+
+    def poll_follow(self):
+        if self.follow_path is None and self.follow_feed is None:
+            return
+        try:
+            rows = self.read_feed_rows() if self.follow_feed is not None else self.read_follow_rows()
+        except (OSError, TimeoutError) as e:
+            print(f"追従モード 読み込みエラー: {e}")
+            rows = []
+        if len(rows):
+            self.follow_buffer.append_rows(rows)
+            # 描き直しが必要なときだけ全体を描画し、それ以外は線のデータだけを差し替える（追記分に比例する処理）
+            if self.redraw_needed or self.offset_graph_reached():
+                self.plot_graphs()
+            else:
+                self.update_follow_lines()
+        self.follow_job = self.after(FOLLOW_INTERVAL_MS, self.poll_follow)
+
+    def offset_graph_reached(self):
+        """線の無い「指定秒から」のグラフに、追従中のデータが指定秒に達して線が描けるようになったら True。"""
+        columns = self.follow_buffer.columns
+        last = self.follow_buffer.column("Elapsed")[-1]
+        drawn = {ax for ax, *_ in self.pyramid_lines}
+        graphs = [((self.vac_off_ax,), self.vacuum_offset, "電離真空計" in columns),
+                  ((self.temp_off_ax, self.temp_off_ax2), self.temp_offset,
+                   "熱電対" in columns or "ヒーター電圧" in columns)]
+        return any(axes[0] is not None and drawable and last >= offset and not drawn.intersection(axes)
+                   for axes, offset, drawable in graphs)
+
+    def update_follow_lines(self):
+        """追従モードで、既存の線に追記後のデータを設定して再描画する（軸やタイムスタンプは描き直さない）。"""
+        figures = set()
+        for ax, line, column, offset in self.pyramid_lines:
+            elapsed = self.follow_buffer.column(elapsed_column(self.follow_buffer, column))
+            start = np.searchsorted(elapsed, offset)
+            line.set_data(elapsed[start:] - offset, self.follow_buffer.column(column)[start:])
+            ax.set_xlim(0, max(elapsed[-1] - offset, 1))
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+            figures.add(ax.figure)
+        for fig in figures:
+            fig.canvas.draw_idle()
+
     def plot_graphs(self):
-        # --- 真空度タブ（常に全データを表示） ---
-        vac_ax = self.vac_ax
-        vac_ax.clear()
-        if "Elapsed" in self.data.columns and "電離真空計" in self.data.columns:
-            vac_ax.semilogy(self.data["Elapsed"], self.data["電離真空計"],
-                            marker='o', linestyle='-', label="Ion Gauge")
-            # すべてのタイムスタンプ（4つ）を表示
-            for label_text, setting in self.timestamp_settings.items():
-                t_val = setting["time"]
-                color = setting["color"]
-                if t_val is not None:
-                    vac_ax.axvline(x=t_val, color=color, linestyle='--', alpha=0.7)
-                    y_max = self.data["電離真空計"].max() if not self.data["電離真空計"].empty else 1
-                    vac_ax.text(t_val, y_max, label_text, rotation=45, fontsize=9, color=color)
-        vac_ax.set_xlabel("Time [s]")
-        vac_ax.set_xlim(left=0)
-        vac_ax.set_ylabel("Vacuum [Pa]")
-        vac_ax.set_title("degree of vacuum")
-        vac_ax.legend()
-        vac_ax.figure.tight_layout()
-        self.vac_canvas.draw()
-
-        # --- 温度＆電圧タブ（基礎データ全体、全4タイムスタンプ表示） ---
-        temp_ax = self.temp_ax
-        temp_ax2 = self.temp_ax2
-        temp_ax.clear()
-        temp_ax2.clear()
-        if "Elapsed" in self.data.columns and "熱電対" in self.data.columns:
-            temp_ax.plot(self.data["Elapsed"], self.data["熱電対"], 'r-', marker='o', label="Temperature [℃]")
-            temp_ax.axhline(200, color='red', linestyle='--', linewidth=2, label="Target 200℃")
-        if "Elapsed" in self.data.columns and "ヒーター電圧" in self.data.columns:
-            temp_ax2.plot(self.data["Elapsed"], self.data["ヒーター電圧"], 'b-', marker='x', label="Voltage [V]")
-        # すべてのタイムスタンプ表示
-        for label_text, setting in self.timestamp_settings.items():
-            t_val = setting["time"]
-            color = setting["color"]
-            if t_val is not None:
-                temp_ax.axvline(x=t_val, color=color, linestyle='--', alpha=0.7)
-                # y座標は温度軸の上部（例:380℃）
-                temp_ax.text(t_val, 380, label_text, rotation=45, fontsize=9, color=color)
-        temp_ax.set_xlabel("Time [s]")
-        temp_ax.set_xlim(left=0)
-        temp_ax.set_ylabel("Temperature [℃]", color='r')
-        temp_ax.set_ylim(0, 400)
-        temp_ax.set_yticks(range(0, 401, 50))
-        temp_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
-        temp_ax2.set_ylim(0, 50)
-        temp_ax2.set_yticks(range(0, 51, 5))
-        temp_ax2.yaxis.set_label_position("right")
-        temp_ax2.yaxis.tick_right()
-        temp_ax.legend(loc="upper left")
-        temp_ax2.legend(loc="upper right")
-        temp_ax.set_title("Temperature and Voltage")
-        temp_ax.figure.tight_layout()
-        self.temp_canvas.draw()
-
-        # --- 追加タブ：真空度 (指定秒から)  ---
-        vac_off_ax = self.vac_off_ax
-        vac_off_ax.clear()
-        if "Elapsed" in self.data.columns and "電離真空計" in self.data.columns:
-            # 指定秒以降のデータを抽出し、オフセットを引いて調整
-            df_vac = self.data[self.data["Elapsed"] >= self.vacuum_offset].copy()
-            if not df_vac.empty:
-                df_vac["Adjusted"] = df_vac["Elapsed"] - self.vacuum_offset
-                vac_off_ax.semilogy(df_vac["Adjusted"], df_vac["電離真空計"],
-                                    marker='o', linestyle='-', label="ionization vacuum gauge")
-                # タイムスタンプは "start vapor deposition" と "end vapor deposition" のみ表示
-                for label_text, setting in self.timestamp_settings.items():
-                    if label_text in ["start vapor deposition", "end vapor deposition"]:
-                        t_val = setting["time"]
-                        color = setting["color"]
-                        if t_val is not None and t_val >= self.vacuum_offset:
-                            # 調整したx値
-                            vac_off_ax.axvline(x=t_val - self.vacuum_offset, color=color, linestyle='--', alpha=0.7)
-                            y_max = df_vac["電離真空計"].max() if not df_vac["電離真空計"].empty else 1
-                            vac_off_ax.text(t_val - self.vacuum_offset, y_max, label_text, rotation=45, fontsize=9, color=color)
-        vac_off_ax.set_xlabel("Time [s]")
-        vac_off_ax.set_xlim(left=0)
-        vac_off_ax.set_ylabel("Vacuum [Pa]")
-        vac_off_ax.set_title("degree of vacuum")
-        vac_off_ax.legend()
-        vac_off_ax.figure.tight_layout()
-        self.vac_off_canvas.draw()
-
-        # --- 追加タブ：温度＆電圧 (指定秒から) ---
-        temp_off_ax = self.temp_off_ax
-        temp_off_ax2 = self.temp_off_ax2
-        temp_off_ax.clear()
-        temp_off_ax2.clear()
-        if "Elapsed" in self.data.columns and "熱電対" in self.data.columns:
-            df_temp = self.data[self.data["Elapsed"] >= self.temp_offset].copy()
-            if not df_temp.empty:
-                df_temp["Adjusted"] = df_temp["Elapsed"] - self.temp_offset
-                temp_off_ax.plot(df_temp["Adjusted"], df_temp["熱電対"],
-                                'r-', marker='o', label="Temperature [℃]")
-                temp_off_ax.axhline(200, color='red', linestyle='--', linewidth=2, label="Target 200℃")
-                # タイムスタンプは "start vapor deposition" と "end vapor deposition" のみ表示
-                for label_text, setting in self.timestamp_settings.items():
-                    if label_text in ["start vapor deposition", "end vapor deposition"]:
-                        t_val = setting["time"]
-                        color = setting["color"]
-                        if t_val is not None and t_val >= self.temp_offset:
-                            temp_off_ax.axvline(x=t_val - self.temp_offset, color=color, linestyle='--', alpha=0.7)
-                            temp_off_ax.text(t_val - self.temp_offset, 380, label_text, rotation=45, fontsize=9, color=color)
-        if "Elapsed" in self.data.columns and "ヒーター電圧" in self.data.columns:
-            df_volt = self.data[self.data["Elapsed"] >= self.temp_offset].copy()
-            if not df_volt.empty:
-                df_volt["Adjusted"] = df_volt["Elapsed"] - self.temp_offset
-                temp_off_ax2.plot(df_volt["Adjusted"], df_volt["ヒーター電圧"],
-                                'b-', marker='x', label="Voltage [V]")
-        temp_off_ax.set_xlabel("Time [s]")
-        temp_off_ax.set_xlim(left=0)
-        temp_off_ax.set_ylabel("Temperature [℃]", color='r')
-        temp_off_ax.set_ylim(0, 400)
-        temp_off_ax.set_yticks(range(0, 401, 50))
-        temp_off_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
-        temp_off_ax2.set_ylim(0, 50)
-        temp_off_ax2.set_yticks(range(0, 51, 5))
-        temp_off_ax2.yaxis.set_label_position("right")
-        temp_off_ax2.yaxis.tick_right()
-        temp_off_ax.legend(loc="upper left")
-        temp_off_ax2.legend(loc="upper right")
-        temp_off_ax.set_title("Temperature and Voltage")
-        temp_off_ax.figure.tight_layout()
-        self.temp_off_canvas.draw()
+        if self.follow_buffer is not None:
+            self.data = self.follow_buffer.to_dataframe()
+        axes = {"vac": self.vac_ax, "temp": self.temp_ax, "temp2": self.temp_ax2,
+                "vac_off": self.vac_off_ax, "temp_off": self.temp_off_ax, "temp_off2": self.temp_off_ax2}
+        # 作成済みのグラフだけを描画する（未表示のタブは create_figure() で作成したときに描く）
+        self.pyramid_lines = draw_graphs(self.data, self.timestamp_settings, self.vacuum_offset,
+                                         self.temp_offset, axes, self.pyramids)
+        self.redraw_needed = False
+        # clear() で登録が消えるため、描画のたびにズーム・パンの通知を登録し直す
+        for ax in axes.values():
+            if ax is not None:
+                ax.callbacks.connect("xlim_changed", self.on_xlim_changed)
+        for canvas in (self.vac_canvas, self.temp_canvas, self.vac_off_canvas, self.temp_off_canvas):
+            if canvas is not None:
+                canvas.draw()
+
+    def on_xlim_changed(self, changed_ax):
+        """ズーム・パンで表示範囲が変わったら、同じ図の系列を範囲と横幅に合ったピラミッドの段に差し替える。"""
+        if not self.pyramids:
+            return
+        for ax, line, column, offset in self.pyramid_lines:
+            if ax.figure is not changed_ax.figure or column not in self.pyramids:
+                continue
+            x0, x1 = ax.get_xlim()
+            x, y = self.pyramids[column].select(x0 + offset, x1 + offset, ax.bbox.width)
+            line.set_data(x - offset, y)
+        changed_ax.figure.canvas.draw_idle()
 
     def save_png_images(self):
+        """4つのグラフを画像（PNG / SVG / PDF）で保存する。保存はワーカープロセスで行い、GUI は止めない。"""
         filename = filedialog.asksaveasfilename(defaultextension=".png",
-                                                filetypes=[("PNG Files", "*.png")],
+                                                filetypes=EXPORT_FILETYPES,
                                                 title="グラフ画像の保存ファイル名を指定してください")
         if filename:
-            import os
             base, ext = os.path.splitext(filename)
             try:
-                self.vac_fig.savefig(base + "_vac" + ext)
-                self.temp_fig.savefig(base + "_temp" + ext)
-                self.vac_off_fig.savefig(base + "_vac_offset" + ext)
-                self.temp_off_fig.savefig(base + "_temp_offset" + ext)
-                messagebox.showinfo("保存完了", "グラフ画像が保存されました。")
+                # まだ表示していないタブのグラフもここで作成する
+                for tab_name in GRAPH_TABS:
+                    self.create_figure(tab_name)
+                figs = [self.vac_fig, self.temp_fig, self.vac_off_fig, self.temp_off_fig]
+                pending = bool(self.exporter)
+                self.exporter.submit({base + suffix + ext: fig for fig, suffix in zip(figs, GRAPH_SUFFIXES)}, "グラフ保存")
+                if not pending:
+                    self.after(200, self.poll_exports)
             except Exception as e:
                 messagebox.showerror("保存エラー", f"グラフ画像の保存中にエラーが発生しました: {e}")
 
-if __name__ == "__main__":
+    def poll_exports(self):
+        """ワーカーでの保存が終わったら結果を表示する。"""
+        for _, paths, errors in self.exporter.finished():
+            if errors:
+                messagebox.showerror("保存エラー", f"グラフ画像の保存中にエラーが発生しました: {errors[0][1]}")
+            else:
+                messagebox.showinfo("保存完了", "グラフ画像が保存されました。")
+        if self.exporter:
+            self.after(200, self.poll_exports)
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel Graph Viewer")
+    parser.add_argument("--batch", metavar="DIR", help="フォルダ内の全測定ファイルのグラフ画像をGUIなしで一括生成する")
+    parser.add_argument("--out", metavar="DIR", help="一括生成時の出力フォルダ（省略時は入力フォルダ）")
+    parser.add_argument("--workers", type=int, default=None, help="一括生成時のプロセス数")
+    parser.add_argument("--force", action="store_true", help="最新の画像も含めてすべて再生成する")
+    args = parser.parse_args()
+    if args.batch:
+        batch_report(args.batch, args.out, args.workers, args.force)
+        return
     app = ExcelGraphViewer()
     app.mainloop()
+
+if __name__ == "__main__":
+    main()
+
@@ -1,158 +1,55 @@
+import startup_profile  # 起動時間の計測（最初に import する）
 import threading
 import time
-import re
-import asyncio
-import discord  #discord_bot
-from discord.ext import commands #discord_bot
+import os
 from datetime import datetime  # 時刻
 import customtkinter as ctk  # UI
-import pandas as pd  # Excel保存
-from playsound import playsound  # MP3再生
 from tkinter import messagebox, filedialog
-import serial  # シリアル通信ライブラリ
+# 測定の本体（機器・補正・記録・アラーム・通知）。GUI はその表示と操作だけを行う
+from acquisition import (AcquisitionService, analytics_text, start_discord_bot, start_server_loop,
+                         send_discord_notification)
+from control_api import ControlServer, ControlClient, ControlError, RemoteChamber, CONTROL_HOST, CONTROL_PORT
+from replay import parse_speed  # 記録した測定のリプレイ
+from retention import nearest  # グラフ上のイベントマーカーの位置
+from frame_profiler import FrameProfiler  # 描画ループのプロファイル（F12 で切り替え）
+from figure_export import FigureExporter, EXPORT_FILETYPES, SNAPSHOT_INTERVAL_MIN, snapshot_paths  # グラフ画像の書き出し
+# matplotlib は起動を速くするため、グラフを作成するとき（create_figure）に import する
+startup_profile.mark("import")
 
-# Matplotlib関連
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-# ----- Discord Bot の設定 -----
-# Bot のプレフィックスは "!" に設定（任意）
-intents = discord.Intents.default()
-discord_bot = commands.Bot(command_prefix="!", intents=intents)
-bot_loop = None
+# グラフのタブと、画像を保存するときのファイル名サフィックス
+GRAPH_SUFFIXES = {"真空度": "_all_ion", "電離真空計": "_ion", "温度＆電圧": "_temp"}
 
-# 通知を送信するチャンネルID
-# 自身が使用するbotを入れたサーバーのメッセージチャットのチャンネルID
-CHANNEL_ID = 1234567890123456789
 
-
-# グローバル変数
-data = []  # Excel保存用の測定データリスト
-EXCEL_FILE = None  # 保存ファイル名
-
-def send_command(ser, command):
+class ChamberView(ctk.CTkFrame):
     """
-    シリアル通信でコマンドを送信し、応答を取得する。
+    1つのチャンバーの操作ボタン・グラフ・ログ表示。
+    chamber は同じプロセスの acquisition.Chamber か、デーモンにつないだ control_api.RemoteChamber。
     """
-    ser.write((command + "\r").encode("ascii"))
-    print(f"送信: {command}")
-    time.sleep(0.5)
-    response = ser.readline().decode("ascii").strip()
-    print(f"受信: {response}")
-    return response
-
-def alarm_sound(n):
-    """アラーム音をn回鳴らす"""
-    for _ in range(n):
-        playsound("alarm.mp3")
-        time.sleep(0.5)
-
-@discord_bot.event
-async def on_ready():
-    global bot_loop
-    bot_loop = discord_bot.loop
-    print(f"Discord Bot: Logged in as {discord_bot.user}")
-
-async def send_message(message):
-    channel = discord_bot.get_channel(CHANNEL_ID)
-    if channel:
-        await channel.send(message)
-    else:
-        print("Discord Bot: 指定したチャンネルが見つかりません")
-
-def start_discord_bot():
-    # Bot を実行
-    discord_bot.run("MTM0NDI4NDcyNjc3MjQ5ODQ5NA.GrZpSQ.MInm6ETryrm9Pcl8kN3GYvflED2-oGhFd_PPZU") # 自身が作成したbotのトークンを記入
-
-def send_discord_notification(message):
-    try:
-        # メッセージをUTF-8エンコード→デコードして、エラーがあれば置換する
-        message = message.encode('utf-8', errors='replace').decode('utf-8')
-        future = asyncio.run_coroutine_threadsafe(send_message(message), bot_loop)
-        future.result(timeout=5)
-    except Exception as e:
-        print("Discord通知エラー:", e)
 
+    def __init__(self, master, app, chamber):
+        super().__init__(master)
+        self.app = app
+        self.chamber = chamber
+        self.name = chamber.name
+        self.excel_file = None
+        # 測定の開始・終了を行っているスレッド
+        self.action_thread = None
 
-
-class MeasurementApp(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        self.title("測定データ収集システム")
-        self.geometry("1200x700")
-        
-        # 各センサのCOMポート設定
-        self.com_port1 = "COM15"    # ピラニ1[Pa]
-        self.com_port2 = "COM13"    # ピラニ2[Pa]
-        self.com_port3 = "COM16"    # 電離真空計[Pa]
-        self.com_port4 = "COM14"   # 熱電対
-        self.com_port5 = "COM12"   # ヒーター電圧
-
-        self.record_interval = 10  # 記録間隔（秒）
-        self.original_record_interval = 10
-        self.room_temperature = 26.7  # 初期室温（℃）
-        self.measurement_running = False
-
-        # 温度通知閾値（設定可能）
-        self.target_temperature = 200  # 目標温度
-        self.danger_temperature = 250  # 危険温度
-        self.limit_temperature  = 300  # 限界温度
-
-        # 測定データ保持用リスト（測定開始からの経過秒）
-        self.time_data = []         # [s]
-        self.pirani1_data = []      # ピラニ1 [Pa]
-        self.pirani2_data = []      # ピラニ2 [Pa]
-        self.ion_data = []          # 電離真空計 [Pa]
-        self.thermocouple_data = [] # 熱電対（温度, ℃）
-        self.heater_data = []       # ヒーター電圧 [V]
-        self.ion_data2 = []         # 基板温度測定開始語の電離真空計 [Pa]
-
-        # イベントマーカーリスト（タプル: (記録時刻, "イベント名", "色")）
-        self.event_markers = []
-
-        # 各センサ用シリアル接続
-        self.pirani1_ser = None
-        self.pirani2_ser = None
-        self.ion_ser = None
-        self.thermocouple_ser = None
-        self.heater_ser = None
-
-        # ログウィンドウ用
+        # ログウィンドウ用（log_count は表示済みの行数）
         self.log_window = None
         self.log_textbox = None
+        self.log_count = 0
 
-        # 内部フラグ
-        self.show_substrate_graphs = False  # 基板温度測定開始後に表示するグラフ群
-        self.vapor_events = []              # 蒸着開始／終了の目印用 (time, color)
-
-        # アラーム通知用状態
-        self.notif_200_triggered = False
-        self.notif_250_triggered = False
-        self.last_300_notif_time = None
-        self.ion_notify_heater = False  # ヒーター起動可能通知
-        self.ion_notify_vapor = False   # 蒸着可能通知
-        self.volt_ten = False
-
-        self.heater_increase_flag = {10: False, 20: False, 30: False, 40: False}
-        self.heater_increase_timestamp = {10: None, 20: None, 30: None, 40: None}
-        # ヒーター電圧下げ通知用：基板温度測定終了後に、当日の最大値からの下がりを管理
-        self.basis_ended = False
-        self.last_decrease_notif_voltage = None
-        self.last_decrease_notif_timestamp = None
+        # グラフの更新判定用：各グラフは描いた時点の chamber.data_version を覚える
+        self.drawn_versions = {}
+        # イベントマーカーごとの自動スナップショット用（スナップショットを撮った時点のマーカー数）
+        self.snapshot_markers = len(chamber.event_markers)
+        chamber.on_replay_finished = self.on_replay_finished
 
         self.create_layout()
-        self.update_current_time()
-        self.update_graphs()
 
     def create_layout(self):
-        # ヘッダー領域（上部）
-        self.header_frame = ctk.CTkFrame(self, height=20)
-        self.header_frame.pack(side="top", fill="x")
-        self.current_time_label = ctk.CTkLabel(self.header_frame, text="", font=("Arial", 14))
-        self.current_time_label.pack(side="right", padx=10, pady=5)
-        # 通知テスト用ボタン
-        ctk.CTkButton(self.header_frame, text="通知テスト", command=lambda: send_discord_notification("テスト通知です"), fg_color="#7289DA", hover_color="#304FB5").pack(side="left",pady=5,padx=10)
-
         # コンテンツ領域
         self.content_frame = ctk.CTkFrame(self)
         self.content_frame.pack(side="top", fill="both", expand=True)
@@ -170,12 +67,13 @@ class MeasurementApp(ctk.CTk):
         ctk.CTkButton(self.left_frame, text="Excel保存", command=self.date_keep, fg_color="#FFDD00", hover_color="#CCB000", text_color="black").pack(pady=10)
         ctk.CTkButton(self.left_frame, text="グラフ保存", command=self.save_graph_images, fg_color="#FFDD00", hover_color="#CCB000", text_color="black").pack(pady=10)
         ctk.CTkButton(self.left_frame, text="ログ表示", command=self.open_log_window).pack(pady=10)
+        ctk.CTkButton(self.left_frame, text="リプレイ", command=self.open_replay_window).pack(pady=10)
         ctk.CTkButton(self.left_frame, text="設定", command=self.open_settings_window, fg_color="#464646", hover_color="#2B2B2B").pack(pady=10)
-        # 終了ボタン（赤色）を一番下に配置
+        # 終了ボタン（赤色）を一番下に配置（デーモンにつないでいるときは GUI だけが終了し、測定は続く）
         exit_button = ctk.CTkButton(self.left_frame, text="終了", command=self.quit, fg_color="red", hover_color="darkred")
         exit_button.pack(side="bottom", pady=10)
 
-        self.room_temp_label = ctk.CTkLabel(self.left_frame, text=f"現在の室温: {self.room_temperature}℃", font=("Arial", 12))
+        self.room_temp_label = ctk.CTkLabel(self.left_frame, text=f"現在の室温: {self.chamber.room_temperature}℃", font=("Arial", 12))
         self.room_temp_label.pack(pady=10)
 
         # 右側：グラフ表示エリア（タブ付き、３タブ）
@@ -183,483 +81,332 @@ class MeasurementApp(ctk.CTk):
         self.right_frame.pack(side="right", expand=True, fill="both", padx=10, pady=10)
         self.graph_tabview = ctk.CTkTabview(self.right_frame, width=800, height=300)
         self.graph_tabview.pack(fill="both", expand=True)
-        self.graph_tabview.add("真空度")        
+        self.graph_tabview.add("真空度")
         self.graph_tabview.add("電離真空計")
         self.graph_tabview.add("温度＆電圧")
 
-        # 真空度グラフ（常に電離真空計のデータを表示）
-        self.vac_fig, self.vac_ax = plt.subplots(figsize=(5,3))
-        self.vac_canvas = FigureCanvasTkAgg(self.vac_fig, master=self.graph_tabview.tab("真空度"))
-        self.vac_canvas.get_tk_widget().pack(fill="both", expand=True)
-
-        # 電離真空計グラフ（対数表示）
-        self.ion_fig, self.ion_ax = plt.subplots(figsize=(5,3))
-        self.ion_canvas = FigureCanvasTkAgg(self.ion_fig, master=self.graph_tabview.tab("電離真空計"))
-        self.ion_canvas.get_tk_widget().pack(fill="both", expand=True)
-
-        # 温度＆電圧グラフ（双軸）
-        self.temp_fig, self.temp_ax = plt.subplots(figsize=(5,3))
-        self.temp_ax2 = self.temp_ax.twinx()
-        self.temp_canvas = FigureCanvasTkAgg(self.temp_fig, master=self.graph_tabview.tab("温度＆電圧"))
-        self.temp_canvas.get_tk_widget().pack(fill="both", expand=True)
-
-    def update_current_time(self):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.current_time_label.configure(text=current_time)
-        self.after(1000, self.update_current_time)
-
-    def append_log_line(self, message):
-        if self.log_textbox is not None:
-            self.log_textbox.insert("end", message + "\n")
-            self.log_textbox.see("end")
-
-    def update_graphs(self):
+        # グラフはタブを初めて表示したときに create_figure() で作成する
+        self.graph_tabview.configure(command=self.on_tab_changed)
+        self.vac_fig = self.vac_ax = self.vac_canvas = None
+        self.ion_fig = self.ion_ax = self.ion_canvas = None
+        self.temp_fig = self.temp_ax = self.temp_ax2 = self.temp_canvas = None
+
+    def on_tab_changed(self):
+        self.create_figure(self.graph_tabview.get())
+        self.refresh_graphs()
+
+    def create_figure(self, tab_name):
+        """指定したタブのグラフを作成する（作成済みなら何もしない）。matplotlib もここで初めて import する。"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        if tab_name == "真空度" and self.vac_fig is None:
+            # 真空度グラフ（常に電離真空計のデータを表示）
+            self.vac_fig = Figure(figsize=(5,3))
+            self.vac_ax = self.vac_fig.subplots()
+            self.vac_canvas = FigureCanvasTkAgg(self.vac_fig, master=self.graph_tabview.tab("真空度"))
+            self.vac_canvas.get_tk_widget().pack(fill="both", expand=True)
+            self.draw_vac_graph()
+            self.drawn_versions["真空度"] = self.chamber.data_version
+        elif tab_name == "電離真空計" and self.ion_fig is None:
+            # 電離真空計グラフ（対数表示）
+            self.ion_fig = Figure(figsize=(5,3))
+            self.ion_ax = self.ion_fig.subplots()
+            self.ion_canvas = FigureCanvasTkAgg(self.ion_fig, master=self.graph_tabview.tab("電離真空計"))
+            self.ion_canvas.get_tk_widget().pack(fill="both", expand=True)
+            self.draw_ion_graph()
+            self.drawn_versions["電離真空計"] = self.chamber.data_version
+        elif tab_name == "温度＆電圧" and self.temp_fig is None:
+            # 温度＆電圧グラフ（双軸）
+            self.temp_fig = Figure(figsize=(5,3))
+            self.temp_ax = self.temp_fig.subplots()
+            self.temp_ax2 = self.temp_ax.twinx()
+            self.temp_canvas = FigureCanvasTkAgg(self.temp_fig, master=self.graph_tabview.tab("温度＆電圧"))
+            self.temp_canvas.get_tk_widget().pack(fill="both", expand=True)
+            self.draw_temp_graph()
+            self.drawn_versions["温度＆電圧"] = self.chamber.data_version
+
+    def refresh(self):
+        """デーモンにつないでいれば最新の状態を取得し、表示中のグラフとログウィンドウを更新する。"""
+        profiler = self.app.profiler
+        poll = getattr(self.chamber, "poll", None)
+        if poll is not None:
+            with profiler.section("poll"):
+                poll()
+        self.refresh_graphs()
+        with profiler.section("log"):
+            self.refresh_log()
+
+    def refresh_graphs(self):
+        """
+        表示中のタブのグラフを、前回描いた後にデータが変わっていれば描き直す。
+        MeasurementApp が表示中のチャンバーについてだけ毎秒呼ぶ（隠れているグラフはタブを開いたときに描く）。
+        """
+        tab_name = self.graph_tabview.get()
+        draw = {"真空度": (self.vac_fig, self.draw_vac_graph),
+                "電離真空計": (self.ion_fig, self.draw_ion_graph),
+                "温度＆電圧": (self.temp_fig, self.draw_temp_graph)}
+        fig, draw_graph = draw[tab_name]
+        version = self.chamber.data_version
+        if fig is None or self.drawn_versions.get(tab_name) == version:
+            return
+        started = time.perf_counter()
+        draw_graph()
+        self.drawn_versions[tab_name] = version
+        replay = self.chamber.replay
+        if replay is not None:
+            replay.report.redraw_seconds.append(time.perf_counter() - started)
+
+    def draw_vac_graph(self, render=True):
         # --- 真空度タブ（常に電離真空計のデータを表示） ---
-        self.vac_ax.clear()
-        if self.time_data and self.ion_data:
-            self.vac_ax.semilogy(self.time_data, self.ion_data, marker='o', linestyle='-', label="Ion Gauge")
-        self.vac_ax.set_xlabel("Time [s]")
-        self.vac_ax.set_ylabel("Vacuum [Pa]")
-        self.vac_ax.set_title("degree of vacuum")
-        # プロットしたグラフにイベントマーカーを追加
-        for t, label, color in self.event_markers:
-            if t <= self.time_data[-1]:
-                self.vac_ax.plot(t, self.ion_data[self.time_data.index(t)] if t in self.time_data else 1e-6,
-                                 marker='D', color=color, markersize=8)
-                self.vac_ax.annotate(label, (t, self.ion_data[self.time_data.index(t)] if t in self.time_data else 1e-6),
-                                     textcoords="offset points", xytext=(0,10), ha='center')
-        self.vac_ax.legend()
-        self.vac_fig.tight_layout()
-        self.vac_canvas.draw()
+        c = self.chamber
+        profiler = self.app.profiler
+        with profiler.section("真空度 clear"):
+            self.vac_ax.clear()
+        with profiler.section("真空度 plot"):
+            times, ion = self.plot_history(self.vac_ax, c.vacuum_history, "電離真空計", "-", "Ion Gauge", log=True, marker='o')
+            self.vac_ax.set_xlabel("Time [s]")
+            self.vac_ax.set_ylabel("Vacuum [Pa]")
+            self.vac_ax.set_title("degree of vacuum")
+            # プロットしたグラフにイベントマーカーを追加
+            for t, label, color in c.event_markers:
+                if times and t <= times[-1]:
+                    y = nearest(times, ion, t, 1e-6)
+                    self.vac_ax.plot(t, y, marker='D', color=color, markersize=8)
+                    self.vac_ax.annotate(label, (t, y), textcoords="offset points", xytext=(0,10), ha='center')
+            if c.analytics_state:
+                self.vac_ax.text(0.02, 0.02, analytics_text(c.analytics_state, c.target_temperature),
+                                 transform=self.vac_ax.transAxes, fontsize=8,
+                                 va="bottom", bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
+            self.vac_ax.legend()
+        if not render:
+            return
+        with profiler.section("真空度 tight_layout"):
+            self.vac_fig.tight_layout()
+        with profiler.section("真空度 draw"):
+            self.vac_canvas.draw()
 
+    def draw_ion_graph(self, render=True):
         # 電離真空計グラフ（基板温度測定開始後のみ）
-        if self.show_substrate_graphs:
-            self.ion_ax.clear()
-            if self.ion_data2:
-                # 直近の self.ion_data の個数に合わせた x 軸部分を使用
-                x = self.time_data[-len(self.ion_data2):]
-                self.ion_ax.semilogy(x, self.ion_data2, marker='o', linestyle='-', label="ionization vacuum gauge")
-        self.ion_ax.set_xlabel("Time [s]")
-        self.ion_ax.set_ylabel("Vacuum [Pa]")
-        self.ion_ax.set_title("ionization vacuum gauge")
-        self.ion_ax.legend()
-        self.ion_fig.tight_layout()
-        self.ion_canvas.draw()
+        c = self.chamber
+        profiler = self.app.profiler
+        if c.show_substrate_graphs:
+            with profiler.section("電離真空計 clear"):
+                self.ion_ax.clear()
+        with profiler.section("電離真空計 plot"):
+            if c.show_substrate_graphs:
+                self.plot_history(self.ion_ax, c.ion_history, "電離真空計", "-", "ionization vacuum gauge", log=True, marker='o')
+            self.ion_ax.set_xlabel("Time [s]")
+            self.ion_ax.set_ylabel("Vacuum [Pa]")
+            self.ion_ax.set_title("ionization vacuum gauge")
+            self.ion_ax.legend()
+        if not render:
+            return
+        with profiler.section("電離真空計 tight_layout"):
+            self.ion_fig.tight_layout()
+        with profiler.section("電離真空計 draw"):
+            self.ion_canvas.draw()
 
+    def draw_temp_graph(self, render=True):
         # 温度＆電圧グラフ（基板温度測定開始後のみ）
-        if self.show_substrate_graphs:
-            self.temp_ax.clear()
-            self.temp_ax2.clear()
-            if self.thermocouple_data:
-                x_temp = self.time_data[-len(self.thermocouple_data):]
-                self.temp_ax.plot(x_temp, self.thermocouple_data, 'r-', marker='o', label="temperature [℃]")
-                self.temp_ax.axhline(self.target_temperature, color='red', linestyle='--', linewidth=2, label=f"target temperature {self.target_temperature}℃")
-            if  self.heater_data:
-                x_voltage = self.time_data[-len(self.heater_data):]
-                self.temp_ax2.plot(x_voltage, self.heater_data, 'b-', marker='x', label="Voltage [V]")
-        self.temp_ax.set_xlabel("Time [s]")
-        self.temp_ax.set_ylabel("Temperature [℃]", color='r')
-        self.temp_ax.set_ylim(0, 400)
-        self.temp_ax.set_yticks(range(0, 401, 50))
-        self.temp_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
-        self.temp_ax2.set_ylim(0, 50)
-        self.temp_ax2.set_yticks(range(0, 51, 5))
-        # 右軸ラベルの位置調整
-        self.temp_ax2.yaxis.set_label_position("right")
-        self.temp_ax2.yaxis.tick_right()
-        self.temp_ax.legend(loc="upper left")
-        self.temp_ax2.legend(loc="upper right")
-        self.temp_ax.set_title("Temperature and Voltage")
-        self.temp_fig.tight_layout()
-        self.temp_canvas.draw()
-
-        self.after(1000, self.update_graphs)
-
-    # --- 各センサの測定関数 ---
-    def get_pirani1_measurement(self):
-        if self.pirani1_ser is None:
-            try:
-                self.pirani1_ser = serial.Serial(self.com_port1, 9600, timeout=1,
-                                                  bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-                time.sleep(2)
-                if send_command(self.pirani1_ser, "CO") != "OK":
-                    print("ピラニ1: CO失敗")
-            except Exception as e:
-                print(f"ピラニ1 シリアル接続エラー: {e}")
-                return "Error"
-        try:
-            return send_command(self.pirani1_ser, "P0")
-        except Exception as e:
-            print(f"ピラニ1 測定エラー: {e}")
-            return "Error"
-
-    def get_pirani2_measurement(self):
-        if self.pirani2_ser is None:
-            try:
-                self.pirani2_ser = serial.Serial(self.com_port2, 9600, timeout=1,
-                                                  bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-                time.sleep(2)
-                if send_command(self.pirani2_ser, "CO") != "OK":
-                    print("ピラニ2: CO失敗")
-            except Exception as e:
-                print(f"ピラニ2 シリアル接続エラー: {e}")
-                return "Error"
-        try:
-            return send_command(self.pirani2_ser, "P0")
-        except Exception as e:
-            print(f"ピラニ2 測定エラー: {e}")
-            return "Error"
-
-    def get_ion_gauge_measurement(self):
-        if self.ion_ser is None:
-            try:
-                self.ion_ser = serial.Serial(self.com_port3, 9600, timeout=1,
-                                             bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-                time.sleep(2)
-                if send_command(self.ion_ser, "RE") != "OK":
-                    print("電離真空計: RE失敗")
-                if send_command(self.ion_ser, "F1") != "OK":
-                    print("電離真空計: F1失敗")
-            except Exception as e:
-                print(f"電離真空計 シリアル接続エラー: {e}")
-                return "Error"
-        try:
-            return send_command(self.ion_ser, "RP")
-        except Exception as e:
-            print(f"電離真空計 測定エラー: {e}")
-            return "Error"
-
-    def get_thermocouple_measurement(self):
-        if self.thermocouple_ser is None:
-            try:
-                self.thermocouple_ser = serial.Serial(self.com_port4, 9600, timeout=1,
-                                                      bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-                time.sleep(0.1)
-                self.thermocouple_ser.write(b'MAIN:FUNC DCV\r\n')
-                time.sleep(0.1)
-            except Exception as e:
-                print(f"熱電対 シリアル接続エラー: {e}")
-                return "Error"
-        try:
-            self.thermocouple_ser.write(b'MAIN:MEAS? XNOW\r\n')
-            time.sleep(0.1)
-            response = self.thermocouple_ser.readline().decode().strip()
-            pattern = r'[-+]\d+\.\d+E[-+]\d+'
-            match = re.search(pattern, response)
-            if match:
-                measurement = match.group(0)
-                voltage_V = float(measurement)
-                voltage_uV = voltage_V * 1_000_000
-                try:
-                    temp = self.room_temperature + (voltage_uV / 40.6125)
-                    return str(temp)
-                except Exception as e:
-                    print(f"熱電対 温度変換エラー: {e}")
-                    return "Error"
-            else:
-                print("熱電対: 測定値が見つかりません。")
-                return "Error"
-        except Exception as e:
-            print(f"熱電対 測定エラー: {e}")
-            return "Error"
+        c = self.chamber
+        profiler = self.app.profiler
+        if c.show_substrate_graphs:
+            with profiler.section("温度＆電圧 clear"):
+                self.temp_ax.clear()
+                self.temp_ax2.clear()
+        with profiler.section("温度＆電圧 plot"):
+            if c.show_substrate_graphs and len(c.substrate_history):
+                self.plot_history(self.temp_ax, c.substrate_history, "熱電対", 'r-', "temperature [℃]", marker='o')
+                self.temp_ax.axhline(c.target_temperature, color='red', linestyle='--', linewidth=2, label=f"target temperature {c.target_temperature}℃")
+                self.plot_history(self.temp_ax2, c.substrate_history, "ヒーター電圧", 'b-', "Voltage [V]", marker='x')
+            self.temp_ax.set_xlabel("Time [s]")
+            self.temp_ax.set_ylabel("Temperature [℃]", color='r')
+            self.temp_ax.set_ylim(0, 400)
+            self.temp_ax.set_yticks(range(0, 401, 50))
+            self.temp_ax2.set_ylabel("Voltage [V]", color='b', labelpad=10)
+            self.temp_ax2.set_ylim(0, 50)
+            self.temp_ax2.set_yticks(range(0, 51, 5))
+            # 右軸ラベルの位置調整
+            self.temp_ax2.yaxis.set_label_position("right")
+            self.temp_ax2.yaxis.tick_right()
+            if c.show_substrate_graphs and c.analytics_state:
+                self.temp_ax.text(0.02, 0.02, analytics_text(c.analytics_state, c.target_temperature, temperature=True),
+                                  transform=self.temp_ax.transAxes,
+                                  fontsize=8, va="bottom", bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
+            self.temp_ax.legend(loc="upper left")
+            self.temp_ax2.legend(loc="upper right")
+            self.temp_ax.set_title("Temperature and Voltage")
+        if not render:
+            return
+        with profiler.section("温度＆電圧 tight_layout"):
+            self.temp_fig.tight_layout()
+        with profiler.section("温度＆電圧 draw"):
+            self.temp_canvas.draw()
 
-    def get_heater_voltage_measurement(self):
-        if self.heater_ser is None:
-            try:
-                self.heater_ser = serial.Serial(self.com_port5, 9600, timeout=1,
-                                                bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-                time.sleep(0.1)
-                self.heater_ser.write(b'MAIN:FUNC ACV\r\n')
-                time.sleep(0.1)
-            except Exception as e:
-                print(f"ヒーター電圧 シリアル接続エラー: {e}")
-                return "Error"
+    def plot_history(self, ax, history, channel, fmt, label, log=False, **kwargs):
+        """
+        history（retention.TieredSeries）の channel を描く。まとめた古い区間は平均の線と最小〜最大の帯で表示する。
+        描いた (時刻, 値) の列を返す。
+        """
+        times, means, mins, maxs, n_aggregated = history.columns(channel)
+        if times:
+            line, = (ax.semilogy if log else ax.plot)(times, means, fmt, label=label, **kwargs)
+            if n_aggregated:
+                ax.fill_between(times[:n_aggregated], mins[:n_aggregated], maxs[:n_aggregated],
+                                color=line.get_color(), alpha=0.2, linewidth=0)
+        return times, means
+
+    # --- 操作（測定の本体に渡す。失敗したらメッセージを表示する） ---
+    def run_action(self, action, *args):
         try:
-            self.heater_ser.write(b'MAIN:MEAS? XNOW\r\n')
-            time.sleep(0.1)
-            response = self.heater_ser.readline().decode().strip()
-            pattern = r'[-+]\d+\.\d+E[-+]\d+'
-            match = re.search(pattern, response)
-            if match:
-                measurement = match.group(0)
-                return measurement
-            else:
-                print("ヒーター電圧: 測定値が見つかりません。")
-                return "Error"
-        except Exception as e:
-            print(f"ヒーター電圧 測定エラー: {e}")
-            return "Error"
-
-    def measure_data(self):
-        while self.measurement_running:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            pirani1_value = self.get_pirani1_measurement()
-            pirani2_value = self.get_pirani2_measurement()
-            ion_value = self.get_ion_gauge_measurement()
-            thermo_value = self.get_thermocouple_measurement()
-            heater_value = self.get_heater_voltage_measurement()
-
-            try: pirani1_val = float(pirani1_value)
-            except: pirani1_val = float('nan')
-            try: pirani2_val = float(pirani2_value)
-            except: pirani2_val = float('nan')
-            try: ion_val = float(ion_value)
-            except: ion_val = float('nan')
-            try: thermo_val = float(thermo_value)
-            except: thermo_val = float('nan')
-            try: heater_val = float(heater_value)
-            except: heater_val = float('nan')
-
-            current_time_sec = time.time() - self.start_time
-            self.time_data.append(current_time_sec)
-            self.pirani1_data.append(pirani1_val)
-            self.pirani2_data.append(pirani2_val)
-            self.ion_data.append(ion_val)
-            if self.show_substrate_graphs:
-                self.ion_data2.append(ion_val)
-                self.thermocouple_data.append(thermo_val)
-                self.heater_data.append(heater_val)
-
-            log_line = (f"{timestamp} | ピラニ1: {pirani1_value} Pa | ピラニ2: {pirani2_value} Pa | "
-                        f"電離: {ion_value} Pa | 温度: {thermo_value} ℃ | 電圧: {heater_value} V")
-            self.append_log_line(log_line)
-            data.append([timestamp, pirani1_value, pirani2_value, ion_value, thermo_value, heater_value])
-
-            # ----- アラーム・通知処理 -----
-            if self.show_substrate_graphs:
-                # 目標温度(200℃)の通知（1回だけ）
-                try:
-                    if thermo_val >= self.target_temperature and not self.notif_200_triggered:
-                        alarm_sound(1)
-                        send_discord_notification("基盤温度が200℃になりました")
-                        self.notif_200_triggered = True
-                except Exception as e:
-                    print("通知処理エラー（200℃）:", e)
-
-                # 危険温度(250℃)の通知（1回だけ）
-                try:
-                    if thermo_val >= self.danger_temperature and not self.notif_250_triggered:
-                        alarm_sound(5)
-                        send_discord_notification("基盤温度が250℃になりました")
-                        self.notif_250_triggered = True
-                except Exception as e:
-                    print("通知処理エラー（250℃）:", e)
-
-                # 限界温度(300℃)の通知：温度が300℃以上の場合、5分毎に通知する
-                try:
-                    if thermo_val >= self.limit_temperature:
-                        now = time.time()
-                        if self.last_300_notif_time is None or (now - self.last_300_notif_time >= 300):
-                            alarm_sound(5)
-                            send_discord_notification("基盤温度が300℃を超えました")
-                            self.last_300_notif_time = now
-                    else:
-                        # 温度が300℃以下になったら、通知用タイマーをリセット
-                        self.last_300_notif_time = None
-                except Exception as e:
-                    print("通知処理エラー（300℃）:", e)
-
-                    # 電離真空計関連の通知：各条件とも1回のみ送信
-                try:
-                    if ion_val <= 5e-4 and not self.ion_notify_heater:
-                        send_discord_notification("ヒーター起動可能")
-                        self.ion_notify_heater = True
-                    if ion_val <= 2.67e-4 and thermo_val >= 200 and not self.ion_notify_vapor:
-                        send_discord_notification("蒸着可能")
-                        self.ion_notify_vapor = True
-                except Exception as e:
-                    print("通知処理エラー電離真空計関連:", e)
-
-                # ヒーター電圧上げ通知（各しきい値：10,20,30,40 V）
-                try:
-                    for threshold in [10, 20, 30, 40]:
-                        if heater_val >= threshold:
-                            # しきい値以上の場合
-                            if self.heater_increase_timestamp[threshold] is None:
-                                # 初めてしきい値に達した時刻を記録
-                                self.heater_increase_timestamp[threshold] = time.time()
-                            elif not self.heater_increase_flag[threshold] and time.time() - self.heater_increase_timestamp[threshold] >= 20*60:
-                                # しきい値に達してから20分以上経過している場合に通知
-                                send_discord_notification(f"ヒーター電圧が{threshold}Vになってから20分経過しました (温度 {thermo_val} ℃, 電圧 {heater_val} V)")
-                                self.heater_increase_flag[threshold] = True
-                        else:
-                            # しきい値を下回った場合はタイマーと通知フラグをリセット
-                            self.heater_increase_timestamp[threshold] = None
-                            self.heater_increase_flag[threshold] = False
-                except Exception as e:
-                    print("通知処理エラーヒーター:", e)
-
-                # ヒーター電圧下げ通知（基板温度測定終了後）
-                try:
-                    if self.basis_ended:
-                        # 初回に最大電圧からの下がりを監視（20V下がったタイミング）
-                        if self.last_decrease_notif_voltage is not None and heater_val <= self.last_decrease_notif_voltage - 20:
-                            if self.last_decrease_notif_timestamp is None:
-                                self.last_decrease_notif_timestamp = time.time()
-                            elif time.time() - self.last_decrease_notif_timestamp >= 20*60:
-                                send_discord_notification(f"ヒーター電圧を下げてください (温度 {thermo_val} ℃, 電圧 {heater_val} V)")
-                                # 更新：次の通知の基準を現在の電圧にする
-                                self.last_decrease_notif_voltage = heater_val
-                                self.last_decrease_notif_timestamp = None
-                        # ヒーター電圧が2V以下になったら下げ通知を停止
-                        if heater_val < 2:
-                            self.basis_ended = False
-                except Exception as e:
-                    print("通知処理エラー終了中:", e)
-
-
-            time.sleep(self.record_interval)
+            action(*args)
+        except (RuntimeError, ValueError) as e:
+            messagebox.showerror("エラー", str(e))
+            return False
+        return True
 
+    def run_in_background(self, action):
+        """
+        機器との通信で数秒待つ操作（ポートの検出・機器をローカルに戻す）を別スレッドで行い、ウィンドウを止めない。
+        エラーは after で Tk に渡して表示する。前の操作が終わっていなければ何もしない。
+        """
+        if self.action_thread is not None and self.action_thread.is_alive():
+            return
 
-    def end_measurement(self):
-        self.measurement_running = False
-        if self.ion_ser is not None:
-            try:
-                send_command(self.ion_ser, "LO")
-                send_command(self.ion_ser, "MAIN:LOC")
-            except Exception as e:
-                print(f"電離真空計コマンド送信エラー: {e}")
-        if self.pirani1_ser is not None:
-            try:
-                send_command(self.pirani1_ser, "CF")
-            except Exception as e:
-                print(f"ピラニ1 CF送信エラー: {e}")
-        if self.pirani2_ser is not None:
-            try:
-                send_command(self.pirani2_ser, "CF")
-            except Exception as e:
-                print(f"ピラニ2 CF送信エラー: {e}")
-        if self.thermocouple_ser is not None:
+        def run():
             try:
-                send_command(self.thermocouple_ser, "MAIN:LOC")
-            except Exception as e:
-                print(f"熱電対 MAIN:LOC送信エラー: {e}")
+                action()
+            except (RuntimeError, ValueError) as e:
+                message = str(e)
+                self.after(0, lambda: messagebox.showerror("エラー", message))
 
-        for ser in [self.ion_ser, self.pirani1_ser, self.pirani2_ser, self.thermocouple_ser, self.heater_ser]:
-            if ser is not None:
-                try:
-                    ser.close()
-                except Exception as e:
-                    print(f"シリアルポートクローズエラー: {e}")
-        self.ion_ser = self.pirani1_ser = self.pirani2_ser = self.thermocouple_ser = self.heater_ser = None
-        print("測定を停止し、各機器をローカルモードに戻しました。")
+        self.action_thread = threading.Thread(target=run, daemon=True)
+        self.action_thread.start()
 
     def start_measurement(self):
-        try:
-            self.ion_ser = serial.Serial(self.com_port3, 9600, timeout=1,
-                                         bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
-            time.sleep(2)
-            if send_command(self.ion_ser, "RE") != "OK":
-                print("電離真空計: RE失敗")
-            if send_command(self.ion_ser, "F1") != "OK":
-                print("電離真空計: F1失敗")
-        except Exception as e:
-            print(f"電離真空計 シリアル接続オープンエラー: {e}")
-            return
+        self.run_in_background(self.chamber.start_measurement)
 
-        self.show_substrate_graphs = False
-        self.baseline_heater_voltage = None
-        self.notif_200_triggered = False
-        self.notif_250_triggered = False
-        self.last_300_notif_time = None
-        self.heater_increase_notif = {10: None, 20: None, 30: None, 40: None}
-
-        self.start_time = time.time()
-        self.time_data = []
-        self.pirani1_data = []
-        self.pirani2_data = []
-        self.ion_data = []
-        self.thermocouple_data = []
-        self.heater_data = []
-
-        self.measurement_running = True
-        self.measurement_thread = threading.Thread(target=self.measure_data, daemon=True)
-        self.measurement_thread.start()
+    def end_measurement(self):
+        self.run_in_background(self.chamber.end_measurement)
 
     def start_basis(self):  #基板温度測定開始
-        self.show_substrate_graphs = True
-        self.ion_data2 = []
-        t = self.time_data[-1] if self.time_data else 0
-        self.event_markers.append((t, "start temperature", "green")) #self.event_markers.append((t, "イベント名", "色"))
-        if self.heater_data:
-            self.baseline_heater_voltage = self.heater_data[-1]
-        else:
-            self.baseline_heater_voltage = 0
-        send_discord_notification("基板温度測定を開始しました")
+        self.run_action(self.chamber.start_basis)
 
     def end_basis(self):
-        self.show_substrate_graphs = False
-        self.basis_ended = True
-        t = self.time_data[-1] if self.time_data else 0
-        self.event_markers.append((t, "end temperature", "orange"))
-        if self.heater_data:
-            self.last_decrease_notif_voltage = max(self.heater_data)
-        else:
-            self.last_decrease_notif_voltage = 0
-        self.last_decrease_notif_timestamp = None
-        send_discord_notification("基板温度測定を終了しました")
+        self.run_action(self.chamber.end_basis)
 
     def start_vapor_deposition(self):
-        self.record_interval = 1
-        self.vapor_events.append((self.time_data[-1] if self.time_data else 0, 'blue'))
-        t = self.time_data[-1] if self.time_data else 0
-        self.event_markers.append((t, "start vapor deposition", "blue"))
-        send_discord_notification("蒸着開始")
+        self.run_action(self.chamber.start_vapor_deposition)
 
     def end_vapor_deposition(self):
-        self.record_interval = self.original_record_interval
-        self.vapor_events.append((self.time_data[-1] if self.time_data else 0, 'red'))
-        t = self.time_data[-1] if self.time_data else 0
-        self.event_markers.append((t, "end vapor deposition", "red"))
-        send_discord_notification("蒸着終了")
+        self.run_action(self.chamber.end_vapor_deposition)
+
+    def start_replay(self, path, speed):
+        self.run_action(self.chamber.start_replay, path, speed)
+
+    def on_replay_finished(self, summary):
+        """リプレイの終了時に呼ばれる（同じプロセスでは測定スレッドから呼ばれるので after で Tk に渡す）。"""
+        if self.app.exit_after_replay:
+            self.after(0, self.app.quit)
+        else:
+            self.after(0, lambda: messagebox.showinfo("リプレイ完了", summary))
+
+    def open_replay_window(self):
+        path = filedialog.askopenfilename(filetypes=[("測定ファイル", "*.xlsx *.xls *.csv *.vdrun")],
+                                          title="リプレイする測定ファイルを選択してください")
+        if not path:
+            return
+        window = ctk.CTkToplevel(self)
+        window.title("リプレイ")
+        window.geometry("300x150")
+        ctk.CTkLabel(window, text=os.path.basename(path)).pack(pady=5)
+        speed_menu = ctk.CTkOptionMenu(window, values=["1", "10", "1000", "最大"])
+        speed_menu.set("最大")
+        speed_menu.pack(pady=5)
+
+        def start():
+            window.destroy()
+            self.start_replay(path, parse_speed(speed_menu.get()))
+
+        ctk.CTkButton(window, text="開始", command=start).pack(pady=10)
+
+    def current_figures(self):
+        """
+        3つのグラフを最新のデータにして {タブ名: Figure} で返す（画像の保存用）。
+        古くなっているグラフは線だけを描き直し、画面への描画はタブを開いたとき（refresh_graphs）に行う。
+        """
+        draw = {"真空度": self.draw_vac_graph, "電離真空計": self.draw_ion_graph, "温度＆電圧": self.draw_temp_graph}
+        for tab_name, draw_graph in draw.items():
+            # まだ表示していないタブのグラフもここで作成する
+            self.create_figure(tab_name)
+            if self.drawn_versions.get(tab_name) != self.chamber.data_version:
+                draw_graph(render=False)
+        return {"真空度": self.vac_fig, "電離真空計": self.ion_fig, "温度＆電圧": self.temp_fig}
 
     def save_graph_images(self):
         """
         ファイル保存ダイアログで名前を指定し、
-        各タブのグラフを画像ファイルとして保存する。
+        各タブのグラフを画像ファイル（PNG / SVG / PDF）として保存する。
         例：ユーザーが「graph.png」と指定した場合、
-        「graph_pirani.png」「graph_ion.png」「graph_temp.png」として保存する。
+        「graph_all_ion.png」「graph_ion.png」「graph_temp.png」として保存する。
+        保存はワーカープロセスで行い、終わったら MeasurementApp.poll_exports() が結果を表示する。
         """
         filename = filedialog.asksaveasfilename(
             defaultextension=".png",
-            filetypes=[("PNG Files", "*.png")],
+            filetypes=EXPORT_FILETYPES,
             title="グラフ画像の保存ファイル名を指定してください"
         )
         if filename:
-            import os
             base, ext = os.path.splitext(filename)
             try:
-                self.vac_fig.savefig(base + "_all_ion" + ext)
-                self.ion_fig.savefig(base + "_ion" + ext)
-                self.temp_fig.savefig(base + "_temp" + ext)
-                messagebox.showinfo("保存完了", "グラフ画像が保存されました。")
+                figures = self.current_figures()
+                self.app.export_figures({base + GRAPH_SUFFIXES[tab] + ext: fig for tab, fig in figures.items()},
+                                        "グラフ保存")
             except Exception as e:
                 messagebox.showerror("保存エラー", f"グラフ画像の保存中にエラーが発生しました: {e}")
 
+    def take_snapshot(self, reason):
+        """現在のグラフを SNAPSHOT_DIR に自動保存する（定期・イベントマーカーごと）。"""
+        figures = self.current_figures()
+        paths = snapshot_paths(self.name, reason, [GRAPH_SUFFIXES[tab] for tab in figures])
+        self.app.export_figures(dict(zip(paths, figures.values())), "スナップショット")
+
+    def check_marker_snapshot(self):
+        """前回から増えたイベントマーカーがあれば、最後のマーカーの名前でスナップショットを撮る。"""
+        markers = self.chamber.event_markers
+        if len(markers) > self.snapshot_markers:
+            try:
+                self.take_snapshot(markers[-1][1])
+            except Exception as e:
+                print(f"スナップショットの保存エラー: {e}")
+        # 新しい測定でマーカーが消えた場合も数を合わせる
+        self.snapshot_markers = len(markers)
+
     def date_keep(self):
-        global EXCEL_FILE
-        if not data:
+        if not len(self.chamber.vacuum_history):
             messagebox.showerror("エラー", "保存するデータがありません")
             return
-        if not EXCEL_FILE:
-            EXCEL_FILE = filedialog.asksaveasfilename(
+        if not self.excel_file:
+            self.excel_file = filedialog.asksaveasfilename(
                 defaultextension=".xlsx",
                 filetypes=[("Excelファイル", "*.xlsx")],
                 title="保存ファイル名を指定してください"
             )
-        if not EXCEL_FILE:
+        if not self.excel_file:
             messagebox.showwarning("警告", "ファイルが選択されませんでした。\n保存を中止します。")
             return
-        df = pd.DataFrame(data, columns=["Timestamp", "ピラニ1", "ピラニ2", "電離真空計", "熱電対", "ヒーター電圧"])
-        with pd.ExcelWriter(EXCEL_FILE, engine="openpyxl", mode="w") as writer:
-            df.to_excel(writer, index=False)
-        messagebox.showinfo("保存完了", f"データを{EXCEL_FILE}に保存しました。")
+        try:
+            self.chamber.export_excel(self.excel_file)
+        except Exception as e:
+            messagebox.showerror("保存エラー", f"Excelファイルの保存中にエラーが発生しました: {e}")
+            return
+        messagebox.showinfo("保存完了", f"データを{self.excel_file}に保存しました。")
 
     def open_settings_window(self):
         if hasattr(self, "settings_window") and self.settings_window is not None and self.settings_window.winfo_exists():
             self.settings_window.lift()
             return
+        settings = self.chamber.settings()
         self.settings_window = ctk.CTkToplevel(self)
         self.settings_window.title("設定")
         self.settings_window.geometry("400x500")
@@ -673,35 +420,35 @@ class MeasurementApp(ctk.CTk):
         frame1.grid(row=0, column=0, padx=5, pady=5, sticky="w")
         ctk.CTkLabel(frame1, text="ピラニ1:", anchor="w").pack(side="left", padx=(0,5))
         self.com_port1_entry = ctk.CTkEntry(frame1, width=100)
-        self.com_port1_entry.insert(0, self.com_port1)
+        self.com_port1_entry.insert(0, settings["com_port1"])
         self.com_port1_entry.pack(side="left")
 
         frame2 = ctk.CTkFrame(com_frame)
         frame2.grid(row=0, column=1, padx=5, pady=5, sticky="w")
         ctk.CTkLabel(frame2, text="ピラニ2:", anchor="w").pack(side="left", padx=(0,5))
         self.com_port2_entry = ctk.CTkEntry(frame2, width=100)
-        self.com_port2_entry.insert(0, self.com_port2)
+        self.com_port2_entry.insert(0, settings["com_port2"])
         self.com_port2_entry.pack(side="left")
 
         frame3 = ctk.CTkFrame(com_frame)
         frame3.grid(row=1, column=0, padx=5, pady=5, sticky="w")
         ctk.CTkLabel(frame3, text="電離真空計:", anchor="w").pack(side="left", padx=(0,5))
         self.com_port3_entry = ctk.CTkEntry(frame3, width=100)
-        self.com_port3_entry.insert(0, self.com_port3)
+        self.com_port3_entry.insert(0, settings["com_port3"])
         self.com_port3_entry.pack(side="left")
 
         frame4 = ctk.CTkFrame(com_frame)
         frame4.grid(row=1, column=1, padx=5, pady=5, sticky="w")
         ctk.CTkLabel(frame4, text="熱電対:", anchor="w").pack(side="left", padx=(0,5))
         self.com_port4_entry = ctk.CTkEntry(frame4, width=100)
-        self.com_port4_entry.insert(0, self.com_port4)
+        self.com_port4_entry.insert(0, settings["com_port4"])
         self.com_port4_entry.pack(side="left")
 
         frame5 = ctk.CTkFrame(com_frame)
         frame5.grid(row=2, column=0, padx=5, pady=5, sticky="w")
         ctk.CTkLabel(frame5, text="ヒーター電圧:", anchor="w").pack(side="left", padx=(0,5))
         self.com_port5_entry = ctk.CTkEntry(frame5, width=100)
-        self.com_port5_entry.insert(0, self.com_port5)
+        self.com_port5_entry.insert(0, settings["com_port5"])
         self.com_port5_entry.pack(side="left")
 
         # 追加：温度閾値設定
@@ -709,27 +456,27 @@ class MeasurementApp(ctk.CTk):
         threshold_frame.pack(fill="x", pady=5)
         ctk.CTkLabel(threshold_frame, text="目標温度 (℃):", anchor="w").grid(row=0, column=0, padx=5, pady=5)
         self.target_temp_entry = ctk.CTkEntry(threshold_frame, width=50)
-        self.target_temp_entry.insert(0, str(self.target_temperature))
+        self.target_temp_entry.insert(0, str(settings["target_temperature"]))
         self.target_temp_entry.grid(row=0, column=1, padx=5, pady=5)
 
         ctk.CTkLabel(threshold_frame, text="危険温度 (℃):", anchor="w").grid(row=1, column=0, padx=5, pady=5)
         self.danger_temp_entry = ctk.CTkEntry(threshold_frame, width=50)
-        self.danger_temp_entry.insert(0, str(self.danger_temperature))
+        self.danger_temp_entry.insert(0, str(settings["danger_temperature"]))
         self.danger_temp_entry.grid(row=1, column=1, padx=5, pady=5)
 
         ctk.CTkLabel(threshold_frame, text="限界温度 (℃):", anchor="w").grid(row=2, column=0, padx=5, pady=5)
         self.limit_temp_entry = ctk.CTkEntry(threshold_frame, width=50)
-        self.limit_temp_entry.insert(0, str(self.limit_temperature))
+        self.limit_temp_entry.insert(0, str(settings["limit_temperature"]))
         self.limit_temp_entry.grid(row=2, column=1, padx=5, pady=5)
 
         ctk.CTkLabel(self.settings_window, text="記録間隔（秒）:", anchor="w").pack(fill="x", pady=5)
         self.record_interval_entry = ctk.CTkEntry(self.settings_window)
-        self.record_interval_entry.insert(0, str(self.record_interval))
+        self.record_interval_entry.insert(0, str(settings["record_interval"]))
         self.record_interval_entry.pack(fill="x", pady=5)
 
         ctk.CTkLabel(self.settings_window, text="現在の室温（℃）:", anchor="w").pack(fill="x", pady=5)
         self.room_temp_entry = ctk.CTkEntry(self.settings_window)
-        self.room_temp_entry.insert(0, str(self.room_temperature))
+        self.room_temp_entry.insert(0, str(settings["room_temperature"]))
         self.room_temp_entry.pack(fill="x", pady=5)
 
         save_button = ctk.CTkButton(self.settings_window, text="保存", command=self.save_settings)
@@ -737,23 +484,27 @@ class MeasurementApp(ctk.CTk):
 
     def save_settings(self):
         try:
-            self.com_port1 = self.com_port1_entry.get()
-            self.com_port2 = self.com_port2_entry.get()
-            self.com_port3 = self.com_port3_entry.get()
-            self.com_port4 = self.com_port4_entry.get()
-            self.com_port5 = self.com_port5_entry.get()
-            self.record_interval = int(self.record_interval_entry.get())
-            self.room_temperature = float(self.room_temp_entry.get())
-            self.target_temperature = float(self.target_temp_entry.get())
-            self.danger_temperature = float(self.danger_temp_entry.get())
-            self.limit_temperature  = float(self.limit_temp_entry.get())
-            self.room_temp_label.configure(text=f"現在の室温: {self.room_temperature}℃")
-            print(f"設定を保存しました: ピラニ1={self.com_port1}, ピラニ2={self.com_port2}, "
-                  f"電離真空計={self.com_port3}, 熱電対={self.com_port4}, ヒーター電圧={self.com_port5}, "
-                  f"記録間隔={self.record_interval}秒, 目標温度={self.target_temperature}℃, 危険温度={self.danger_temperature}℃, 限界温度={self.limit_temperature}℃")
-            self.settings_window.destroy()
+            settings = {
+                "com_port1": self.com_port1_entry.get(),
+                "com_port2": self.com_port2_entry.get(),
+                "com_port3": self.com_port3_entry.get(),
+                "com_port4": self.com_port4_entry.get(),
+                "com_port5": self.com_port5_entry.get(),
+                "record_interval": int(self.record_interval_entry.get()),
+                "room_temperature": float(self.room_temp_entry.get()),
+                "target_temperature": float(self.target_temp_entry.get()),
+                "danger_temperature": float(self.danger_temp_entry.get()),
+                "limit_temperature": float(self.limit_temp_entry.get()),
+            }
+            self.chamber.apply_settings(settings)
         except ValueError:
             print("設定にエラーがあります。正しい値を入力してください。")
+            return
+        except ControlError as e:
+            messagebox.showerror("エラー", str(e))
+            return
+        self.room_temp_label.configure(text=f"現在の室温: {self.chamber.room_temperature}℃")
+        self.settings_window.destroy()
 
     def open_log_window(self):
         if self.log_window is None or not self.log_window.winfo_exists():
@@ -764,19 +515,213 @@ class MeasurementApp(ctk.CTk):
             self.log_window.after(5000, lambda: self.log_window.attributes('-topmost', False))
             self.log_textbox = ctk.CTkTextbox(self.log_window)
             self.log_textbox.pack(fill="both", expand=True)
+            # 開く前の行も、保持している分は表示する
+            self.log_count = 0
+            self.refresh_log()
         else:
             self.log_window.lift()
 
-def play_alarm():
-    try:
-        playsound("alarm.mp3")
-    except Exception as e:
-        print(f"アラーム音再生中にエラーが発生しました: {e}")
+    def refresh_log(self):
+        """ログウィンドウが開いていれば、前回から増えた行を追加する。"""
+        if self.log_window is None or not self.log_window.winfo_exists():
+            return
+        self.log_count, lines = self.chamber.log_since(self.log_count)
+        if lines:
+            self.log_textbox.insert("end", "".join(line + "\n" for line in lines))
+            self.log_textbox.see("end")
+
+class MeasurementApp(ctk.CTk):
+    """
+    全チャンバーのウィンドウ。チャンバーごとの ChamberView をタブに並べ、
+    グラフの更新は表示中のチャンバーについてだけ行う。
+    測定は chambers（acquisition.Chamber または control_api.RemoteChamber）の側で行うので、
+    GUI が固まっても測定の間隔は変わらない。client を渡すとデーモンにつないだクライアントとして動く。
+    F12 で描画ループのプロファイル（画面右下に表示）、Shift+F12 で cProfile の記録を切り替える。
+    測定中は snapshot_minutes 分ごとと、イベントマーカーを追加するたびにグラフを自動保存する（0 で無効）。
+    """
+
+    def __init__(self, chambers, client=None, profile=False, snapshot_minutes=SNAPSHOT_INTERVAL_MIN):
+        super().__init__()
+        self.client = client
+        self.profiler = FrameProfiler(enabled=profile)
+        # グラフ画像の保存はワーカープロセスで行う（保存中も GUI は固まらない）
+        self.exporter = FigureExporter()
+        self.snapshot_minutes = snapshot_minutes
+        self.title("測定データ収集システム" + (f"（{client.url} に接続）" if client is not None else ""))
+        self.geometry("1200x700")
+        self.exit_after_replay = False
+        self.sessions = []
+
+        # ヘッダー領域（上部）
+        self.header_frame = ctk.CTkFrame(self, height=20)
+        self.header_frame.pack(side="top", fill="x")
+        self.current_time_label = ctk.CTkLabel(self.header_frame, text="", font=("Arial", 14))
+        self.current_time_label.pack(side="right", padx=10, pady=5)
+        # 通知テスト用ボタン
+        ctk.CTkButton(self.header_frame, text="通知テスト", command=self.notification_test, fg_color="#7289DA", hover_color="#304FB5").pack(side="left",pady=5,padx=10)
+        self.connection_label = ctk.CTkLabel(self.header_frame, text="", text_color="red")
+        self.connection_label.pack(side="left", padx=10, pady=5)
+
+        if len(chambers) == 1:
+            # 1台だけなら従来どおりタブなしで表示する
+            self.chamber_tabview = None
+            session = ChamberView(self, self, chambers[0])
+            session.pack(side="top", fill="both", expand=True)
+            self.sessions.append(session)
+        else:
+            self.chamber_tabview = ctk.CTkTabview(self, command=self.on_chamber_changed)
+            self.chamber_tabview.pack(side="top", fill="both", expand=True)
+            for chamber in chambers:
+                tab = self.chamber_tabview.add(chamber.name)
+                session = ChamberView(tab, self, chamber)
+                session.pack(fill="both", expand=True)
+                self.sessions.append(session)
+        # プロファイルの表示（有効なときだけ右下に重ねて表示する）
+        self.profile_label = ctk.CTkLabel(self, text="", font=("Consolas", 11), justify="left", anchor="w",
+                                          fg_color="#202020", text_color="#E0E0E0", corner_radius=4)
+        self.show_profile_overlay(profile)
+        self.bind("<F12>", self.toggle_profiler)
+        self.bind("<Shift-F12>", self.toggle_cprofile)
+        startup_profile.mark("layout")
+        self.update_current_time()
+        self.update_graphs()
+        if snapshot_minutes:
+            self.after(int(snapshot_minutes * 60000), self.take_snapshots)
+        self.after_idle(self.on_first_idle)
+
+    def visible_session(self):
+        if self.chamber_tabview is None:
+            return self.sessions[0]
+        return self.sessions[[s.name for s in self.sessions].index(self.chamber_tabview.get())]
+
+    def on_chamber_changed(self):
+        self.visible_session().on_tab_changed()
+
+    def on_first_idle(self):
+        """ウィンドウが表示され操作可能になった時点で、表示中のタブのグラフを作成し起動時間を記録する。"""
+        startup_profile.mark("window ready")
+        self.visible_session().on_tab_changed()
+        startup_profile.mark("first figure")
+        startup_profile.report("MeasurementApp")
+
+    def notification_test(self):
+        if self.client is None:
+            send_discord_notification("テスト通知です")
+            return
+        try:
+            self.client.post("/notify", {"message": "テスト通知です"})
+        except ControlError as e:
+            messagebox.showerror("エラー", str(e))
+
+    def show_profile_overlay(self, visible):
+        if visible:
+            self.profile_label.place(relx=1.0, rely=1.0, x=-10, y=-10, anchor="se")
+        else:
+            self.profile_label.place_forget()
+
+    def toggle_profiler(self, event=None):
+        self.show_profile_overlay(self.profiler.toggle())
+
+    def toggle_cprofile(self, event=None):
+        path = self.profiler.toggle_cprofile()
+        if path is not None:
+            messagebox.showinfo("プロファイル", f"cProfile の記録を保存しました: {path}\n（python -m pstats {path} で表示）")
+
+    def export_figures(self, figures, label):
+        """figures（{パス: Figure}）の保存をワーカーに渡し、終わるまで結果を確認する。"""
+        pending = bool(self.exporter)
+        self.exporter.submit(figures, label, tight_layout=True)
+        if not pending:
+            self.after(200, self.poll_exports)
+
+    def poll_exports(self):
+        for label, paths, errors in self.exporter.finished():
+            if label == "グラフ保存":
+                if errors:
+                    messagebox.showerror("保存エラー", f"グラフ画像の保存中にエラーが発生しました: {errors[0][1]}")
+                else:
+                    messagebox.showinfo("保存完了", "グラフ画像が保存されました。")
+            else:
+                for path, error in errors:
+                    print(f"{label}の保存エラー: {path}: {error}")
+        if self.exporter:
+            self.after(200, self.poll_exports)
+
+    def take_snapshots(self):
+        """測定中のチャンバーのグラフを定期的に自動保存する（隠れているチャンバーも含む）。"""
+        for session in self.sessions:
+            try:
+                if session is not self.visible_session():
+                    poll = getattr(session.chamber, "poll", None)
+                    if poll is not None:
+                        poll()
+                if session.chamber.measurement_running:
+                    session.take_snapshot("定期")
+            except ControlError as e:
+                print(e)
+            except Exception as e:
+                print(f"スナップショットの保存エラー: {e}")
+        self.after(int(self.snapshot_minutes * 60000), self.take_snapshots)
+
+    def update_current_time(self):
+        with self.profiler.frame("update_current_time", 1.0):
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.current_time_label.configure(text=current_time)
+        self.after(1000, self.update_current_time)
+
+    def update_graphs(self):
+        with self.profiler.frame("update_graphs", 1.0):
+            # 隠れているチャンバーのグラフは描かない（タブを切り替えたときに描く）
+            try:
+                self.visible_session().refresh()
+                self.connection_label.configure(text="")
+                if self.snapshot_minutes:
+                    with self.profiler.section("snapshot"):
+                        for session in self.sessions:
+                            session.check_marker_snapshot()
+            except ControlError as e:
+                # デーモンが止まっている・再起動中：つながるまで毎秒試す（表示・出力は切れたときに1回）
+                if not self.connection_label.cget("text"):
+                    print(e)
+                self.connection_label.configure(text="測定デーモンに接続できません")
+        if self.profiler.enabled:
+            self.profile_label.configure(text=self.profiler.summary())
+        self.after(1000, self.update_graphs)
 
 if __name__ == "__main__":
-    # Discord Bot を別スレッドで起動
-    discord_thread = threading.Thread(target=start_discord_bot, daemon=True)
-    discord_thread.start()
+    import argparse
+    parser = argparse.ArgumentParser(description="VDEM 測定システム")
+    parser.add_argument("--attach", nargs="?", const=f"http://{CONTROL_HOST}:{CONTROL_PORT}", metavar="URL",
+                        help="acquisition.py で起動した測定デーモンに GUI をつなぐ（GUI を閉じても測定は続く）")
+    parser.add_argument("--replay", metavar="FILE", help="記録した測定ファイルを測定ループに流す（Discord には送らない）")
+    parser.add_argument("--speed", default="max", help="リプレイの速度（1, 10, 1000 などの倍率、または max）")
+    parser.add_argument("--exit", action="store_true", help="リプレイが終わったら結果を表示して終了する")
+    parser.add_argument("--profile", action="store_true", help="描画ループのプロファイルを有効にして起動する（F12 で切り替え）")
+    parser.add_argument("--snapshot-every", type=float, default=SNAPSHOT_INTERVAL_MIN, metavar="MIN",
+                        help="測定中のグラフを自動保存する間隔（分）。イベントマーカーごとにも保存する。0 で無効")
+    args = parser.parse_args()
+    client = None
+    if args.attach:
+        client = ControlClient(args.attach)
+        try:
+            chambers = [RemoteChamber(client, state) for state in client.get("/chambers")]
+        except ControlError as e:
+            print(e)
+            raise SystemExit(1)
+    else:
+        # GUI と同じプロセスで測定する（制御APIも開くので、別の GUI やスクリプトからも操作できる）
+        service = AcquisitionService()
+        chambers = service.chambers
+        if not args.replay:
+            # Discord Bot を別スレッドで起動
+            discord_thread = threading.Thread(target=start_discord_bot, daemon=True)
+            discord_thread.start()
+        start_server_loop([ControlServer(service)])
     # メインアプリケーションを起動
-    app = MeasurementApp()
+    app = MeasurementApp(chambers, client, profile=args.profile, snapshot_minutes=args.snapshot_every)
+    if args.replay:
+        # リプレイは1台目のチャンバーに流す（デーモンにつないでいる場合はデーモンがファイルを読む）
+        app.exit_after_replay = args.exit
+        path = os.path.abspath(args.replay)
+        app.after_idle(lambda: app.sessions[0].start_replay(path, parse_speed(args.speed)))
     app.mainloop()
@@ -0,0 +1,1204 @@
+"""
+測定の本体（GUI なし）
+
+機器との通信・補正・記録・アラーム・通知をチャンバーごとの Chamber にまとめ、
+AcquisitionService が共通の IOScheduler で測定を回す。Tk には依存しないので、
+VDEM system.py の GUI と同じプロセスでも、GUI なしのデーモンとしても動かせる。
+
+    python acquisition.py                 GUI なしで測定する（操作は control_api の HTTP API）
+    python acquisition.py --discover      測定器のポートを検出して表示する（serial_discovery）
+    python "VDEM system.py" --attach      動いているデーモンに GUI をつなぐ（閉じても測定は続く）
+
+配信サーバー（stream_server）と制御API（control_api）は start_server_loop() が起動する
+専用の asyncio イベントループで動かす（Discord Bot のログインを待たない）。
+"""
+import threading
+import time
+import re
+import asyncio
+import csv
+import json
+import os
+from collections import deque
+from datetime import datetime  # 時刻
+import serial  # シリアル通信ライブラリ
+from stream_server import LiveStreamServer, STREAM_PORT  # HTTP/WebSocket 配信
+from io_scheduler import IOScheduler  # 全チャンバー共通の測定スケジューラ
+from sensor_filter import SensorFilter, pack_flags, FLAG_OK, FLAG_OUTLIER, FLAG_HOLD  # スパイク・欠測の補正
+from process_analytics import ProcessAnalytics, format_eta, HEATER_READY_PRESSURE, VAPOR_READY_PRESSURE  # 排気・昇温の到達予測
+from replay import WallClock, ReplaySource  # 記録した測定のリプレイ
+from retention import TieredSeries  # 直近は全サンプル、古い分は min/mean/max で保持
+from adaptive_sampling import AdaptiveSampler, CHANNEL_DEADBANDS, HEARTBEAT  # 一定の値の間引きと速い変化での間隔短縮
+from run_events import append_event_csv, events_sidecar_path, write_events_sheet  # イベントをデータと一緒に残す
+from serial_discovery import discover, load_port_cache, save_port_cache  # 測定器のポートの並列自動検出
+# 以下の重いモジュールは、初めて使うときに import する
+#   discord（start_discord_bot）, openpyxl（export_rows_to_excel）, playsound（alarm_sound）,
+#   live_feed / run_archive / run_catalog（測定開始・終了時）
+
+# ----- Discord Bot の設定 -----
+# Bot は start_discord_bot() が別スレッドで作成する（プレフィックスは "!"）
+discord_bot = None
+bot_loop = None
+
+# 通知を送信するチャンネルID
+# 自身が使用するbotを入れたサーバーのメッセージチャットのチャンネルID
+CHANNEL_ID = 1234567890123456789
+
+
+# チャンバーごとの名前とCOMポート（ピラニ1, ピラニ2, 電離真空計, 熱電対, ヒーター電圧）
+# CHAMBER_CONFIG（JSON、同じ形式のリスト）があればそちらを使う。複数書くと1つのウィンドウでまとめて測定する
+# 測定開始時にポートを自動検出する（serial_discovery）。COMポートは同じ種類の測定器の区別と、見つからないときに使う。
+# 固定のポートで測定するチャンバーは "discover": false を書く
+CHAMBERS = [
+    {"name": "チャンバー1", "ports": ["COM15", "COM13", "COM16", "COM14", "COM12"]},
+]
+CHAMBER_CONFIG = "chambers.json"
+
+# 測定値の列名と、Excel・ログ共通の列名（Timestamp は日時、Epoch は1970年からの秒）
+CHANNEL_COLUMNS = ["ピラニ1", "ピラニ2", "電離真空計", "熱電対", "ヒーター電圧"]
+# 補正後の値（sensor_filter）は生の値と並べて保存する。フィルタ列はチャンネルごとの補正理由をまとめた整数
+CLEANED_COLUMNS = [c + "(補正)" for c in CHANNEL_COLUMNS]
+FILTER_FLAG_COLUMN = "フィルタ"
+# チャンネルごとの、値を読み終えた時刻（epoch秒）。1回の測定で5台を順に読むと1秒以上かかるので、
+# 行の Epoch（測定を始めた時刻）ではなくこの時刻を各チャンネルの値の時刻として使う
+TIME_COLUMNS = [c + "(時刻)" for c in CHANNEL_COLUMNS]
+# 値が不感帯の中で記録しなかった、直前の測定回数（adaptive_sampling）
+GAP_COLUMN = "省略数"
+RECORD_COLUMNS = CHANNEL_COLUMNS + CLEANED_COLUMNS + [FILTER_FLAG_COLUMN, GAP_COLUMN] + TIME_COLUMNS
+EXPORT_COLUMNS = ["Timestamp", "Epoch"] + RECORD_COLUMNS
+# 測定中の値を逐次追記するCSVログの保存先（Show graph.py の追従モードで読み込む）
+LIVE_LOG_DIR = "live_logs"
+# 測定アーカイブ（イベント・設定・生の応答を含む .vdrun）の保存先
+RUN_ARCHIVE_DIR = "runs"
+
+# 到達予測の事前通知を出す残り時間（秒）
+FORECAST_NOTICE_SEC = 10 * 60
+
+# グラフ用に保持するチャンネル（補正後の値）。全サンプルは測定アーカイブに保存する
+VACUUM_CHANNELS = ["ピラニ1", "ピラニ2", "電離真空計"]
+SUBSTRATE_CHANNELS = ["熱電対", "ヒーター電圧"]
+
+# ログウィンドウ用に保持する行数（GUI が後からつないでも直近の分を表示できる）
+LOG_HISTORY = 2000
+
+# 変更できる設定項目と型（apply_settings / 制御API の /settings）
+SETTING_TYPES = {
+    "com_port1": str, "com_port2": str, "com_port3": str, "com_port4": str, "com_port5": str,
+    "record_interval": int, "room_temperature": float,
+    "target_temperature": float, "danger_temperature": float, "limit_temperature": float,
+}
+
+# ブラウザ・解析スクリプト向けの配信サーバー（チャンバーごとに1つ）と制御API。server_loop 上で動かす
+stream_servers = []
+server_loop = None
+
+
+def load_chamber_config(path=CHAMBER_CONFIG):
+    """チャンバーの設定を読む。ファイルが無い・読めない場合は CHAMBERS を使う。"""
+    if not os.path.exists(path):
+        return CHAMBERS
+    try:
+        with open(path, encoding="utf-8") as f:
+            chambers = json.load(f)
+        for chamber in chambers:
+            if len(chamber["ports"]) != len(CHANNEL_COLUMNS):
+                raise ValueError(f"{chamber['name']} のCOMポートは{len(CHANNEL_COLUMNS)}つ指定してください")
+        return chambers
+    except (OSError, ValueError, KeyError) as e:
+        print(f"チャンバー設定の読み込みエラー: {e}")
+        return CHAMBERS
+
+def export_rows_to_excel(path, rows, events=()):
+    """
+    測定データを数値列のまま .xlsx に書き出す。
+    Timestamp はExcelの日時（シリアル値）、Epoch は秒の数値、欠測(NaN)は空セルにする。
+    openpyxl の書き込み専用モードで1行ずつ書き出すので、データ量が増えてもメモリ使用量はほぼ一定。
+    events（(epoch秒, ラベル, 色) の並び）は "Events" シートに書く（Show graph.py が読み込む）。
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    ws.append(EXPORT_COLUMNS)
+    for epoch, *values in rows:
+        ws.append([datetime.fromtimestamp(epoch), epoch] + [v if v == v else None for v in values])
+    write_events_sheet(wb, events)
+    wb.save(path)
+
+def send_command(ser, command):
+    """
+    シリアル通信でコマンドを送信し、応答を取得する。
+    """
+    ser.write((command + "\r").encode("ascii"))
+    print(f"送信: {command}")
+    time.sleep(0.5)
+    response = ser.readline().decode("ascii").strip()
+    print(f"受信: {response}")
+    return response
+
+def alarm_sound(n):
+    """アラーム音をn回鳴らす"""
+    from playsound import playsound
+    for _ in range(n):
+        playsound("alarm.mp3")
+        time.sleep(0.5)
+
+def play_alarm():
+    try:
+        from playsound import playsound
+        playsound("alarm.mp3")
+    except Exception as e:
+        print(f"アラーム音再生中にエラーが発生しました: {e}")
+
+def analytics_text(state, target_temperature, temperature=False):
+    """グラフに表示する到達予測の文字列（グラフの表記に合わせて英語）。"""
+
+    def minutes(seconds):
+        if seconds is None:
+            return "--"
+        return "reached" if seconds <= 0 else f"{seconds / 60:.0f} min"
+
+    if temperature:
+        rate = state.get("heating_rate")
+        rate_text = "--" if rate is None else f"{rate:.2f} ℃/min"
+        return f"dT/dt: {rate_text}  ETA {target_temperature}℃: {minutes(state.get('eta_target'))}"
+    rate = state.get("log_pressure_rate")
+    rate_text = "--" if rate is None else f"{rate:.4f} dec/min"
+    return (f"dlogP/dt: {rate_text}\nETA 5e-4 Pa: {minutes(state.get('eta_heater_ready'))}"
+            f"  ETA 2.67e-4 Pa: {minutes(state.get('eta_vapor_ready'))}")
+
+async def on_ready():
+    global bot_loop
+    bot_loop = discord_bot.loop
+    print(f"Discord Bot: Logged in as {discord_bot.user}")
+
+async def start_server(server):
+    try:
+        await server.start()
+    except OSError as e:
+        print(f"配信サーバーの起動エラー: {e}")
+
+def start_server_loop(servers=()):
+    """配信サーバー・制御APIを動かすイベントループを別スレッドで起動し、servers を起動する。"""
+    global server_loop
+    server_loop = asyncio.new_event_loop()
+    threading.Thread(target=server_loop.run_forever, daemon=True).start()
+    for server in list(stream_servers) + list(servers):
+        asyncio.run_coroutine_threadsafe(start_server(server), server_loop)
+
+async def send_message(message):
+    channel = discord_bot.get_channel(CHANNEL_ID)
+    if channel:
+        await channel.send(message)
+    else:
+        print("Discord Bot: 指定したチャンネルが見つかりません")
+
+def start_discord_bot():
+    # discord の import と Bot の作成は起動を遅らせないよう、このスレッドで行う
+    global discord_bot
+    import discord  #discord_bot
+    from discord.ext import commands #discord_bot
+    intents = discord.Intents.default()
+    discord_bot = commands.Bot(command_prefix="!", intents=intents)
+    discord_bot.event(on_ready)
+    # Bot を実行
+    discord_bot.run("MTM0NDI4NDcyNjc3MjQ5ODQ5NA.GrZpSQ.MInm6ETryrm9Pcl8kN3GYvflED2-oGhFd_PPZU") # 自身が作成したbotのトークンを記入
+
+def send_discord_notification(message):
+    try:
+        # メッセージをUTF-8エンコード→デコードして、エラーがあれば置換する
+        message = message.encode('utf-8', errors='replace').decode('utf-8')
+        future = asyncio.run_coroutine_threadsafe(send_message(message), bot_loop)
+        future.result(timeout=5)
+    except Exception as e:
+        print("Discord通知エラー:", e)
+
+
+class Chamber:
+    """
+    1つのチャンバーの測定（機器・データ・アラーム・保存）。GUI からも制御APIからも同じメソッドで操作する。
+    測定は AcquisitionService の IOScheduler が sample_once() を繰り返し呼んで行う。
+    """
+
+    def __init__(self, service, index, name, ports, auto_discover=True):
+        self.service = service
+        self.index = index
+        self.name = name
+        self.auto_discover = auto_discover  # 測定開始時に測定器のポートを自動検出する
+        # 1台目は従来と同じファイル名・共有メモリ名、2台目以降は番号を付ける
+        self.file_prefix = "run" if index == 0 else f"run_ch{index + 1}"
+
+        # 各センサのCOMポート設定
+        self.com_port1 = ports[0]   # ピラニ1[Pa]
+        self.com_port2 = ports[1]   # ピラニ2[Pa]
+        self.com_port3 = ports[2]   # 電離真空計[Pa]
+        self.com_port4 = ports[3]   # 熱電対
+        self.com_port5 = ports[4]   # ヒーター電圧
+
+        self.record_interval = 10  # 記録間隔（秒）
+        self.original_record_interval = 10
+        self.room_temperature = 26.7  # 初期室温（℃）
+        self.measurement_running = False
+
+        # 温度通知閾値（設定可能）
+        self.target_temperature = 200  # 目標温度
+        self.danger_temperature = 250  # 危険温度
+        self.limit_temperature  = 300  # 限界温度
+
+        # 測定データは測定アーカイブ（.vdrun）に保存し、Excel保存もそこから書き出す（archive_path は最後の測定）
+        self.archive_path = None
+        self.start_time = None
+        # ブラウザ・解析スクリプト・GUI クライアント向けの配信（チャンバーごとにポートを分ける）
+        self.stream_server = LiveStreamServer(CHANNEL_COLUMNS, port=STREAM_PORT + index)
+        stream_servers.append(self.stream_server)
+        if server_loop is not None:
+            asyncio.run_coroutine_threadsafe(start_server(self.stream_server), server_loop)
+
+        # グラフ用の測定データ（測定開始からの経過秒）。直近は全サンプル、古い分はまとめて保持する
+        self.vacuum_history = TieredSeries(VACUUM_CHANNELS)        # ピラニ1, ピラニ2, 電離真空計 [Pa]
+        self.substrate_history = TieredSeries(SUBSTRATE_CHANNELS)  # 基板温度測定中の熱電対 [℃], ヒーター電圧 [V]
+        self.ion_history = TieredSeries(["電離真空計"])             # 基板温度測定開始後の電離真空計 [Pa]
+
+        # イベントマーカーリスト（タプル: (記録時刻, "イベント名", "色")）
+        self.event_markers = []
+
+        # 各センサ用シリアル接続
+        self.pirani1_ser = None
+        self.pirani2_ser = None
+        self.ion_ser = None
+        self.thermocouple_ser = None
+        self.heater_ser = None
+
+        # ログウィンドウ用：直近の行と、これまでに追加した行数（クライアントは続きの番号から取得する）
+        self.log_lines = deque(maxlen=LOG_HISTORY)
+        self.log_count = 0
+        self.log_lock = threading.Lock()
+
+        # 逐次追記CSVログ用
+        self.live_log = None
+        self.live_log_writer = None
+        self.live_log_path = None
+        self.live_log_lock = threading.Lock()
+        # 測定1回分（sample_once）と、測定の開始・終了の処理を排他する（finish_replay は測定中に呼ぶので RLock）
+        self.sample_lock = threading.RLock()
+        # 測定・リプレイを始めるたびに増やす。止めた後に残っていた前回の sample_once はこれで終わらせる
+        self.run_generation = 0
+
+        # 共有メモリ配信用（測定スレッドとボタン操作の両方から書き込むためロックする）
+        self.live_feed = None
+        self.live_feed_lock = threading.Lock()
+
+        # 測定アーカイブ（.vdrun）
+        self.run_archive = None
+
+        # 内部フラグ
+        self.show_substrate_graphs = False  # 基板温度測定開始後に表示するグラフ群
+        self.vapor_events = []              # 蒸着開始／終了の目印用 (time, color)
+
+        # アラーム通知用状態
+        self.notif_200_triggered = False
+        self.notif_250_triggered = False
+        self.last_300_notif_time = None
+        self.ion_notify_heater = False  # ヒーター起動可能通知
+        self.ion_notify_vapor = False   # 蒸着可能通知
+        self.volt_ten = False
+
+        # 排気速度・昇温速度の逐次推定と到達予測
+        self.analytics = ProcessAnalytics()
+        self.analytics_state = {}
+        self.forecast_notified = set()  # 事前通知済みの予測（"heater", "vapor", "target"）
+        # スパイク・欠測の補正（移動中央値と MAD）
+        self.sensor_filter = SensorFilter(CHANNEL_COLUMNS)
+        # 記録の間引きと測定間隔（補正後の値で判定する）
+        self.sampler = AdaptiveSampler(CHANNEL_COLUMNS)
+        self.last_sample_sec = 0.0   # 最後に測定した時刻（測定開始からの秒。記録しなかった測定も含む）
+
+        # 測定ループの時計と、リプレイ中のサンプル供給元（通常の測定では None）
+        self.clock = WallClock()
+        self.replay = None
+        # リプレイが終わったときに結果の文字列を渡して呼ぶ関数（GUI が結果を表示する。測定スレッドから呼ばれる）
+        self.on_replay_finished = None
+        self.last_replay_summary = None
+        # グラフの更新判定用：データが変わるたびに増やす
+        self.data_version = 0
+
+        self.heater_increase_flag = {10: False, 20: False, 30: False, 40: False}
+        self.heater_increase_timestamp = {10: None, 20: None, 30: None, 40: None}
+        # ヒーター電圧下げ通知用：基板温度測定終了後に、当日の最大値からの下がりを管理
+        self.basis_ended = False
+        self.last_decrease_notif_voltage = None
+        self.last_decrease_notif_timestamp = None
+
+    def append_log_line(self, message):
+        with self.log_lock:
+            self.log_lines.append(message)
+            self.log_count += 1
+
+    def log_since(self, count):
+        """count 行目以降のログを (これまでの行数, [行...]) で返す（保持していない古い行は省く）。"""
+        with self.log_lock:
+            available = min(self.log_count - count, len(self.log_lines))
+            lines = list(self.log_lines)[len(self.log_lines) - available:] if available > 0 else []
+            return self.log_count, lines
+
+    def settings(self):
+        return {key: getattr(self, key) for key in SETTING_TYPES}
+
+    def apply_settings(self, settings):
+        """
+        設定を変更する（キーは SETTING_TYPES）。値が正しくなければ ValueError を出し、何も変更しない。
+        """
+        unknown = set(settings) - set(SETTING_TYPES)
+        if unknown:
+            raise ValueError(f"不明な設定項目です: {', '.join(sorted(unknown))}")
+        try:
+            values = {key: SETTING_TYPES[key](value) for key, value in settings.items()}
+        except TypeError as e:
+            raise ValueError(f"設定値の形式が正しくありません: {e}")
+        if values.get("record_interval", self.record_interval) <= 0:
+            raise ValueError("記録間隔は1秒以上にしてください")
+        for key, value in values.items():
+            setattr(self, key, value)
+        if self.run_archive is not None:
+            self.run_archive.update_meta(self.run_metadata())
+        print(f"設定を保存しました: ピラニ1={self.com_port1}, ピラニ2={self.com_port2}, "
+              f"電離真空計={self.com_port3}, 熱電対={self.com_port4}, ヒーター電圧={self.com_port5}, "
+              f"記録間隔={self.record_interval}秒, 目標温度={self.target_temperature}℃, 危険温度={self.danger_temperature}℃, 限界温度={self.limit_temperature}℃")
+
+    def export_excel(self, path):
+        """
+        測定中（測定していなければ最後）の測定アーカイブを path（.xlsx）に書き出す。データが無ければ ValueError。
+        """
+        archive_path = self.archive_path
+        if archive_path is None:
+            raise ValueError("保存するデータがありません")
+        archive = self.run_archive
+        if archive is not None:
+            # 測定スレッドが追記中でも、この時点までの行をチャンクとして書き出してから読む
+            archive.flush()
+        from run_archive import RunArchive
+        reader = RunArchive(archive_path)
+        columns = reader.read_window()
+        if not len(columns["time"]):
+            raise ValueError("保存するデータがありません")
+        values = [columns[c].astype(int).tolist() if c in (FILTER_FLAG_COLUMN, GAP_COLUMN) else columns[c].tolist()
+                  for c in RECORD_COLUMNS]
+        events = [(e["t"], e["label"], e["color"]) for e in reader.events]
+        export_rows_to_excel(path, zip(columns["time"].tolist(), *values), events)
+
+    def state(self):
+        """GUI・制御API向けの現在の状態（JSON にできる値だけ）。グラフ用の系列の長さも含める。"""
+        return {
+            "index": self.index,
+            "name": self.name,
+            "stream_port": self.stream_server.port,
+            "measurement_running": self.measurement_running,
+            "replaying": self.replay is not None,
+            "start_time": self.start_time,
+            "samples": len(self.vacuum_history),
+            "show_substrate_graphs": self.show_substrate_graphs,
+            "analytics": self.analytics_state,
+            "event_markers": [list(marker) for marker in self.event_markers],
+            "data_version": self.data_version,
+            "log_count": self.log_count,
+            "last_replay_summary": self.last_replay_summary,
+            "settings": self.settings(),
+        }
+
+    def get_pirani1_measurement(self):
+        if self.pirani1_ser is None:
+            try:
+                self.pirani1_ser = serial.Serial(self.com_port1, 9600, timeout=1,
+                                                  bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(2)
+                if send_command(self.pirani1_ser, "CO") != "OK":
+                    print("ピラニ1: CO失敗")
+            except Exception as e:
+                print(f"ピラニ1 シリアル接続エラー: {e}")
+                return "Error"
+        try:
+            return send_command(self.pirani1_ser, "P0")
+        except Exception as e:
+            print(f"ピラニ1 測定エラー: {e}")
+            return "Error"
+
+    def get_pirani2_measurement(self):
+        if self.pirani2_ser is None:
+            try:
+                self.pirani2_ser = serial.Serial(self.com_port2, 9600, timeout=1,
+                                                  bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(2)
+                if send_command(self.pirani2_ser, "CO") != "OK":
+                    print("ピラニ2: CO失敗")
+            except Exception as e:
+                print(f"ピラニ2 シリアル接続エラー: {e}")
+                return "Error"
+        try:
+            return send_command(self.pirani2_ser, "P0")
+        except Exception as e:
+            print(f"ピラニ2 測定エラー: {e}")
+            return "Error"
+
+    def get_ion_gauge_measurement(self):
+        if self.ion_ser is None:
+            try:
+                self.ion_ser = serial.Serial(self.com_port3, 9600, timeout=1,
+                                             bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(2)
+                if send_command(self.ion_ser, "RE") != "OK":
+                    print("電離真空計: RE失敗")
+                if send_command(self.ion_ser, "F1") != "OK":
+                    print("電離真空計: F1失敗")
+            except Exception as e:
+                print(f"電離真空計 シリアル接続エラー: {e}")
+                return "Error"
+        try:
+            return send_command(self.ion_ser, "RP")
+        except Exception as e:
+            print(f"電離真空計 測定エラー: {e}")
+            return "Error"
+
+    def get_thermocouple_measurement(self):
+        if self.thermocouple_ser is None:
+            try:
+                self.thermocouple_ser = serial.Serial(self.com_port4, 9600, timeout=1,
+                                                      bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(0.1)
+                self.thermocouple_ser.write(b'MAIN:FUNC DCV\r\n')
+                time.sleep(0.1)
+            except Exception as e:
+                print(f"熱電対 シリアル接続エラー: {e}")
+                return "Error"
+        try:
+            self.thermocouple_ser.write(b'MAIN:MEAS? XNOW\r\n')
+            time.sleep(0.1)
+            response = self.thermocouple_ser.readline().decode().strip()
+            pattern = r'[-+]\d+\.\d+E[-+]\d+'
+            match = re.search(pattern, response)
+            if match:
+                measurement = match.group(0)
+                voltage_V = float(measurement)
+                voltage_uV = voltage_V * 1_000_000
+                try:
+                    temp = self.room_temperature + (voltage_uV / 40.6125)
+                    return str(temp)
+                except Exception as e:
+                    print(f"熱電対 温度変換エラー: {e}")
+                    return "Error"
+            else:
+                print("熱電対: 測定値が見つかりません。")
+                return "Error"
+        except Exception as e:
+            print(f"熱電対 測定エラー: {e}")
+            return "Error"
+
+    def get_heater_voltage_measurement(self):
+        if self.heater_ser is None:
+            try:
+                self.heater_ser = serial.Serial(self.com_port5, 9600, timeout=1,
+                                                bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(0.1)
+                self.heater_ser.write(b'MAIN:FUNC ACV\r\n')
+                time.sleep(0.1)
+            except Exception as e:
+                print(f"ヒーター電圧 シリアル接続エラー: {e}")
+                return "Error"
+        try:
+            self.heater_ser.write(b'MAIN:MEAS? XNOW\r\n')
+            time.sleep(0.1)
+            response = self.heater_ser.readline().decode().strip()
+            pattern = r'[-+]\d+\.\d+E[-+]\d+'
+            match = re.search(pattern, response)
+            if match:
+                measurement = match.group(0)
+                return measurement
+            else:
+                print("ヒーター電圧: 測定値が見つかりません。")
+                return "Error"
+        except Exception as e:
+            print(f"ヒーター電圧 測定エラー: {e}")
+            return "Error"
+
+    def sample_once(self, generation):
+        """
+        1サンプルを測定して記録・通知する（IOScheduler のワーカースレッドで呼ばれる）。
+        次に呼ぶまでの秒数を返す。測定を終えた、または generation が今の測定のものでなければ None を返す
+        （止めてすぐ始め直したときに、前回の分が待ち行列に残っていても2重に測定しない）。
+        測定の終了とは sample_lock で排他するので、終了処理の途中や閉じたログ・アーカイブには書かない。
+        """
+        with self.sample_lock:
+            if not self.measurement_running or generation != self.run_generation:
+                return None
+            return self.measure_sample()
+
+    def measure_sample(self):
+        """sample_once の本体（sample_lock を持って呼ぶ）。"""
+        replay = self.replay
+        if replay is not None:
+            # リプレイ：記録された応答を機器の代わりに使う（時計も記録の時刻まで進む）
+            sample = replay.next_sample()
+            if sample is None:
+                self.finish_replay()
+                return None
+            sample_time, recorded = sample
+            responses = recorded[:len(CHANNEL_COLUMNS)]
+            # 時刻の列が無い（古い）ファイルは、どのチャンネルも行の時刻に読んだものとする
+            reading_times = [sample_time if v == "Error" else float(v) for v in recorded[len(CHANNEL_COLUMNS):]]
+        else:
+            sample_time = self.clock.time()
+            responses, reading_times = [], []
+            for read in (self.get_pirani1_measurement, self.get_pirani2_measurement, self.get_ion_gauge_measurement,
+                         self.get_thermocouple_measurement, self.get_heater_voltage_measurement):
+                responses.append(read())
+                reading_times.append(self.clock.time())   # 読み終えた時刻
+        pirani1_value, pirani2_value, ion_value, thermo_value, heater_value = responses
+        timestamp = datetime.fromtimestamp(sample_time).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+        try: pirani1_val = float(pirani1_value)
+        except: pirani1_val = float('nan')
+        try: pirani2_val = float(pirani2_value)
+        except: pirani2_val = float('nan')
+        try: ion_val = float(ion_value)
+        except: ion_val = float('nan')
+        try: thermo_val = float(thermo_value)
+        except: thermo_val = float('nan')
+        try: heater_val = float(heater_value)
+        except: heater_val = float('nan')
+        raw_values = [pirani1_val, pirani2_val, ion_val, thermo_val, heater_val]
+
+        # スパイク・欠測を補正する。グラフ・予測・アラーム・配信は補正後の値を使い、ファイルには生の値と両方を残す
+        cleaned, flags = self.sensor_filter.update(raw_values)
+        pirani1_val, pirani2_val, ion_val, thermo_val, heater_val = cleaned
+
+        current_time_sec = sample_time - self.start_time
+        self.last_sample_sec = current_time_sec
+        # 値が一定の間は記録しない（変化したら、保たれていた最後の点と今回の点を記録する）
+        sample = (sample_time, current_time_sec, timestamp, raw_values, cleaned, flags, responses, reading_times)
+        for recorded, skipped in self.sampler.offer(current_time_sec, cleaned, sample):
+            self.record_sample(recorded, skipped)
+
+        log_line = (f"{timestamp} | ピラニ1: {pirani1_value} Pa | ピラニ2: {pirani2_value} Pa | "
+                    f"電離: {ion_value} Pa | 温度: {thermo_value} ℃ | 電圧: {heater_value} V")
+        corrections = [f"{c} {'外れ値' if flag == FLAG_OUTLIER else '欠測補完' if flag == FLAG_HOLD else '欠測'}"
+                       for c, flag in zip(CHANNEL_COLUMNS, flags) if flag != FLAG_OK]
+        if corrections:
+            log_line += f" | 補正: {', '.join(corrections)}"
+        self.append_log_line(log_line)
+
+        # 排気・昇温の到達予測を更新（1サンプルあたり O(1)）。速度の推定には各チャンネルを読んだ時刻を使う
+        self.analytics.update_pressure(reading_times[2] - self.start_time, ion_val)
+        if self.show_substrate_graphs:
+            self.analytics.update_temperature(reading_times[3] - self.start_time, thermo_val, heater_val)
+        self.analytics_state = self.analytics.snapshot(self.target_temperature)
+
+        # ----- アラーム・通知処理 -----
+        if self.show_substrate_graphs:
+            # 目標温度(200℃)の通知（1回だけ）
+            try:
+                if thermo_val >= self.target_temperature and not self.notif_200_triggered:
+                    self.alarm(1)
+                    self.notify("基盤温度が200℃になりました")
+                    self.notif_200_triggered = True
+            except Exception as e:
+                print("通知処理エラー（200℃）:", e)
+
+            # 危険温度(250℃)の通知（1回だけ）
+            try:
+                if thermo_val >= self.danger_temperature and not self.notif_250_triggered:
+                    self.alarm(5)
+                    self.notify("基盤温度が250℃になりました")
+                    self.notif_250_triggered = True
+            except Exception as e:
+                print("通知処理エラー（250℃）:", e)
+
+            # 限界温度(300℃)の通知：温度が300℃以上の場合、5分毎に通知する
+            try:
+                if thermo_val >= self.limit_temperature:
+                    now = self.clock.time()
+                    if self.last_300_notif_time is None or (now - self.last_300_notif_time >= 300):
+                        self.alarm(5)
+                        self.notify("基盤温度が300℃を超えました")
+                        self.last_300_notif_time = now
+                else:
+                    # 温度が300℃以下になったら、通知用タイマーをリセット
+                    self.last_300_notif_time = None
+            except Exception as e:
+                print("通知処理エラー（300℃）:", e)
+
+                # 電離真空計関連の通知：各条件とも1回のみ送信
+            try:
+                if ion_val <= 5e-4 and not self.ion_notify_heater:
+                    self.notify(f"ヒーター起動可能（蒸着可能まで{format_eta(self.analytics_state.get('eta_vapor_ready'))}）")
+                    self.ion_notify_heater = True
+                if ion_val <= 2.67e-4 and thermo_val >= 200 and not self.ion_notify_vapor:
+                    self.notify("蒸着可能")
+                    self.ion_notify_vapor = True
+            except Exception as e:
+                print("通知処理エラー電離真空計関連:", e)
+
+            # 到達予測の事前通知（残り時間が FORECAST_NOTICE_SEC を切ったら各1回）
+            try:
+                self.check_forecast_notifications()
+            except Exception as e:
+                print("通知処理エラー到達予測:", e)
+
+            # ヒーター電圧上げ通知（各しきい値：10,20,30,40 V）
+            try:
+                for threshold in [10, 20, 30, 40]:
+                    if heater_val >= threshold:
+                        # しきい値以上の場合
+                        if self.heater_increase_timestamp[threshold] is None:
+                            # 初めてしきい値に達した時刻を記録
+                            self.heater_increase_timestamp[threshold] = self.clock.time()
+                        elif not self.heater_increase_flag[threshold] and self.clock.time() - self.heater_increase_timestamp[threshold] >= 20*60:
+                            # しきい値に達してから20分以上経過している場合に通知
+                            self.notify(f"ヒーター電圧が{threshold}Vになってから20分経過しました (温度 {thermo_val} ℃, 電圧 {heater_val} V)")
+                            self.heater_increase_flag[threshold] = True
+                    else:
+                        # しきい値を下回った場合はタイマーと通知フラグをリセット
+                        self.heater_increase_timestamp[threshold] = None
+                        self.heater_increase_flag[threshold] = False
+            except Exception as e:
+                print("通知処理エラーヒーター:", e)
+
+            # ヒーター電圧下げ通知（基板温度測定終了後）
+            try:
+                if self.basis_ended:
+                    # 初回に最大電圧からの下がりを監視（20V下がったタイミング）
+                    if self.last_decrease_notif_voltage is not None and heater_val <= self.last_decrease_notif_voltage - 20:
+                        if self.last_decrease_notif_timestamp is None:
+                            self.last_decrease_notif_timestamp = self.clock.time()
+                        elif self.clock.time() - self.last_decrease_notif_timestamp >= 20*60:
+                            self.notify(f"ヒーター電圧を下げてください (温度 {thermo_val} ℃, 電圧 {heater_val} V)")
+                            # 更新：次の通知の基準を現在の電圧にする
+                            self.last_decrease_notif_voltage = heater_val
+                            self.last_decrease_notif_timestamp = None
+                    # ヒーター電圧が2V以下になったら下げ通知を停止
+                    if heater_val < 2:
+                        self.basis_ended = False
+            except Exception as e:
+                print("通知処理エラー終了中:", e)
+
+        if replay is not None:
+            # 記録されたボタン操作を、そのサンプルの後に再現する
+            for _, label, color in replay.due_events(sample_time):
+                self.replay_event(label, color)
+
+        self.data_version += 1
+        if replay is not None:
+            return replay.next_delay()
+        return self.sampler.next_interval(current_time_sec, self.record_interval)
+
+    def record_sample(self, sample, skipped):
+        """
+        AdaptiveSampler が記録すると決めたサンプルを、グラフ用の系列・測定ログ・配信・アーカイブに書く。
+        skipped はこのサンプルの前に記録しなかった測定の回数。
+        """
+        sample_time, t, timestamp, raw_values, cleaned, flags, responses, reading_times = sample
+        self.vacuum_history.append(t, cleaned[:3])
+        if self.show_substrate_graphs:
+            self.ion_history.append(t, cleaned[2:3])
+            self.substrate_history.append(t, cleaned[3:])
+        row = [sample_time] + raw_values + cleaned + [pack_flags(flags), skipped] + reading_times
+        self.write_live_log([timestamp] + row)
+        self.publish_live_feed(t, cleaned)
+        self.stream_server.publish(t, cleaned)
+        self.write_run_archive(sample_time, row[1:], responses)
+
+    def flush_samples(self):
+        """記録を保留している最後のサンプルを書く（測定の終了時。値が保たれていた区間の終わりを残す）。"""
+        for sample, skipped in self.sampler.flush():
+            self.record_sample(sample, skipped)
+
+    def check_forecast_notifications(self):
+        forecasts = [
+            ("heater", "eta_heater_ready", "ヒーター起動可能", self.ion_notify_heater),
+            ("vapor", "eta_vapor_ready", "蒸着可能(真空度)", self.ion_notify_vapor),
+            ("target", "eta_target", f"目標温度{self.target_temperature}℃", self.notif_200_triggered),
+        ]
+        for key, eta_key, name, reached in forecasts:
+            eta = self.analytics_state.get(eta_key)
+            if reached or key in self.forecast_notified or eta is None or eta <= 0:
+                continue
+            if eta <= FORECAST_NOTICE_SEC:
+                self.notify(f"予測：{name}まで{format_eta(eta)}")
+                self.forecast_notified.add(key)
+
+    def open_live_log(self):
+        """測定中の値を1行ずつ追記するCSVログを開く。"""
+        try:
+            os.makedirs(LIVE_LOG_DIR, exist_ok=True)
+            path = os.path.join(LIVE_LOG_DIR, datetime.now().strftime(f"{self.file_prefix}_%Y%m%d_%H%M%S.csv"))
+            with self.live_log_lock:
+                self.live_log = open(path, "w", encoding="utf-8-sig", newline="")
+                self.live_log_writer = csv.writer(self.live_log)
+                self.live_log_writer.writerow(EXPORT_COLUMNS)
+                self.live_log.flush()
+                self.live_log_path = path
+            print(f"測定ログ: {path}")
+        except OSError as e:
+            print(f"測定ログ作成エラー: {e}")
+
+    def write_live_log(self, row):
+        """1行を追記してすぐに書き出す（追従側が途中の行を読まないよう行単位でflushする）。"""
+        with self.live_log_lock:
+            if self.live_log is None:
+                return
+            try:
+                # 欠測(NaN)は空欄にする
+                self.live_log_writer.writerow(["" if v != v else v for v in row])
+                self.live_log.flush()
+            except OSError as e:
+                print(f"測定ログ書き込みエラー: {e}")
+
+    def close_live_log(self):
+        with self.live_log_lock:
+            if self.live_log is not None:
+                self.live_log.close()
+            self.live_log = None
+            self.live_log_writer = None
+            self.live_log_path = None
+
+    def open_live_feed(self):
+        """同じPC上のビューア・解析スクリプト向けの共有メモリ配信を開始する。"""
+        self.close_live_feed()
+        with self.live_feed_lock:
+            try:
+                from live_feed import LiveFeedWriter, FEED_NAME
+                name = FEED_NAME if self.index == 0 else f"{FEED_NAME}_{self.index + 1}"
+                self.live_feed = LiveFeedWriter(CHANNEL_COLUMNS, name=name, start_time=self.start_time)
+            except OSError as e:
+                print(f"共有メモリ配信の開始エラー: {e}")
+                self.live_feed = None
+
+    def publish_live_feed(self, t, values):
+        with self.live_feed_lock:
+            if self.live_feed is not None:
+                self.live_feed.publish(t, values)
+
+    def close_live_feed(self):
+        with self.live_feed_lock:
+            if self.live_feed is not None:
+                self.live_feed.close()
+            self.live_feed = None
+
+    def run_metadata(self):
+        """測定アーカイブに保存する設定値。"""
+        return {
+            "start_time": self.start_time,
+            "room_temperature": self.room_temperature,
+            "target_temperature": self.target_temperature,
+            "danger_temperature": self.danger_temperature,
+            "limit_temperature": self.limit_temperature,
+            "heater_ready_pressure": HEATER_READY_PRESSURE,
+            "vapor_ready_pressure": VAPOR_READY_PRESSURE,
+            "record_interval": self.record_interval,
+            "deadbands": CHANNEL_DEADBANDS,
+            "heartbeat": HEARTBEAT,
+            "com_ports": {"ピラニ1": self.com_port1, "ピラニ2": self.com_port2, "電離真空計": self.com_port3,
+                          "熱電対": self.com_port4, "ヒーター電圧": self.com_port5},
+        }
+
+    def open_run_archive(self):
+        """測定アーカイブ（.vdrun）を作成し、以降のサンプル・イベントを追記する。"""
+        self.close_run_archive()
+        try:
+            os.makedirs(RUN_ARCHIVE_DIR, exist_ok=True)
+            path = os.path.join(RUN_ARCHIVE_DIR, datetime.fromtimestamp(self.start_time).strftime(f"{self.file_prefix}_%Y%m%d_%H%M%S.vdrun"))
+            from run_archive import RunArchiveWriter
+            self.run_archive = RunArchiveWriter(path, RECORD_COLUMNS, self.run_metadata())
+            self.archive_path = path
+            print(f"測定アーカイブ: {path}")
+        except OSError as e:
+            print(f"測定アーカイブ作成エラー: {e}")
+            self.run_archive = None
+
+    def write_run_archive(self, t, values, raw):
+        archive = self.run_archive
+        if archive is None:
+            return
+        try:
+            archive.append(t, values, raw)
+        except (OSError, ValueError) as e:
+            print(f"測定アーカイブ書き込みエラー: {e}")
+
+    def close_run_archive(self):
+        archive, self.run_archive = self.run_archive, None
+        if archive is not None:
+            try:
+                archive.close()
+            except OSError as e:
+                print(f"測定アーカイブのクローズエラー: {e}")
+
+    def add_event_marker(self, label, color):
+        """現在の経過秒にイベントマーカーを追加し、共有メモリにも配信する。"""
+        t = self.last_sample_sec
+        self.event_markers.append((t, label, color))
+        self.data_version += 1
+        self.stream_server.publish_event(t, label, color)
+        with self.live_feed_lock:
+            if self.live_feed is not None:
+                self.live_feed.add_event(t, label, color)
+        archive = self.run_archive
+        if archive is not None:
+            archive.add_event(self.start_time + t, label, color)
+        # 測定ログ（CSV）にはサイドカーに残す（Show graph.py・リプレイが読み込む）
+        with self.live_log_lock:
+            if self.live_log_path is not None:
+                try:
+                    append_event_csv(events_sidecar_path(self.live_log_path), self.start_time + t, label, color)
+                except OSError as e:
+                    print(f"測定ログのイベント書き込みエラー: {e}")
+
+    def register_run_catalog(self, path):
+        """終了した測定の要約値を、閉じた測定アーカイブから求めてカタログに登録する。"""
+        try:
+            from run_catalog import RunCatalog, summarize_file
+            path, mtime, summary, events = summarize_file(path)
+            if summary["n_samples"] == 0:
+                return
+            catalog = RunCatalog()
+            catalog.register(path, summary, events, mtime)
+            catalog.close()
+        except Exception as e:
+            print(f"カタログ登録エラー: {e}")
+
+    def end_measurement(self):
+        """測定を終了する。測定中の sample_once が終わるのを待ってから、記録を閉じて機器をローカルに戻す。"""
+        with self.sample_lock:
+            if self.replay is not None:
+                # リプレイを途中で止める（機器・ログ・アーカイブは使っていない）
+                self.finish_replay()
+                return
+            self.measurement_running = False
+            self.flush_samples()
+            self.close_live_log()
+            self.close_live_feed()
+            archive = self.run_archive
+            self.close_run_archive()
+            if archive is not None:
+                self.register_run_catalog(archive.path)
+            if self.ion_ser is not None:
+                try:
+                    send_command(self.ion_ser, "LO")
+                    send_command(self.ion_ser, "MAIN:LOC")
+                except Exception as e:
+                    print(f"電離真空計コマンド送信エラー: {e}")
+            if self.pirani1_ser is not None:
+                try:
+                    send_command(self.pirani1_ser, "CF")
+                except Exception as e:
+                    print(f"ピラニ1 CF送信エラー: {e}")
+            if self.pirani2_ser is not None:
+                try:
+                    send_command(self.pirani2_ser, "CF")
+                except Exception as e:
+                    print(f"ピラニ2 CF送信エラー: {e}")
+            if self.thermocouple_ser is not None:
+                try:
+                    send_command(self.thermocouple_ser, "MAIN:LOC")
+                except Exception as e:
+                    print(f"熱電対 MAIN:LOC送信エラー: {e}")
+
+            for ser in self.connections():
+                if ser is not None:
+                    try:
+                        ser.close()
+                    except Exception as e:
+                        print(f"シリアルポートクローズエラー: {e}")
+            self.ion_ser = self.pirani1_ser = self.pirani2_ser = self.thermocouple_ser = self.heater_ser = None
+            print("測定を停止し、各機器をローカルモードに戻しました。")
+
+    def ports(self):
+        """{役割: COMポート}（役割は CHANNEL_COLUMNS の名前）。"""
+        return dict(zip(CHANNEL_COLUMNS, [self.com_port1, self.com_port2, self.com_port3, self.com_port4, self.com_port5]))
+
+    def connections(self):
+        return [self.pirani1_ser, self.pirani2_ser, self.ion_ser, self.thermocouple_ser, self.heater_ser]
+
+    def discover_ports(self):
+        """
+        測定器のポートを並列に検出し、見つかった役割の COMポートと開いた接続を使う（初期化済みなので getter は開き直さない）。
+        見つからない役割は設定の COMポートのまま。対応（ハードウェアID）は PORT_CACHE に保存し、次回の検出に使う。
+        他のチャンバーが使っている・設定している・前回使ったポートは調べない。{役割: ポート} を返す。
+        ポートを開いて応答を待つので数秒かかる。GUI のスレッドからは呼ばない（VDEM system.py は別スレッドで測定を始める）。
+        """
+        cache = load_port_cache()
+        others = [c for c in self.service.chambers if c is not self]
+        exclude_ports = {ser.port for c in others for ser in c.connections() if ser is not None}
+        exclude_ports.update(port for c in others for port in c.ports().values())
+        exclude_hwids = {hwid for c in others for hwid in cache.get(c.name, {}).values()}
+        try:
+            found = discover(self.ports(), cache.get(self.name), exclude_ports, exclude_hwids)
+        except Exception as e:
+            print(f"ポート検出エラー: {e}")
+            return {}
+        attributes = dict(zip(CHANNEL_COLUMNS, ["pirani1_ser", "pirani2_ser", "ion_ser", "thermocouple_ser", "heater_ser"]))
+        for index, role in enumerate(CHANNEL_COLUMNS):
+            if role not in found:
+                continue
+            device, _, ser = found[role]
+            setattr(self, f"com_port{index + 1}", device)
+            old = getattr(self, attributes[role])
+            if old is not None and old is not ser:
+                try:
+                    old.close()
+                except Exception:
+                    pass
+            setattr(self, attributes[role], ser)
+        # マルチメータは getter と同じ測定機能にしておく
+        for role, command in (("熱電対", b'MAIN:FUNC DCV\r\n'), ("ヒーター電圧", b'MAIN:FUNC ACV\r\n')):
+            if role in found:
+                try:
+                    found[role][2].write(command)
+                except Exception as e:
+                    print(f"{role} 測定機能の設定エラー: {e}")
+        if found:
+            cache[self.name] = {role: hwid for role, (_, hwid, _) in found.items()}
+            save_port_cache(cache)
+        missing = [role for role in CHANNEL_COLUMNS if role not in found]
+        print(f"{self.name} ポート検出: " + ", ".join(f"{role}={found[role][0]}" for role in CHANNEL_COLUMNS if role in found)
+              + (f"（見つからない: {', '.join(missing)} は設定のポートを使う）" if missing else ""))
+        return {role: device for role, (device, _, _) in found.items()}
+
+    def start_measurement(self):
+        """電離真空計に接続して測定を始める。接続できない・測定中のときは RuntimeError を出す。"""
+        if self.measurement_running:
+            raise RuntimeError("既に測定中です")
+        if self.auto_discover:
+            self.discover_ports()
+        if self.ion_ser is None:
+            try:
+                self.ion_ser = serial.Serial(self.com_port3, 9600, timeout=1,
+                                             bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+                time.sleep(2)
+                if send_command(self.ion_ser, "RE") != "OK":
+                    print("電離真空計: RE失敗")
+                if send_command(self.ion_ser, "F1") != "OK":
+                    print("電離真空計: F1失敗")
+            except Exception as e:
+                print(f"電離真空計 シリアル接続オープンエラー: {e}")
+                raise RuntimeError(f"電離真空計に接続できません: {e}")
+
+        with self.sample_lock:
+            # 測定ごとに時計を実時刻に合わせ直す（測定中は単調増加）
+            self.clock = WallClock()
+            self.reset_run_state(self.clock.time())
+            self.open_run_archive()
+            self.open_live_log()
+            self.measurement_running = True
+            self.schedule_sampling()
+
+    def schedule_sampling(self):
+        """新しい世代で測定ループを始める（sample_lock を持って呼ぶ）。"""
+        self.run_generation += 1
+        generation = self.run_generation
+        self.service.scheduler.schedule(lambda: self.sample_once(generation))
+
+    def reset_run_state(self, start_time):
+        """通知フラグ・解析・データを消して、start_time（epoch秒）から新しい測定を始める準備をする。"""
+        self.show_substrate_graphs = False
+        self.baseline_heater_voltage = None
+        self.notif_200_triggered = False
+        self.notif_250_triggered = False
+        self.last_300_notif_time = None
+        self.analytics = ProcessAnalytics()
+        self.analytics_state = {}
+        self.forecast_notified = set()
+        self.sensor_filter.reset()
+        self.sampler.reset()
+        self.last_sample_sec = 0.0
+        self.heater_increase_notif = {10: None, 20: None, 30: None, 40: None}
+        self.ion_notify_heater = False
+        self.ion_notify_vapor = False
+        self.volt_ten = False
+        self.heater_increase_flag = {10: False, 20: False, 30: False, 40: False}
+        self.heater_increase_timestamp = {10: None, 20: None, 30: None, 40: None}
+        self.basis_ended = False
+        self.last_decrease_notif_voltage = None
+        self.last_decrease_notif_timestamp = None
+        self.restore_record_interval()
+
+        self.start_time = start_time
+        self.open_live_feed()
+        self.stream_server.reset(self.start_time)
+        self.vacuum_history = TieredSeries(VACUUM_CHANNELS)
+        self.substrate_history = TieredSeries(SUBSTRATE_CHANNELS)
+        self.ion_history = TieredSeries(["電離真空計"])
+        # イベントマーカーは今回の測定開始からの秒なので、前回の測定分は消す
+        self.event_markers = []
+        self.vapor_events = []
+
+    def restore_record_interval(self):
+        """蒸着中（記録間隔1秒）のまま終わった測定・リプレイの記録間隔を元に戻す。"""
+        if self.vapor_events and self.vapor_events[-1][1] == "blue":
+            self.record_interval = self.original_record_interval
+
+    def notify(self, message):
+        """Discord に通知する。リプレイ中は送らずに記録する。"""
+        replay = self.replay
+        if replay is not None:
+            replay.record("通知", message)
+            return
+        if len(self.service.chambers) > 1:
+            message = f"[{self.name}] {message}"
+        send_discord_notification(message)
+
+    def alarm(self, n):
+        """アラーム音を n 回鳴らす。リプレイ中は鳴らさずに記録する。"""
+        replay = self.replay
+        if replay is not None:
+            replay.record("アラーム", f"{n}回")
+            return
+        alarm_sound(n)
+
+    def replay_event(self, label, color):
+        """記録されたイベントを、そのイベントを記録したボタンの操作として再現する。"""
+        handlers = {
+            "start temperature": self.start_basis,
+            "end temperature": self.end_basis,
+            "start vapor deposition": self.start_vapor_deposition,
+            "end vapor deposition": self.end_vapor_deposition,
+        }
+        if label in handlers:
+            handlers[label]()
+        else:
+            self.add_event_marker(label, color)
+
+    def start_replay(self, path, speed):
+        """
+        記録した測定を speed 倍速（None は最大速度）で測定ループに流す。機器・ログ・アーカイブは使わない。
+        測定中なら RuntimeError、ファイルを読めなければ ValueError を出す。
+        """
+        if self.measurement_running:
+            raise RuntimeError("測定中はリプレイできません")
+        try:
+            source = ReplaySource(path, CHANNEL_COLUMNS + TIME_COLUMNS, speed)
+        except Exception as e:
+            raise ValueError(f"リプレイするファイルの読み込みに失敗しました: {e}")
+        with self.sample_lock:
+            self.replay = source
+            self.clock = source.clock
+            # リプレイはアーカイブに保存しない（archive_path は最後の測定のまま、Excel保存はそれを書き出す）
+            self.reset_run_state(source.start_time)
+            self.measurement_running = True
+            self.schedule_sampling()
+
+    def finish_replay(self):
+        """リプレイの終了時に測定スレッドから呼ぶ。結果を表示し、通常の測定に戻す。"""
+        report = self.replay.finish()
+        self.measurement_running = False
+        self.flush_samples()
+        self.close_live_feed()
+        self.restore_record_interval()
+        self.replay = None
+        self.clock = WallClock()
+        self.last_replay_summary = report.summary()
+        print(self.last_replay_summary)
+        if self.on_replay_finished is not None:
+            self.on_replay_finished(self.last_replay_summary)
+
+    def start_basis(self):  #基板温度測定開始
+        self.show_substrate_graphs = True
+        self.ion_history = TieredSeries(["電離真空計"])
+        self.add_event_marker("start temperature", "green") #self.add_event_marker("イベント名", "色")
+        self.baseline_heater_voltage = self.substrate_history.last("ヒーター電圧", 0)
+        self.notify("基板温度測定を開始しました"
+                                  f"（ヒーター起動可能まで{format_eta(self.analytics_state.get('eta_heater_ready'))}、"
+                                  f"蒸着可能まで{format_eta(self.analytics_state.get('eta_vapor_ready'))}）")
+
+    def end_basis(self):
+        self.show_substrate_graphs = False
+        self.basis_ended = True
+        self.add_event_marker("end temperature", "orange")
+        self.last_decrease_notif_voltage = self.substrate_history.max("ヒーター電圧", 0)
+        self.last_decrease_notif_timestamp = None
+        self.notify("基板温度測定を終了しました")
+
+    def start_vapor_deposition(self):
+        self.record_interval = 1
+        self.vapor_events.append((self.last_sample_sec, 'blue'))
+        self.add_event_marker("start vapor deposition", "blue")
+        self.notify("蒸着開始")
+
+    def end_vapor_deposition(self):
+        self.record_interval = self.original_record_interval
+        self.vapor_events.append((self.last_sample_sec, 'red'))
+        self.add_event_marker("end vapor deposition", "red")
+        self.notify("蒸着終了")
+
+
+class AcquisitionService:
+    """
+    全チャンバーの測定。チャンバーごとの Chamber を作り、共通の IOScheduler で測定を回す。
+    GUI なしで動き、GUI（同じプロセス）や制御API（別プロセスの GUI・スクリプト）から操作する。
+    """
+
+    def __init__(self, chambers=None):
+        chambers = chambers or load_chamber_config()
+        # シリアル通信は応答待ちでブロックするので、ワーカーはチャンバーごとに1つ
+        self.scheduler = IOScheduler(workers=len(chambers))
+        self.chambers = [Chamber(self, index, chamber["name"], chamber["ports"], chamber.get("discover", True))
+                         for index, chamber in enumerate(chambers)]
+
+    def chamber(self, index):
+        if not 0 <= index < len(self.chambers):
+            raise KeyError(f"チャンバー {index} はありません")
+        return self.chambers[index]
+
+    def notify(self, message):
+        """チャンバーを指定しない通知（通知テスト）。"""
+        send_discord_notification(message)
+
+    def shutdown(self):
+        """測定中のチャンバーをすべて終了する（デーモンの終了時）。"""
+        for chamber in self.chambers:
+            if chamber.measurement_running:
+                chamber.end_measurement()
+
+
+def main():
+    """GUI なしで測定する（デーモン）。Ctrl+C で測定中のチャンバーを終了してから止まる。"""
+    import argparse
+    from control_api import ControlServer, CONTROL_PORT
+    from replay import parse_speed
+    parser = argparse.ArgumentParser(description="VDEM 測定デーモン（GUI は VDEM system.py --attach でつなぐ）")
+    parser.add_argument("--port", type=int, default=CONTROL_PORT, help="制御APIのポート")
+    parser.add_argument("--replay", metavar="FILE", help="記録した測定ファイルを1台目のチャンバーに流す（Discord には送らない）")
+    parser.add_argument("--speed", default="max", help="リプレイの速度（1, 10, 1000 などの倍率、または max）")
+    parser.add_argument("--exit", action="store_true", help="リプレイが終わったら結果を表示して終了する")
+    parser.add_argument("--discover", action="store_true", help="測定器のポートを検出して対応を表示し、終了する")
+    args = parser.parse_args()
+
+    service = AcquisitionService()
+    if args.discover:
+        for chamber in service.chambers:
+            chamber.discover_ports()
+            for ser in chamber.connections():
+                if ser is not None:
+                    ser.close()
+        return
+    if not args.replay:
+        # Discord Bot を別スレッドで起動
+        threading.Thread(target=start_discord_bot, daemon=True).start()
+    start_server_loop([ControlServer(service, port=args.port)])
+    finished = threading.Event()
+    if args.replay:
+        chamber = service.chambers[0]
+        if args.exit:
+            chamber.on_replay_finished = lambda summary: finished.set()
+        try:
+            chamber.start_replay(args.replay, parse_speed(args.speed))
+        except (ValueError, RuntimeError) as e:
+            print(f"リプレイエラー: {e}")
+            return
+    print("測定デーモンを起動しました（Ctrl+C で終了）")
+    try:
+        while not finished.is_set():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+適応サンプリング（値が一定のときは記録を間引き、速く変わるときは測定間隔を詰める）
+
+測定ループは測定のたびに補正後の値を AdaptiveSampler.offer() に渡し、返ってきたサンプルだけを記録する。
+    ・記録: どのチャンネルも前回記録した値から不感帯（deadband）の中なら記録しない。
+      不感帯を出たら、直前の記録しなかったサンプル（値が保たれていた最後の点）と今回のサンプルを記録する。
+      HEARTBEAT 秒記録しなければ、変化が無くても記録する。
+    ・測定間隔: どれかのチャンネルの前回からの変化率が slope を超えたら、FAST_HOLD 秒のあいだ
+      FAST_INTERVAL で測定する（記録間隔がそれより短ければ記録間隔のまま）。
+    ・真空度は桁で変わるので log10 の値で比べる（不感帯は桁、変化率は桁/秒）
+
+記録した各行には、その前に記録しなかったサンプル数（acquisition.py の GAP_COLUMN）を付ける。
+記録した点の間の値は前の点から不感帯の中だったので、点を線で結べば不感帯の誤差の範囲で元の系列になる。
+省略数が 0 なのに点の間隔が記録間隔より長い区間は、本当の欠測（測定の停止・通信の途切れ）。
+"""
+import math
+
+# チャンネルごとの設定（acquisition.py の CHANNEL_COLUMNS と同じ名前）。deadband を 0 にすると毎回記録する
+CHANNEL_DEADBANDS = {
+    "ピラニ1": {"log": True, "deadband": 0.02, "slope": 0.01},
+    "ピラニ2": {"log": True, "deadband": 0.02, "slope": 0.01},
+    "電離真空計": {"log": True, "deadband": 0.02, "slope": 0.01},
+    "熱電対": {"log": False, "deadband": 0.5, "slope": 0.2},
+    "ヒーター電圧": {"log": False, "deadband": 0.1, "slope": 0.1},
+}
+HEARTBEAT = 300      # 変化が無くてもこの秒数ごとに1回は記録する
+FAST_INTERVAL = 1    # 速い変化を見つけたときの測定間隔（秒）
+FAST_HOLD = 30       # 速い変化が収まってから記録間隔に戻すまでの秒数
+
+
+class AdaptiveSampler:
+    def __init__(self, channels, deadbands=CHANNEL_DEADBANDS, heartbeat=HEARTBEAT,
+                 fast_interval=FAST_INTERVAL, fast_hold=FAST_HOLD):
+        self.channels = list(channels)
+        settings = [deadbands.get(c, {"log": False, "deadband": 0.0, "slope": math.inf}) for c in self.channels]
+        self.log = [s["log"] for s in settings]
+        self.deadband = [s["deadband"] for s in settings]
+        self.slope = [s["slope"] for s in settings]
+        self.heartbeat = heartbeat
+        self.fast_interval = fast_interval
+        self.fast_hold = fast_hold
+        self.reset()
+
+    def reset(self):
+        self.recorded = None      # 最後に記録した値（比較用の尺度）
+        self.recorded_time = None
+        self.previous = None      # 前回の測定の (時刻, 値)。変化率の計算用
+        self.pending = None       # 記録しなかった最後のサンプル (サンプル, 省略数)
+        self.skipped = 0
+        self.fast_until = None
+
+    def _scaled(self, values):
+        return [(math.log10(v) if v > 0 else math.nan) if log and v == v else v
+                for v, log in zip(values, self.log)]
+
+    @staticmethod
+    def _changed(a, b, band):
+        if a != a or b != b:
+            # 欠測になった・欠測から戻ったときは記録する
+            return (a != a) != (b != b)
+        return abs(a - b) > band
+
+    def offer(self, t, values, sample):
+        """
+        時刻 t（秒）に測定した values を渡し、記録する [(サンプル, 省略数), ...] を返す（0～2件）。
+        sample は記録するときにそのまま返すもの（測定ループが記録に必要な値をまとめて渡す）。
+        """
+        scaled = self._scaled(values)
+        previous, self.previous = self.previous, (t, scaled)
+        if previous is not None and t > previous[0]:
+            dt = t - previous[0]
+            if any(a == a and b == b and abs(a - b) / dt > limit
+                   for a, b, limit in zip(scaled, previous[1], self.slope)):
+                self.fast_until = t + self.fast_hold
+        changed = self.recorded is None or any(self._changed(a, b, band)
+                                               for a, b, band in zip(scaled, self.recorded, self.deadband))
+        if not changed and t - self.recorded_time < self.heartbeat:
+            self.pending = (sample, self.skipped)
+            self.skipped += 1
+            return []
+        records = []
+        if changed and self.pending is not None:
+            # 値が保たれていた最後の点を残してから、変化した点を記録する
+            records.append(self.pending)
+            self.skipped = 0
+        records.append((sample, self.skipped))
+        self.recorded = scaled
+        self.recorded_time = t
+        self.pending = None
+        self.skipped = 0
+        return records
+
+    def flush(self):
+        """記録しなかった最後のサンプルがあれば返す（測定の終了時に、保たれていた区間の終わりを残す）。"""
+        pending, self.pending = self.pending, None
+        self.skipped = 0
+        return [pending] if pending is not None else []
+
+    def next_interval(self, t, record_interval):
+        """時刻 t の測定の後、次に測定するまでの秒数。"""
+        if self.fast_until is not None and t < self.fast_until:
+            return min(record_interval, self.fast_interval)
+        return record_interval
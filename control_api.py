@@ -0,0 +1,322 @@
+"""
+測定デーモンの制御API（HTTP、同じPC内向け）
+
+acquisition.py の AcquisitionService を別プロセスから操作する。GUI（VDEM system.py --attach）は
+ControlClient / RemoteChamber でこの API につなぎ、閉じても測定は止まらない。
+
+    GET  /chambers                         各チャンバーの状態の一覧
+    GET  /chambers/{i}/state               状態（設定・到達予測・イベントマーカーなど）
+    GET  /chambers/{i}/series?名前=uid:数  グラフ用の系列（retention.TieredSeries）の、持っている数より後のサンプル
+    GET  /chambers/{i}/log?since=行数      ログウィンドウの行
+    POST /chambers/{i}/{操作}              start, stop, start_basis, end_basis, start_vapor, end_vapor
+    POST /chambers/{i}/marker              {"label": ..., "color": ...}
+    POST /chambers/{i}/settings            {"record_interval": 5, ...}（acquisition.SETTING_TYPES）
+    POST /chambers/{i}/export              {"path": "...xlsx"}（デーモン側のパス）
+    POST /chambers/{i}/replay              {"path": ..., "speed": 10 または null}
+    POST /notify                           {"message": ...}（Discord 通知のテスト）
+
+エラーは 400（値・状態の誤り）か 404（チャンバーが無い）で、本文がエラーメッセージ。
+"""
+import json
+
+from replay import parse_speed
+from retention import TieredSeries
+
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = 8760
+
+# POST /chambers/{i}/{操作} と Chamber のメソッドの対応
+ACTIONS = {
+    "start": "start_measurement",
+    "stop": "end_measurement",
+    "start_basis": "start_basis",
+    "end_basis": "end_basis",
+    "start_vapor": "start_vapor_deposition",
+    "end_vapor": "end_vapor_deposition",
+}
+
+# GUI が描画に使う系列（Chamber の属性名、いずれも retention.TieredSeries）
+SERIES = ["vacuum_history", "substrate_history", "ion_history"]
+
+
+class ControlError(RuntimeError):
+    """制御APIの呼び出しに失敗した（接続できない、またはデーモンがエラーを返した）。"""
+
+
+class ControlServer:
+    """
+    AcquisitionService を HTTP で操作するサーバー。acquisition.start_server_loop() のイベントループで動かす。
+    測定を操作するメソッドはシリアル通信で待つことがあるので、イベントループを止めないよう別スレッドで実行する。
+    """
+
+    def __init__(self, service, host=CONTROL_HOST, port=CONTROL_PORT):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def start(self):
+        if self.runner is not None:
+            return
+        from aiohttp import web   # 起動を速くするため、サーバーを起動するときに import する
+        app = web.Application()
+        app.router.add_get("/chambers", self.handle_chambers)
+        app.router.add_get("/chambers/{index}/state", self.handle_state)
+        app.router.add_get("/chambers/{index}/series", self.handle_series)
+        app.router.add_get("/chambers/{index}/log", self.handle_log)
+        app.router.add_post("/chambers/{index}/marker", self.handle_marker)
+        app.router.add_post("/chambers/{index}/settings", self.handle_settings)
+        app.router.add_post("/chambers/{index}/export", self.handle_export)
+        app.router.add_post("/chambers/{index}/replay", self.handle_replay)
+        app.router.add_post("/chambers/{index}/{action}", self.handle_action)
+        app.router.add_post("/notify", self.handle_notify)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"制御API: http://{self.host}:{self.port}/chambers")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    # ----- 共通処理 -----
+    @staticmethod
+    def _json(obj):
+        from aiohttp import web
+        return web.Response(text=json.dumps(obj, ensure_ascii=False), content_type="application/json")
+
+    def _chamber(self, request):
+        from aiohttp import web
+        try:
+            return self.service.chamber(int(request.match_info["index"]))
+        except (KeyError, ValueError):
+            raise web.HTTPNotFound(text=f"チャンバー {request.match_info['index']} はありません")
+
+    @staticmethod
+    async def _body(request):
+        from aiohttp import web
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="本文はJSONで指定してください")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="本文はJSONのオブジェクトで指定してください")
+        return body
+
+    @staticmethod
+    async def _call(function, *args):
+        """function をスレッドで実行する。値・状態の誤り（ValueError / RuntimeError）は 400 にする。"""
+        import asyncio
+        from aiohttp import web
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+        except (ValueError, RuntimeError) as e:
+            raise web.HTTPBadRequest(text=str(e))
+
+    # ----- ハンドラ -----
+    async def handle_chambers(self, request):
+        return self._json([chamber.state() for chamber in self.service.chambers])
+
+    async def handle_state(self, request):
+        return self._json(self._chamber(request).state())
+
+    async def handle_series(self, request):
+        """
+        クライアントが持っている系列（uid とサンプル数）の続きのサンプルを返す。
+        系列が作り直された・続きがまとめられていて返せない場合は、系列全体（dump）を返す。
+        """
+        chamber = self._chamber(request)
+        series = {}
+        for name in SERIES:
+            history = getattr(chamber, name)
+            uid, _, count = request.query.get(name, "").partition(":")
+            samples = history.since(int(count)) if uid == history.uid and count.isdigit() else None
+            if samples is None:
+                series[name] = {"uid": history.uid, "full": history.dump()}
+            else:
+                series[name] = {"uid": history.uid, "samples": samples}
+        return self._json({"start_time": chamber.start_time, "series": series})
+
+    async def handle_log(self, request):
+        from aiohttp import web
+        try:
+            since = int(request.query.get("since", 0))
+        except ValueError:
+            raise web.HTTPBadRequest(text="since は行数で指定してください")
+        count, lines = self._chamber(request).log_since(since)
+        return self._json({"count": count, "lines": lines})
+
+    async def handle_action(self, request):
+        from aiohttp import web
+        chamber = self._chamber(request)
+        action = request.match_info["action"]
+        if action not in ACTIONS:
+            raise web.HTTPNotFound(text=f"不明な操作です: {action}")
+        await self._call(getattr(chamber, ACTIONS[action]))
+        return self._json(chamber.state())
+
+    async def handle_marker(self, request):
+        from aiohttp import web
+        chamber = self._chamber(request)
+        body = await self._body(request)
+        if not body.get("label"):
+            raise web.HTTPBadRequest(text="label を指定してください")
+        await self._call(chamber.add_event_marker, str(body["label"]), str(body.get("color", "purple")))
+        return self._json(chamber.state())
+
+    async def handle_settings(self, request):
+        chamber = self._chamber(request)
+        await self._call(chamber.apply_settings, await self._body(request))
+        return self._json(chamber.state())
+
+    async def handle_export(self, request):
+        from aiohttp import web
+        chamber = self._chamber(request)
+        body = await self._body(request)
+        if not body.get("path"):
+            raise web.HTTPBadRequest(text="path を指定してください")
+        try:
+            await self._call(chamber.export_excel, body["path"])
+        except OSError as e:
+            raise web.HTTPBadRequest(text=f"Excelファイルの保存中にエラーが発生しました: {e}")
+        return self._json({"path": body["path"]})
+
+    async def handle_replay(self, request):
+        from aiohttp import web
+        chamber = self._chamber(request)
+        body = await self._body(request)
+        try:
+            speed = parse_speed("max" if body.get("speed") is None else body["speed"])
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        await self._call(chamber.start_replay, str(body.get("path", "")), speed)
+        return self._json(chamber.state())
+
+    async def handle_notify(self, request):
+        body = await self._body(request)
+        await self._call(self.service.notify, str(body.get("message", "テスト通知です")))
+        return self._json({})
+
+
+class ControlClient:
+    """制御APIのクライアント（標準ライブラリの urllib を使う）。失敗すると ControlError を出す。"""
+
+    def __init__(self, url=f"http://{CONTROL_HOST}:{CONTROL_PORT}", timeout=10):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, timeout=None):
+        import urllib.error
+        import urllib.request
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as res:
+                return json.loads(res.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise ControlError(e.read().decode("utf-8", errors="replace") or str(e))
+        except (urllib.error.URLError, OSError) as e:
+            raise ControlError(f"測定デーモン（{self.url}）に接続できません: {e}")
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, body=None, timeout=None):
+        return self.request("POST", path, body if body is not None else {}, timeout)
+
+
+class RemoteChamber:
+    """
+    デーモンのチャンバーを、GUI からは acquisition.Chamber と同じ属性・メソッドで扱えるようにする。
+    poll() で状態と、前回から増えた分の系列を取得する（GUI のグラフ更新ループから呼ぶ）。
+    """
+
+    def __init__(self, client, state):
+        self.client = client
+        self.index = state["index"]
+        self.name = state["name"]
+        self.path = f"/chambers/{self.index}"
+        self.replay = None        # リプレイはデーモン側で行う（描画時間の記録は無し）
+        self.on_replay_finished = None
+        self.start_time = None
+        for name in SERIES:
+            setattr(self, name, TieredSeries([]))
+        self._apply_state(state)
+
+    def _apply_state(self, state):
+        self.measurement_running = state["measurement_running"]
+        self.show_substrate_graphs = state["show_substrate_graphs"]
+        self.analytics_state = state["analytics"]
+        self.event_markers = [tuple(marker) for marker in state["event_markers"]]
+        self.data_version = state["data_version"]
+        self.log_count = state["log_count"]
+        self._settings = state["settings"]
+        for key, value in self._settings.items():
+            setattr(self, key, value)
+        self.replaying = state["replaying"]
+        self.last_replay_summary = state["last_replay_summary"]
+
+    def poll(self):
+        was_replaying = getattr(self, "replaying", False)
+        state = self.client.get(self.path + "/state")
+        query = "&".join(f"{name}={getattr(self, name).uid}:{len(getattr(self, name))}" for name in SERIES)
+        response = self.client.get(f"{self.path}/series?{query}")
+        self.start_time = response["start_time"]
+        for name in SERIES:
+            update = response["series"][name]
+            if "full" in update:
+                # 新しい測定・基板温度測定が始まった、または長く切断していた：系列全体を受け取る
+                setattr(self, name, TieredSeries.load(update["full"]))
+            else:
+                # 続きのサンプルを追加する（古い分のまとめ方はデーモンと同じになる）
+                history = getattr(self, name)
+                for row in update["samples"]:
+                    history.append(row[0], row[1:])
+        self._apply_state(state)
+        if was_replaying and not self.replaying and self.on_replay_finished is not None:
+            self.on_replay_finished(self.last_replay_summary)
+
+    # ----- 操作（Chamber と同じ名前） -----
+    def _post(self, path, body=None, timeout=None):
+        self._apply_state(self.client.post(self.path + path, body, timeout))
+
+    def start_measurement(self):
+        # 電離真空計への接続を待つので長めに待つ
+        self._post("/start", timeout=30)
+
+    def end_measurement(self):
+        self._post("/stop", timeout=30)
+
+    def start_basis(self):
+        self._post("/start_basis")
+
+    def end_basis(self):
+        self._post("/end_basis")
+
+    def start_vapor_deposition(self):
+        self._post("/start_vapor")
+
+    def end_vapor_deposition(self):
+        self._post("/end_vapor")
+
+    def add_event_marker(self, label, color):
+        self._post("/marker", {"label": label, "color": color})
+
+    def settings(self):
+        return dict(self._settings)
+
+    def apply_settings(self, settings):
+        self._post("/settings", settings)
+
+    def export_excel(self, path):
+        self.client.post(self.path + "/export", {"path": path}, timeout=300)
+
+    def start_replay(self, path, speed):
+        self._post("/replay", {"path": path, "speed": speed})
+        self.replaying = True
+
+    def log_since(self, count):
+        response = self.client.get(f"{self.path}/log?since={count}")
+        return response["count"], response["lines"]
@@ -0,0 +1,96 @@
+"""
+グラフ画像の書き出し（Tk のスレッドを止めない）
+
+savefig はデータ点が多いと数秒かかり、その間 GUI が固まる。そこで表示中の Figure を pickle で写し取り、
+ワーカープロセスの Agg で描いて保存する。Tk のスレッドで行うのは pickle だけ。
+
+    exporter = FigureExporter()
+    exporter.submit({"graph_vac.png": fig, ...}, "グラフ保存")
+    for label, paths, errors in exporter.finished():   # GUI の after() ループから呼ぶ
+        ...
+
+形式はファイルの拡張子（.png / .svg / .pdf）で決まる。
+定期・イベントごとの自動スナップショットは snapshot_paths() の名前で SNAPSHOT_DIR に保存する。
+"""
+import os
+import pickle
+from datetime import datetime
+
+EXPORT_WORKERS = 2
+# 保存ダイアログで選べる形式
+EXPORT_FILETYPES = [("PNG Files", "*.png"), ("SVG Files", "*.svg"), ("PDF Files", "*.pdf")]
+# 自動スナップショットの保存先・間隔・形式
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_INTERVAL_MIN = 10
+SNAPSHOT_FORMAT = ".png"
+
+
+def render_figure(data, path, tight_layout=False):
+    """pickle した Figure を Agg で描いて path に保存する（ワーカープロセス用）。"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = pickle.loads(data)
+    FigureCanvasAgg(fig)
+    if tight_layout:
+        fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+def snapshot_paths(prefix, reason, suffixes, when=None):
+    """自動スナップショットのパスのリスト（例: snapshots/チャンバー1_20250101_120000_定期_vac.png）。"""
+    stamp = (when or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    reason = "".join(c if c.isalnum() else "_" for c in reason)
+    return [os.path.join(SNAPSHOT_DIR, f"{prefix}_{stamp}_{reason}{suffix}{SNAPSHOT_FORMAT}") for suffix in suffixes]
+
+
+class FigureExporter:
+    """
+    Figure の保存をワーカープロセスで行う。プロセスは初めて保存するときに起動する。
+    結果は finished() で受け取る（ワーカーの完了通知は別スレッドで来るので、Tk には触らない）。
+    """
+
+    def __init__(self, workers=EXPORT_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.jobs = []   # (ラベル, [(パス, Future), ...])
+
+    def __bool__(self):
+        """保存が終わっていない依頼があれば True。"""
+        return bool(self.jobs)
+
+    def submit(self, figures, label, tight_layout=False):
+        """
+        figures（{パス: Figure}）の現在の内容を写し取り、保存をワーカーに渡す。
+        写し取った後は Figure を描き直してかまわない。tight_layout=True はワーカーで余白を詰めてから保存する
+        （画面に描いていない Figure を渡すとき）。
+        """
+        if self.pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        futures = []
+        for path, fig in figures.items():
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            futures.append((path, self.pool.submit(render_figure, pickle.dumps(fig), path, tight_layout)))
+        self.jobs.append((label, futures))
+
+    def finished(self):
+        """保存が終わった依頼を [(ラベル, 保存したパス, [(パス, エラー), ...]), ...] で返す（依頼した順）。"""
+        done = []
+        while self.jobs and all(future.done() for _, future in self.jobs[0][1]):
+            label, futures = self.jobs.pop(0)
+            paths, errors = [], []
+            for path, future in futures:
+                error = future.exception()
+                if error is None:
+                    paths.append(path)
+                else:
+                    errors.append((path, error))
+            done.append((label, paths, errors))
+        return done
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
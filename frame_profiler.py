@@ -0,0 +1,138 @@
+"""
+描画ループのプロファイル（実行中に切り替え可能）
+
+after() で回しているループ（update_graphs など）の1回ごとの所要時間と、予算（ループの間隔）を
+超えた回数・予定からの遅れを記録する。ループの中は section() で区切り、区間ごとの時間も記録する。
+
+    profiler = FrameProfiler()
+    with profiler.frame("update_graphs", 1.0):
+        with profiler.section("真空度 draw"):
+            canvas.draw()
+
+無効のときは何も記録しない（with の出入りだけ）。toggle_cprofile() で cProfile の記録を開始し、
+もう一度呼ぶと PROFILE_DIR に .prof として書き出す（python -m pstats で読む）。
+cProfile は呼んだスレッド（Tk のメインスレッド）だけを記録する。
+"""
+import cProfile
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = "profiles"
+# オーバーレイに表示する区間の数（平均の長い順）
+OVERLAY_SECTIONS = 8
+
+
+class _Stat:
+    """1つの区間の所要時間（秒）。"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class _LoopStat(_Stat):
+    """after() で回すループ。所要時間に加えて、予算の超過回数と予定からの遅れを持つ。"""
+
+    def __init__(self, budget):
+        super().__init__()
+        self.budget = budget
+        self.overruns = 0
+        self.max_late = 0.0
+        self.next_due = None   # after(budget) で次に呼ばれるはずの時刻
+
+
+class FrameProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.sections = {}
+        self.loops = {}
+        self.profile = None
+
+    def toggle(self):
+        """記録の有効・無効を切り替える。有効にするときは前回の記録を消し、無効にするときは結果を表示する。"""
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.sections.clear()
+            self.loops.clear()
+        else:
+            print(self.summary(sections=None))
+        return self.enabled
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stat = self.sections.get(name)
+            if stat is None:
+                stat = self.sections[name] = _Stat()
+            stat.add(time.perf_counter() - started)
+
+    @contextmanager
+    def frame(self, name, budget):
+        """after(budget 秒) で回すループの1回分。"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        loop = self.loops.get(name)
+        if loop is None:
+            loop = self.loops[name] = _LoopStat(budget)
+        if loop.next_due is not None:
+            # 他の処理が Tk のメインスレッドを使っていると、予定より遅れて呼ばれる
+            loop.max_late = max(loop.max_late, started - loop.next_due)
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            loop.add(finished - started)
+            if finished - started > budget:
+                loop.overruns += 1
+            loop.next_due = finished + budget
+
+    def toggle_cprofile(self):
+        """cProfile の記録を開始・終了する。終了したときは書き出したファイルのパスを返す。"""
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            print("cProfile の記録を開始しました")
+            return None
+        profile, self.profile = self.profile, None
+        profile.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, datetime.now().strftime("frame_%Y%m%d_%H%M%S.prof"))
+        profile.dump_stats(path)
+        print(f"cProfile の記録を保存しました: {path}")
+        return path
+
+    def summary(self, sections=OVERLAY_SECTIONS):
+        """ループと区間の所要時間の一覧（オーバーレイ・終了時の表示用）。sections=None は全区間。"""
+        lines = []
+        for name, loop in self.loops.items():
+            lines.append(f"{name}: {loop.last * 1000:.0f} ms / 予算 {loop.budget * 1000:.0f} ms"
+                         f"（最大 {loop.max * 1000:.0f} ms, 超過 {loop.overruns}/{loop.count} 回, "
+                         f"遅れ最大 {loop.max_late * 1000:.0f} ms）")
+        ranked = sorted(self.sections.items(), key=lambda item: item[1].mean, reverse=True)
+        for name, stat in ranked[:sections]:
+            lines.append(f"  {name}: 平均 {stat.mean * 1000:.1f} ms, 最大 {stat.max * 1000:.1f} ms, 前回 {stat.last * 1000:.1f} ms")
+        if self.profile is not None:
+            lines.append("cProfile 記録中")
+        return "\n".join(lines)
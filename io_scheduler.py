@@ -0,0 +1,56 @@
+"""
+測定の共有スケジューラ
+
+複数のチャンバーの測定を、チャンバーごとのスレッドではなく1つのスケジューラで回す。
+schedule(job, delay) で登録した job は delay 秒後にワーカースレッドで実行され、
+戻り値の秒数後に再び実行される（None を返すと終了）。
+
+シリアル通信は応答待ちでブロックするので、ワーカー数はチャンバー数にする。
+同じ job は前回の実行が終わってから次を登録するので、1つの job が同時に2つ実行されることはない。
+ただし schedule() を呼ぶたびに別の繰り返しになる。止めた測定をすぐ始め直すと前回の job が待ち行列に
+残っていることがあるので、呼び出し側（acquisition.Chamber）は測定ごとの世代を job に持たせ、
+古い世代の job は None を返して終わらせる。
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IOScheduler:
+    def __init__(self, workers=1):
+        self._heap = []   # (実行時刻[monotonic], 登録順, job)
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="measure")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def schedule(self, job, delay=0.0):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), job))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, job = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    # 待つ間に、より早い job が登録されたら起きて並べ直す
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+            self._pool.submit(self._execute, job)
+
+    def _execute(self, job):
+        try:
+            delay = job()
+        except Exception as e:
+            print(f"測定処理エラー: {e}")
+            delay = None
+        if delay is not None:
+            self.schedule(job, delay)
@@ -0,0 +1,188 @@
+"""
+測定データの共有メモリ配信（リングバッファ）
+
+acquisition.py の測定スレッドが書き込み、同じPC上のビューア・解析スクリプトが
+コピーやpickleなしで読み出すための共有メモリ領域。
+
+レイアウト（リトルエンディアン）:
+    ヘッダー   HEADER_FORMAT（マジック, 版, チャンネル数, 容量, イベント容量,
+               シーケンス番号, 書き込みサンプル数, イベント数, 測定開始時刻[epoch秒]）
+    チャンネル名  NAME_SIZE バイト × チャンネル数（UTF-8, NUL詰め）
+    サンプル    float64 [容量, 1 + チャンネル数]（経過秒, 各チャンネル値）
+    イベント    EVENT_DTYPE [イベント容量]（経過秒, ラベル, 色）
+
+シーケンス番号は書き込み中は奇数、書き込み後は偶数になる（seqlock）。
+読み出し側は前後でシーケンス番号が同じ偶数であることを確認して、書き込み途中の値を捨てる。
+"""
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+FEED_NAME = "vdem_live"   # 既定の共有メモリ名
+MAGIC = b"VDEMFEED"
+VERSION = 1
+HEADER_FORMAT = "<8sIIIIQQQd"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+NAME_SIZE = 32
+EVENT_DTYPE = np.dtype([("time", "<f8"), ("label", "S48"), ("color", "S16")])
+
+# ヘッダー内の各フィールドのオフセット
+_SEQ_OFFSET = struct.calcsize("<8sIIII")
+_COUNT_OFFSET = _SEQ_OFFSET + 8
+_EVENT_COUNT_OFFSET = _COUNT_OFFSET + 8
+
+
+def _layout(n_channels, capacity, event_capacity):
+    """(チャンネル名の開始位置, サンプルの開始位置, イベントの開始位置, 全体サイズ) を返す。"""
+    names_start = HEADER_SIZE
+    samples_start = names_start + NAME_SIZE * n_channels
+    samples_start += -samples_start % 8   # float64 の境界に揃える
+    events_start = samples_start + 8 * capacity * (1 + n_channels)
+    total = events_start + EVENT_DTYPE.itemsize * event_capacity
+    return names_start, samples_start, events_start, total
+
+
+class LiveFeedWriter:
+    """測定側：共有メモリを作成し、サンプルとイベントを書き込む（書き込みは1スレッドから行う）。"""
+
+    def __init__(self, channels, name=FEED_NAME, capacity=86400, event_capacity=256, start_time=None):
+        self.channels = list(channels)
+        self.capacity = capacity
+        self.event_capacity = event_capacity
+        names_start, samples_start, events_start, total = _layout(len(self.channels), capacity, event_capacity)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        except FileExistsError:
+            # 前回の測定が異常終了して残っている場合は作り直す
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        buf = self.shm.buf
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, VERSION, len(self.channels), capacity, event_capacity,
+                         0, 0, 0, start_time if start_time is not None else time.time())
+        for i, channel in enumerate(self.channels):
+            encoded = channel.encode("utf-8")[:NAME_SIZE]
+            buf[names_start + i * NAME_SIZE:names_start + i * NAME_SIZE + len(encoded)] = encoded
+        self.samples = np.ndarray((capacity, 1 + len(self.channels)), dtype="<f8", buffer=buf, offset=samples_start)
+        self.events = np.ndarray((event_capacity,), dtype=EVENT_DTYPE, buffer=buf, offset=events_start)
+        self.seq = 0
+        self.count = 0
+        self.event_count = 0
+
+    def _begin(self):
+        self.seq += 1
+        struct.pack_into("<Q", self.shm.buf, _SEQ_OFFSET, self.seq)
+
+    def _end(self):
+        self.seq += 1
+        struct.pack_into("<QQQ", self.shm.buf, _SEQ_OFFSET, self.seq, self.count, self.event_count)
+
+    def publish(self, t, values):
+        """経過秒 t と各チャンネルの値（channels と同じ順）を1サンプル書き込む。"""
+        self._begin()
+        row = self.samples[self.count % self.capacity]
+        row[0] = t
+        row[1:] = values
+        self.count += 1
+        self._end()
+
+    def add_event(self, t, label, color):
+        """イベントマーカーを書き込む。"""
+        self._begin()
+        self.events[self.event_count % self.event_capacity] = (t, label.encode("utf-8")[:48], color.encode("utf-8")[:16])
+        self.event_count += 1
+        self._end()
+
+    def close(self):
+        """共有メモリを解放する（購読側が開いていても名前は削除される）。"""
+        del self.samples, self.events
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class LiveFeedReader:
+    """購読側：既存の共有メモリを開いて読み出す。"""
+
+    def __init__(self, name=FEED_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.12 以前は track 引数がなく、終了時に領域を削除されないよう登録を外す
+            self.shm = shared_memory.SharedMemory(name=name)
+            if sys.platform != "win32":
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        (magic, version, n_channels, self.capacity, self.event_capacity,
+         _, _, _, self.start_time) = struct.unpack_from(HEADER_FORMAT, self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"共有メモリ {name} は測定データの配信領域ではありません")
+        names_start, samples_start, events_start, _ = _layout(n_channels, self.capacity, self.event_capacity)
+        self.channels = [bytes(self.shm.buf[names_start + i * NAME_SIZE:names_start + (i + 1) * NAME_SIZE])
+                         .rstrip(b"\0").decode("utf-8", errors="replace") for i in range(n_channels)]
+        # 共有メモリ上のビュー（コピーなし）
+        self.samples = np.ndarray((self.capacity, 1 + n_channels), dtype="<f8", buffer=self.shm.buf, offset=samples_start)
+        self.events = np.ndarray((self.event_capacity,), dtype=EVENT_DTYPE, buffer=self.shm.buf, offset=events_start)
+
+    def header(self):
+        """(シーケンス番号, 書き込みサンプル数, イベント数) を返す。"""
+        return struct.unpack_from("<QQQ", self.shm.buf, _SEQ_OFFSET)
+
+    def read_since(self, count, retries=100):
+        """
+        書き込みサンプル数 count 以降に追加されたサンプルを返す。
+        Returns:
+            (rows, new_count): rows は [n, 1 + チャンネル数] の配列（新しい分だけコピー）
+        リングが一周して取りこぼした分は読み飛ばす。
+        """
+        for _ in range(retries):
+            seq, total, _ = self.header()
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            start = max(count, total - self.capacity)
+            idx = np.arange(start, total) % self.capacity
+            rows = self.samples[idx]   # 高度なインデックスなのでコピーになる
+            if self.header()[0] == seq:
+                return rows, total
+        raise TimeoutError("共有メモリの読み出しが書き込みと競合し続けました")
+
+    def read_events(self):
+        """記録済みのイベントマーカーを [(経過秒, ラベル, 色), ...] で返す。"""
+        for _ in range(100):
+            seq, _, total = self.header()
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            idx = np.arange(max(0, total - self.event_capacity), total) % self.event_capacity
+            events = self.events[idx]
+            if self.header()[0] == seq:
+                return [(float(e["time"]), e["label"].decode("utf-8", errors="replace"),
+                         e["color"].decode("utf-8", errors="replace")) for e in events]
+        raise TimeoutError("共有メモリの読み出しが書き込みと競合し続けました")
+
+    def close(self):
+        del self.samples, self.events
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    # 簡易モニタ：配信中のサンプルを標準出力に表示する
+    reader = LiveFeedReader(sys.argv[1] if len(sys.argv) > 1 else FEED_NAME)
+    print("チャンネル:", ", ".join(reader.channels))
+    count = 0
+    try:
+        while True:
+            rows, count = reader.read_since(count)
+            for row in rows:
+                print(f"{row[0]:10.1f} s | " + " | ".join(f"{c}: {v:.4g}" for c, v in zip(reader.channels, row[1:])))
+            time.sleep(1)
+    except KeyboardInterrupt:
+        reader.close()
@@ -0,0 +1,156 @@
+"""
+プロセス解析（逐次更新）
+
+測定値を1サンプルずつ受け取り、O(1) の計算で次を推定する。
+    ・真空度の変化率 d(log10 P)/dt（指数重み付きの直線あてはめ）
+    ・排気モデル log10 P = a + b·log10 t（べき乗則）のあてはめと、各しきい値への到達予測時刻
+    ・基板の昇温速度 dT/dt と目標温度への到達予測時刻（ヒーター電圧が変わったらあてはめ直す）
+"""
+import math
+
+# 通知しきい値（acquisition.py のアラーム処理と同じ値）
+HEATER_READY_PRESSURE = 5e-4   # ヒーター起動可能 [Pa]
+VAPOR_READY_PRESSURE = 2.67e-4  # 蒸着可能 [Pa]
+
+
+class EWLinearFit:
+    """
+    指数重み付き最小二乗で y = a + b·x をあてはめる。重みは x が tau 離れるごとに 1/e になる。
+    x の原点を常に最新の点に移しながら重み付き和を更新するので、1点あたり O(1)。
+    """
+
+    def __init__(self, tau):
+        self.tau = tau
+        self.reset()
+
+    def reset(self):
+        self.x_last = None
+        self.s0 = self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def update(self, x, y):
+        if self.x_last is not None:
+            dx = x - self.x_last
+            w = math.exp(-dx / self.tau)
+            # 原点を dx だけ移動してから減衰させる
+            self.sxx = w * (self.sxx - 2 * dx * self.sx + dx * dx * self.s0)
+            self.sxy = w * (self.sxy - dx * self.sy)
+            self.sx = w * (self.sx - dx * self.s0)
+            self.s0 *= w
+            self.sy *= w
+        self.x_last = x
+        self.s0 += 1.0
+        self.sy += y
+        # 最新の点は原点にあるので sx, sxx, sxy には寄与しない
+
+    @property
+    def count(self):
+        return self.s0
+
+    def slope(self):
+        """傾き b。点が足りない・x が揃っていない場合は None。"""
+        det = self.s0 * self.sxx - self.sx * self.sx
+        if self.s0 < 3 or det <= 1e-12 * max(self.s0 * self.sxx, 1e-300):
+            return None
+        return (self.s0 * self.sxy - self.sx * self.sy) / det
+
+    def value_now(self):
+        """最新の x での推定値 a（原点が最新の点なので切片と一致する）。"""
+        b = self.slope()
+        if b is None:
+            return None
+        return (self.sy - b * self.sx) / self.s0
+
+
+class ProcessAnalytics:
+    """測定スレッドから1サンプルずつ update_* を呼び、snapshot() で最新の推定値を取り出す。"""
+
+    def __init__(self, rate_tau=300.0, model_tau=1.0, heating_tau=600.0, voltage_step=1.0):
+        # d(log10 P)/dt：直近 rate_tau 秒程度の傾き
+        self.pressure_rate = EWLinearFit(rate_tau)
+        # 排気モデル：log10 t 上で model_tau（桁）程度の重み
+        self.pumpdown_model = EWLinearFit(model_tau)
+        # 昇温：直近 heating_tau 秒程度の傾き
+        self.heating = EWLinearFit(heating_tau)
+        self.voltage_step = voltage_step
+        self.heating_voltage = None
+        self.t_pressure = None
+        self.log_pressure = None
+        self.t_temperature = None
+        self.temperature = None
+
+    def update_pressure(self, t, pressure):
+        """t: 測定開始からの経過秒, pressure: 電離真空計 [Pa]"""
+        if pressure is None or not pressure > 0 or t <= 0:
+            return
+        log_p = math.log10(pressure)
+        self.t_pressure = t
+        self.log_pressure = log_p
+        self.pressure_rate.update(t, log_p)
+        self.pumpdown_model.update(math.log10(t), log_p)
+
+    def update_temperature(self, t, temperature, heater_voltage):
+        """t: 経過秒, temperature: 熱電対 [℃], heater_voltage: ヒーター電圧 [V]"""
+        if temperature is None or math.isnan(temperature):
+            return
+        if heater_voltage is not None and not math.isnan(heater_voltage):
+            # 電圧を変えたら昇温速度も変わるので、あてはめをやり直す
+            if self.heating_voltage is None or abs(heater_voltage - self.heating_voltage) >= self.voltage_step:
+                self.heating.reset()
+                self.heating_voltage = heater_voltage
+        self.t_temperature = t
+        self.temperature = temperature
+        self.heating.update(t, temperature)
+
+    def pressure_eta(self, threshold):
+        """排気モデルから、しきい値 [Pa] に達するまでの残り秒数を予測する（到達済みは 0、予測不能は None）。"""
+        if self.log_pressure is None:
+            return None
+        log_th = math.log10(threshold)
+        if self.log_pressure <= log_th:
+            return 0.0
+        b = self.pumpdown_model.slope()
+        a = self.pumpdown_model.value_now()
+        if b is None or b >= 0:
+            return None
+        # a は log10(t_now) での推定値なので、log10 t = log10 t_now + (log_th - a) / b
+        log_t = math.log10(self.t_pressure) + (log_th - a) / b
+        if log_t > 9:   # 30年以上先は予測不能とみなす
+            return None
+        return max(10 ** log_t - self.t_pressure, 0.0)
+
+    def heating_eta(self, target):
+        """現在の昇温速度のまま目標温度 [℃] に達するまでの残り秒数（到達済みは 0、予測不能は None）。"""
+        if self.temperature is None:
+            return None
+        if self.temperature >= target:
+            return 0.0
+        rate = self.heating.slope()
+        if rate is None or rate <= 0:
+            return None
+        return (target - self.temperature) / rate
+
+    def snapshot(self, target_temperature):
+        """最新の推定値を辞書で返す（未推定の値は None）。"""
+        rate = self.pressure_rate.slope()
+        heating = self.heating.slope()
+        return {
+            "log_pressure_rate": rate * 60 if rate is not None else None,   # [桁/分]
+            "eta_heater_ready": self.pressure_eta(HEATER_READY_PRESSURE),
+            "eta_vapor_ready": self.pressure_eta(VAPOR_READY_PRESSURE),
+            "heating_rate": heating * 60 if heating is not None else None,  # [℃/分]
+            "heating_voltage": self.heating_voltage,
+            "eta_target": self.heating_eta(target_temperature),
+        }
+
+
+def format_eta(seconds):
+    """残り秒数を通知・グラフ表示用の文字列にする。"""
+    if seconds is None:
+        return "予測不能"
+    if seconds <= 0:
+        return "到達済み"
+    if seconds < 60:
+        return f"約{seconds:.0f}秒"
+    if seconds < 3600:
+        return f"約{seconds / 60:.0f}分"
+    return f"約{seconds / 3600:.1f}時間"
@@ -0,0 +1,183 @@
+"""
+記録した測定のリプレイ
+
+書き出した測定ファイル（.xlsx / .csv / 測定ログ / .vdrun）を acquisition.Chamber の測定ループに
+1サンプルずつ流し込み、アラーム・通知・グラフ更新を実機なしで再現する。
+
+    python "VDEM system.py" --replay runs/run_20250101_090000.vdrun --speed max --exit
+    python acquisition.py --replay runs/run_20250101_090000.vdrun --speed max --exit   （GUI なし）
+
+speed は記録時の何倍の速さで流すか（1, 10, 1000 など）。None（"max"）は待たずに流す。
+時刻は ReplayClock が記録時の epoch秒を返すので、「20分経過」などの判定も記録どおりに進む。
+終了時に処理速度と、発生したアラーム・通知の一覧を ReplayReport として返す。
+"""
+import json
+import math
+import os
+import time
+
+from run_archive import RunArchive
+from run_events import EVENT_COLORS, read_events
+
+
+class WallClock:
+    """
+    実際の時刻（通常の測定）。作成時に1回だけ time.time() に合わせ、以降は単調増加の perf_counter で進める。
+    時刻合わせで時計が戻ってもサンプルの時刻は逆転せず、分解能もマイクロ秒以下になる。
+    """
+
+    def __init__(self):
+        self.anchor = time.time() - time.perf_counter()
+
+    def time(self):
+        return self.anchor + time.perf_counter()
+
+
+class ReplayClock:
+    """記録された時刻を返す時計。ReplaySource がサンプルごとに advance_to() で進める。"""
+
+    def __init__(self, start):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+
+def parse_speed(text):
+    """"1", "10x", "1000×", "max" などを倍率（max は None）に変換する。"""
+    text = str(text).strip().lower()
+    if text in ("max", "最大", ""):
+        return None
+    text = text.rstrip("x×")
+    speed = float(text)
+    if speed <= 0:
+        raise ValueError("速度は正の数で指定してください")
+    return speed
+
+
+def _sidecar_events(path, start):
+    """Show graph.py のサイドカーJSON（run1.xlsx → run1.json）のタイムスタンプをイベントとして読む。"""
+    sidecar = os.path.splitext(path)[0] + ".json"
+    if not os.path.exists(sidecar):
+        return []
+    with open(sidecar, encoding="utf-8") as f:
+        timestamps = json.load(f).get("timestamps", {})
+    return [(start + t, label, EVENT_COLORS.get(label, "purple"))
+            for label, t in timestamps.items() if t is not None]
+
+
+def load_run(path, channels):
+    """
+    測定ファイルを読み、(epoch秒のリスト, {チャンネル名: 値のリスト}, [(epoch秒, ラベル, 色), ...]) を返す。
+    無いチャンネルは NaN（測定ループでは "Error" の応答として扱われる）。
+    イベントは記録されたもの（run_events.read_events）、無ければ Show graph.py のサイドカーJSON から読む。
+    """
+    if path.lower().endswith(".vdrun"):
+        archive = RunArchive(path)
+        columns = archive.read_window(channels=[c for c in channels if c in archive.channels])
+        times = columns.pop("time").tolist()
+        values = {c: columns[c].tolist() if c in columns else [math.nan] * len(times) for c in channels}
+        events = [(e["t"], e["label"], e["color"]) for e in archive.events]
+        return times, values, events
+    import pandas as pd
+    if path.lower().endswith(".csv"):
+        df = pd.read_csv(path, encoding="utf-8-sig", float_precision="round_trip")
+    else:
+        df = pd.read_excel(path)
+    if "Epoch" in df.columns:
+        times = df["Epoch"].astype(float).tolist()
+    else:
+        times = [t.timestamp() for t in pd.to_datetime(df["Timestamp"])]
+    values = {c: pd.to_numeric(df[c], errors="coerce").tolist() if c in df.columns else [math.nan] * len(times)
+              for c in channels}
+    events = read_events(path)
+    if events is None:
+        events = _sidecar_events(path, times[0]) if times else []
+    return times, values, events
+
+
+class ReplayReport:
+    def __init__(self, path, speed):
+        self.path = path
+        self.speed = speed
+        self.samples = 0
+        self.recorded_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.firings = []          # (測定開始からの秒, 種類, 内容)
+        self.redraw_seconds = []   # グラフ更新1回あたりの所要時間
+
+    def summary(self):
+        rate = self.samples / self.wall_seconds if self.wall_seconds > 0 else float("inf")
+        lines = [
+            f"リプレイ: {os.path.basename(self.path)}（{'最大速度' if self.speed is None else f'{self.speed:g}倍速'}）",
+            f"  サンプル数 {self.samples}、記録時間 {self.recorded_seconds:.0f} 秒を実時間 {self.wall_seconds:.2f} 秒で処理"
+            f"（{rate:.0f} サンプル/秒）",
+        ]
+        if self.redraw_seconds:
+            mean = sum(self.redraw_seconds) / len(self.redraw_seconds)
+            lines.append(f"  グラフ更新 {len(self.redraw_seconds)} 回、平均 {mean * 1000:.1f} ms、"
+                         f"最大 {max(self.redraw_seconds) * 1000:.1f} ms")
+        lines.append(f"  アラーム・通知 {len(self.firings)} 件")
+        lines.extend(f"    {t:8.0f} s  {kind}: {message}" for t, kind, message in self.firings)
+        return "\n".join(lines)
+
+
+class ReplaySource:
+    """
+    測定ループにサンプルを供給する。next_sample() は時計を次のサンプルの時刻まで進め、
+    (epoch秒, 応答文字列のリスト) を返す（終わりは None）。
+    next_delay() は speed 倍速で流すために次のサンプルまで待つ実時間（秒）を返す。
+    記録されたイベントは due_events() で、サンプルを処理した後に取り出す（ボタン操作はサンプルの間に行われるため）。
+    """
+
+    def __init__(self, path, channels, speed=None):
+        self.path = path
+        self.channels = list(channels)
+        self.times, self.values, events = load_run(path, self.channels)
+        if not self.times:
+            raise ValueError(f"{path} にサンプルがありません")
+        self.events = sorted(events)
+        self.start_time = self.times[0]
+        self.speed = speed
+        self.clock = ReplayClock(self.start_time)
+        self.report = ReplayReport(path, speed)
+        self.index = 0
+        self._event_index = 0
+        self._wall_start = time.perf_counter()
+
+    def next_sample(self):
+        if self.index >= len(self.times):
+            return None
+        i = self.index
+        self.index += 1
+        t = self.times[i]
+        self.clock.advance_to(t)
+        # 実機の応答と同じく文字列で渡す（欠測は "Error"）
+        raw = ["Error" if v != v else repr(float(v)) for v in (self.values[c][i] for c in self.channels)]
+        return t, raw
+
+    def next_delay(self):
+        if self.speed is None or self.index >= len(self.times):
+            return 0.0
+        target = self._wall_start + (self.times[self.index] - self.start_time) / self.speed
+        return max(target - time.perf_counter(), 0.0)
+
+    def due_events(self, t):
+        """時刻 t（epoch秒）までに記録されたイベントのうち、まだ返していないものを返す。"""
+        due = []
+        while self._event_index < len(self.events) and self.events[self._event_index][0] <= t:
+            due.append(self.events[self._event_index])
+            self._event_index += 1
+        return due
+
+    def record(self, kind, message):
+        self.report.firings.append((self.clock.time() - self.start_time, kind, message))
+
+    def finish(self):
+        self.report.samples = self.index
+        self.report.recorded_seconds = self.times[self.index - 1] - self.start_time if self.index else 0.0
+        self.report.wall_seconds = time.perf_counter() - self._wall_start
+        return self.report
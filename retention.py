@@ -0,0 +1,200 @@
+"""
+測定値の段階的な保持（長時間の測定でもメモリとグラフの描画量を一定にする）
+
+直近 RAW_WINDOW 秒は全サンプルを保持し、それより古い分は RETENTION_TIERS の幅のバケットに
+min / mean / max でまとめる。段の上限を超えたバケットは次の段（より広い幅）にまとめ、
+最後の段が上限を超えたらバケットの幅を2倍にしてまとめ直す。全サンプルは測定アーカイブ（.vdrun）にある。
+
+    72時間（1秒間隔）でも、保持するのは直近2時間の全サンプル + 1分バケット1440個 + 10分以上のバケット最大2000個。
+
+まとめ方は追加したサンプルの時刻だけで決まるので、同じサンプルを同じ順に追加すれば同じ結果になる
+（GUI クライアントは dump() を1回受け取った後、サンプルを追加していけばデーモンと同じ内容になる）。
+"""
+import bisect
+import math
+import os
+import threading
+from collections import deque
+
+RAW_WINDOW = 2 * 3600          # 全サンプルを保持する秒数
+RETENTION_TIERS = [(60, 1440), (600, 2000)]   # (バケットの幅[秒], バケット数の上限)
+
+
+class _Bucket:
+    """1つのバケット。チャンネルごとの有効値の数・最小・合計・最大と、時刻の合計を持つ。"""
+
+    __slots__ = ("start", "t_sum", "n", "count", "min", "sum", "max")
+
+    def __init__(self, start, t_sum, n, count, mins, sums, maxs):
+        self.start = start
+        self.t_sum = t_sum
+        self.n = n
+        self.count = count
+        self.min = mins
+        self.sum = sums
+        self.max = maxs
+
+    @classmethod
+    def of_sample(cls, start, t, values):
+        finite = [v == v for v in values]
+        return cls(start, t, 1, [int(f) for f in finite],
+                   [v if f else math.inf for v, f in zip(values, finite)],
+                   [v if f else 0.0 for v, f in zip(values, finite)],
+                   [v if f else -math.inf for v, f in zip(values, finite)])
+
+    def merge(self, other):
+        self.t_sum += other.t_sum
+        self.n += other.n
+        for i in range(len(self.count)):
+            self.count[i] += other.count[i]
+            self.min[i] = min(self.min[i], other.min[i])
+            self.sum[i] += other.sum[i]
+            self.max[i] = max(self.max[i], other.max[i])
+
+    def dump(self):
+        return [self.start, self.t_sum, self.n, self.count, self.min, self.sum, self.max]
+
+
+class TieredSeries:
+    """
+    経過秒と複数チャンネルの値の系列。append() で1サンプルずつ追加し、columns() でグラフ用の列を取り出す。
+    測定スレッドが追加し、GUI・制御APIが読む（まとめている途中を読まないようロックする）。
+    """
+
+    def __init__(self, channels, raw_window=RAW_WINDOW, tiers=RETENTION_TIERS):
+        self.channels = list(channels)
+        self.raw_window = raw_window
+        self.widths = [width for width, _ in tiers]
+        self.capacities = [capacity for _, capacity in tiers]
+        self.raw = deque()                       # (経過秒, (値, ...))
+        self.tiers = [deque() for _ in tiers]    # 古い段ほど後ろ。各段の中は古い順
+        self.count = 0   # これまでに追加したサンプル数（raw の先頭は count - len(raw) 番目）
+        # 作り直した系列をクライアントが見分けるための識別子（デーモンを再起動しても重ならないよう乱数）
+        self.uid = os.urandom(4).hex()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, values):
+        with self._lock:
+            self.raw.append((t, tuple(values)))
+            self.count += 1
+            # 1バケット分たまってからまとめる（まとめる回数を減らし、クライアントとの同期も単純にする）
+            if t - self.raw[0][0] > self.raw_window + self.widths[0]:
+                self._fold(t - self.raw_window)
+
+    def _fold(self, cutoff):
+        width = self.widths[0]
+        boundary = math.floor(cutoff / width) * width
+        while self.raw and self.raw[0][0] < boundary:
+            t, values = self.raw.popleft()
+            self._add(0, _Bucket.of_sample(math.floor(t / width) * width, t, values))
+        for i in range(len(self.tiers) - 1):
+            while len(self.tiers[i]) > self.capacities[i]:
+                self._add(i + 1, self.tiers[i].popleft())
+        last = len(self.tiers) - 1
+        if len(self.tiers[last]) > self.capacities[last]:
+            # 最後の段は幅を2倍にしてまとめ直す（上限の半分程度になる）
+            self.widths[last] *= 2
+            buckets, self.tiers[last] = self.tiers[last], deque()
+            for bucket in buckets:
+                self._add(last, bucket)
+
+    def _add(self, tier, bucket):
+        width = self.widths[tier]
+        bucket.start = math.floor(bucket.start / width) * width
+        buckets = self.tiers[tier]
+        if buckets and buckets[-1].start == bucket.start:
+            buckets[-1].merge(bucket)
+        else:
+            buckets.append(bucket)
+
+    # ----- 読み出し -----
+    def columns(self, channel):
+        """
+        channel の (時刻, 平均, 最小, 最大, まとめた点の数) を古い順に返す。
+        先頭の「まとめた点の数」個がバケット（時刻はバケット内の平均）、残りが全サンプル（最小=最大=値）。
+        """
+        i = self.channels.index(channel)
+        times, means, mins, maxs = [], [], [], []
+        with self._lock:
+            for buckets in reversed(self.tiers):
+                for b in buckets:
+                    times.append(b.t_sum / b.n)
+                    if b.count[i]:
+                        means.append(b.sum[i] / b.count[i])
+                        mins.append(b.min[i])
+                        maxs.append(b.max[i])
+                    else:
+                        means.append(math.nan)
+                        mins.append(math.nan)
+                        maxs.append(math.nan)
+            n_aggregated = len(times)
+            for t, values in self.raw:
+                times.append(t)
+                means.append(values[i])
+        mins.extend(means[n_aggregated:])
+        maxs.extend(means[n_aggregated:])
+        return times, means, mins, maxs, n_aggregated
+
+    def last(self, channel, default=None):
+        """最後に追加した値（無ければ default）。"""
+        raw = self.raw
+        return raw[-1][1][self.channels.index(channel)] if raw else default
+
+    def last_time(self, default=None):
+        raw = self.raw
+        return raw[-1][0] if raw else default
+
+    def max(self, channel, default=None):
+        """これまでの最大値（欠測を除く。無ければ default）。"""
+        i = self.channels.index(channel)
+        with self._lock:
+            values = [b.max[i] for buckets in self.tiers for b in buckets if b.count[i]]
+            values.extend(v[i] for _, v in self.raw if v[i] == v[i])
+        return max(values) if values else default
+
+    # ----- クライアントとの同期 -----
+    def since(self, index):
+        """index 番目以降のサンプルを [[時刻, 値, ...], ...] で返す。既にまとめた分を含む場合は None。"""
+        with self._lock:
+            raw = list(self.raw)
+            count = self.count
+        first = count - len(raw)
+        if index < first or index > count:
+            return None
+        return [[t] + list(values) for t, values in raw[index - first:]]
+
+    def dump(self):
+        with self._lock:
+            return {
+                "channels": self.channels,
+                "raw_window": self.raw_window,
+                "widths": list(self.widths),
+                "capacities": self.capacities,
+                "count": self.count,
+                "uid": self.uid,
+                "raw": [[t] + list(values) for t, values in self.raw],
+                "tiers": [[b.dump() for b in buckets] for buckets in self.tiers],
+            }
+
+    @classmethod
+    def load(cls, dumped):
+        series = cls(dumped["channels"], dumped["raw_window"], list(zip(dumped["widths"], dumped["capacities"])))
+        series.count = dumped["count"]
+        series.uid = dumped["uid"]
+        series.raw = deque((row[0], tuple(row[1:])) for row in dumped["raw"])
+        series.tiers = [deque(_Bucket(*b) for b in buckets) for buckets in dumped["tiers"]]
+        return series
+
+
+def nearest(times, values, t, default=None):
+    """昇順の times の中で t に最も近い点の値を返す（グラフのイベントマーカーの位置用）。"""
+    if not times:
+        return default
+    i = bisect.bisect_left(times, t)
+    if i == len(times) or (i > 0 and t - times[i - 1] < times[i] - t):
+        i -= 1
+    value = values[i]
+    return default if value != value else value
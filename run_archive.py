@@ -0,0 +1,227 @@
+"""
+測定ランのアーカイブ形式（.vdrun）
+
+.xlsx では失われるイベントマーカー・設定値・機器の生の応答文字列も含めて1ファイルに保存する。
+測定中に追記でき、閉じるときに時間→チャンクの索引を末尾に書く。
+
+ファイル構成:
+    MAGIC
+    レコードの並び: レコード種別(4バイト) + 長さ(uint32) + 本体
+        META  設定などのメタデータ（JSON）。複数ある場合は後のものが優先
+        CHNK  サンプルのチャンク: CHUNK_HEADER(最初と最後の時刻, サンプル数, 列数)
+              + 各列の圧縮後の長さ(uint32 × 列数) + 列ごとに zlib 圧縮した float64 配列
+              （列は [時刻(epoch秒), チャンネル1, ...]）
+        RAWS  直前のチャンクに対応する生の応答文字列（zlib 圧縮した JSON）
+        EVNT  イベントマーカー（JSON: {"t": epoch秒, "label": ..., "color": ...}）
+        INDX  索引（JSON）。close() で書かれる
+    TRAILER: 索引レコードの位置(uint64) + INDEX_MAGIC
+
+索引が無いファイル（測定中や異常終了したもの）はレコードを先頭から走査して開く。
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+MAGIC = b"VDEMRUN1"
+INDEX_MAGIC = b"VDEMINDX"
+RECORD_HEADER = "<4sI"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER)
+CHUNK_HEADER = "<ddII"
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER)
+TRAILER = "<Q8s"
+TRAILER_SIZE = struct.calcsize(TRAILER)
+CHUNK_SIZE = 256   # 1チャンクあたりのサンプル数
+
+
+class RunArchiveWriter:
+    """測定中にサンプル・イベント・設定を追記する。append() などはどのスレッドから呼んでもよい。"""
+
+    def __init__(self, path, channels, meta=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.channels = list(channels)
+        self.chunk_size = chunk_size
+        self.chunks = []    # 索引: [最初の時刻, 最後の時刻, レコード位置, サンプル数]
+        self.meta_offset = None
+        self._rows = []
+        self._raws = []
+        self._lock = threading.Lock()
+        self.f = open(path, "wb")
+        self.f.write(MAGIC)
+        self.update_meta(meta or {})
+
+    def _write_record(self, tag, payload):
+        offset = self.f.tell()
+        self.f.write(struct.pack(RECORD_HEADER, tag, len(payload)))
+        self.f.write(payload)
+        return offset
+
+    def update_meta(self, meta):
+        """メタデータ（設定値など）を書く。測定中に設定を変えた場合も呼ぶ。"""
+        meta = dict(meta, channels=self.channels)
+        with self._lock:
+            self.meta_offset = self._write_record(b"META", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            self.f.flush()
+
+    def append(self, t, values, raw=None):
+        """t: epoch秒, values: 各チャンネルの数値, raw: 機器の生の応答文字列のリスト（省略可）"""
+        with self._lock:
+            self._rows.append([t] + list(values))
+            self._raws.append(raw)
+            if len(self._rows) >= self.chunk_size:
+                self._flush_chunk()
+
+    def add_event(self, t, label, color):
+        with self._lock:
+            event = {"t": t, "label": label, "color": color}
+            self._write_record(b"EVNT", json.dumps(event, ensure_ascii=False).encode("utf-8"))
+            self.f.flush()
+
+    def _flush_chunk(self):
+        if not self._rows:
+            return
+        block = np.array(self._rows, dtype="<f8")
+        columns = [zlib.compress(np.ascontiguousarray(block[:, i]).tobytes()) for i in range(block.shape[1])]
+        payload = (struct.pack(CHUNK_HEADER, block[0, 0], block[-1, 0], len(block), block.shape[1])
+                   + struct.pack(f"<{len(columns)}I", *[len(c) for c in columns]) + b"".join(columns))
+        offset = self._write_record(b"CHNK", payload)
+        self.chunks.append([float(block[0, 0]), float(block[-1, 0]), offset, len(block)])
+        if any(r is not None for r in self._raws):
+            self._write_record(b"RAWS", zlib.compress(json.dumps(self._raws, ensure_ascii=False).encode("utf-8")))
+        self._rows = []
+        self._raws = []
+        self.f.flush()
+
+    def flush(self):
+        """途中のサンプルもチャンクとして書き出す。"""
+        with self._lock:
+            self._flush_chunk()
+
+    def close(self):
+        with self._lock:
+            if self.f.closed:
+                return
+            self._flush_chunk()
+            index = {"chunks": self.chunks, "meta_offset": self.meta_offset}
+            offset = self._write_record(b"INDX", json.dumps(index).encode("utf-8"))
+            self.f.write(struct.pack(TRAILER, offset, INDEX_MAGIC))
+            self.f.close()
+
+
+class RunArchive:
+    """.vdrun ファイルを開き、指定した時間範囲のチャンクだけを展開して読む。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.events = []
+        self.chunks = []
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} は測定アーカイブではありません")
+            if not self._load_index(f):
+                self._scan(f)
+        self.channels = self.meta.get("channels", [])
+
+    def _read_record(self, f, offset):
+        f.seek(offset)
+        header = f.read(RECORD_HEADER_SIZE)
+        if len(header) < RECORD_HEADER_SIZE:
+            return None, None
+        tag, length = struct.unpack(RECORD_HEADER, header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return None, None   # 書き込み途中のレコード
+        return tag, payload
+
+    def _load_index(self, f):
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC) + TRAILER_SIZE:
+            return False
+        f.seek(size - TRAILER_SIZE)
+        offset, magic = struct.unpack(TRAILER, f.read(TRAILER_SIZE))
+        if magic != INDEX_MAGIC:
+            return False
+        tag, payload = self._read_record(f, offset)
+        if tag != b"INDX":
+            return False
+        index = json.loads(payload)
+        self.chunks = index["chunks"]
+        if index.get("meta_offset") is not None:
+            self.meta = json.loads(self._read_record(f, index["meta_offset"])[1])
+        # イベントは件数が少ないので、索引の範囲のレコード種別だけを見て読み込む
+        self._scan(f, events_only=True, end=offset)
+        return True
+
+    def _scan(self, f, events_only=False, end=None):
+        offset = len(MAGIC)
+        while end is None or offset < end:
+            tag, payload = self._read_record(f, offset)
+            if tag is None:
+                break
+            if tag == b"EVNT":
+                self.events.append(json.loads(payload))
+            elif not events_only:
+                if tag == b"META":
+                    self.meta = json.loads(payload)
+                elif tag == b"CHNK":
+                    t_first, t_last, n, _ = struct.unpack_from(CHUNK_HEADER, payload)
+                    self.chunks.append([t_first, t_last, offset, n])
+            offset += RECORD_HEADER_SIZE + len(payload)
+
+    def time_range(self):
+        """(最初の時刻, 最後の時刻) を epoch秒で返す。サンプルが無ければ None。"""
+        if not self.chunks:
+            return None
+        return self.chunks[0][0], self.chunks[-1][1]
+
+    def _overlapping(self, t0, t1):
+        return [c for c in self.chunks if (t0 is None or c[1] >= t0) and (t1 is None or c[0] <= t1)]
+
+    def read_window(self, t0=None, t1=None, channels=None):
+        """
+        t0〜t1（epoch秒、None は端まで）のサンプルを {"time": 配列, チャンネル名: 配列} で返す。
+        範囲に重なるチャンクの、指定したチャンネルの列だけを展開する。
+        """
+        channels = self.channels if channels is None else channels
+        wanted = [0] + [1 + self.channels.index(c) for c in channels]
+        parts = {i: [] for i in wanted}
+        with open(self.path, "rb") as f:
+            for _, _, offset, _ in self._overlapping(t0, t1):
+                _, payload = self._read_record(f, offset)
+                _, _, n, n_cols = struct.unpack_from(CHUNK_HEADER, payload)
+                lengths = struct.unpack_from(f"<{n_cols}I", payload, CHUNK_HEADER_SIZE)
+                position = CHUNK_HEADER_SIZE + 4 * n_cols
+                for i, length in enumerate(lengths):
+                    if i in parts:
+                        parts[i].append(np.frombuffer(zlib.decompress(payload[position:position + length]), dtype="<f8"))
+                    position += length
+        columns = {i: np.concatenate(p) if p else np.empty(0) for i, p in parts.items()}
+        mask = np.ones(len(columns[0]), dtype=bool)
+        if t0 is not None:
+            mask &= columns[0] >= t0
+        if t1 is not None:
+            mask &= columns[0] <= t1
+        result = {"time": columns[0][mask]}
+        for c, i in zip(channels, wanted[1:]):
+            result[c] = columns[i][mask]
+        return result
+
+    def read_raw(self, t0=None, t1=None):
+        """t0〜t1 を含むチャンクの生の応答文字列を [(epoch秒, [文字列...]), ...] で返す。"""
+        rows = []
+        with open(self.path, "rb") as f:
+            for _, _, offset, _ in self._overlapping(t0, t1):
+                _, payload = self._read_record(f, offset)
+                _, _, n, n_cols = struct.unpack_from(CHUNK_HEADER, payload)
+                time_length = struct.unpack_from("<I", payload, CHUNK_HEADER_SIZE)[0]
+                position = CHUNK_HEADER_SIZE + 4 * n_cols
+                times = np.frombuffer(zlib.decompress(payload[position:position + time_length]), dtype="<f8")
+                tag, raw_payload = self._read_record(f, offset + RECORD_HEADER_SIZE + len(payload))
+                raws = json.loads(zlib.decompress(raw_payload)) if tag == b"RAWS" else [None] * n
+                rows.extend((float(t), raw) for t, raw in zip(times, raws)
+                            if (t0 is None or t >= t0) and (t1 is None or t <= t1))
+        return rows
@@ -0,0 +1,318 @@
+"""
+測定ランのカタログ（SQLite）
+
+測定ごとの要約値（最低圧力・最高温度・しきい値到達時間・蒸着時間・イベント時刻）を登録し、
+「基板温度が250℃を超えたラン」「2.67e-4 Pa までの排気が最も速いラン」などを索引付きで検索する。
+
+    python run_catalog.py index フォルダ [--workers N]   既存の .xlsx / .csv / .vdrun を一括登録
+    python run_catalog.py query [--min-temp 250] [--max-pressure 1e-4] [--fastest-pumpdown] [--limit 20]
+
+1つの測定は .vdrun・測定ログ（.csv）・Excel 書き出しの3つのファイルになることがある。
+同じ測定（開始・終了時刻とサンプル数が同じ）は RUN_PRIORITY の最も高いファイルだけを runs に登録し、
+残りは duplicates に記録する（一括登録で毎回要約し直さないため）。
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from process_analytics import HEATER_READY_PRESSURE, VAPOR_READY_PRESSURE
+from run_archive import RunArchive
+from run_events import read_events, detect_events, GAP_COLUMN
+
+CATALOG_PATH = "run_catalog.sqlite3"
+RUN_EXTENSIONS = (".vdrun", ".xlsx", ".xls", ".csv")
+# 同じ測定のファイルが複数あるときに登録する順（小さいほど優先。.vdrun は設定・生の応答も含む）
+RUN_PRIORITY = {".vdrun": 0, ".xlsx": 1, ".xls": 1, ".csv": 2}
+# 同じ測定とみなす開始時刻のずれ [秒]（.vdrun は測定開始、ほかは最初のサンプルの時刻）と終了時刻のずれ
+SAME_RUN_START_SECONDS = 5.0
+SAME_RUN_END_SECONDS = 1e-3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    source_mtime REAL,
+    started_at REAL,
+    ended_at REAL,
+    n_samples INTEGER,
+    min_pressure REAL,
+    max_temperature REAL,
+    time_to_heater_ready REAL,
+    time_to_vapor_ready REAL,
+    deposition_start REAL,
+    deposition_end REAL,
+    deposition_duration REAL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_min_pressure ON runs(min_pressure);
+CREATE INDEX IF NOT EXISTS idx_runs_max_temperature ON runs(max_temperature);
+CREATE INDEX IF NOT EXISTS idx_runs_time_to_vapor_ready ON runs(time_to_vapor_ready);
+CREATE TABLE IF NOT EXISTS events (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    t REAL,
+    label TEXT,
+    color TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_run ON events(run_id);
+CREATE INDEX IF NOT EXISTS idx_events_label ON events(label, t);
+CREATE TABLE IF NOT EXISTS duplicates (
+    path TEXT PRIMARY KEY,
+    source_mtime REAL,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE
+);
+"""
+
+
+def _first_time_below(elapsed, pressure, threshold):
+    hits = np.flatnonzero(pressure <= threshold)
+    return float(elapsed[hits[0]]) if len(hits) else None
+
+
+def _nan_to_none(value):
+    return None if value is None or value != value else float(value)
+
+
+def summarize(times, pressure, temperature, events=(), meta=None):
+    """
+    1ランの要約値を計算する。
+    times: epoch秒の配列, pressure: 電離真空計 [Pa], temperature: 熱電対 [℃],
+    events: [(測定開始からの秒, ラベル, 色), ...]
+    時間はいずれも測定開始からの秒。
+    """
+    times = np.asarray(times, dtype=float)
+    pressure = np.asarray(pressure, dtype=float)
+    temperature = np.asarray(temperature, dtype=float)
+    meta = meta or {}
+    start = meta.get("start_time") or (float(times[0]) if len(times) else None)
+    elapsed = times - start if len(times) else times
+    event_times = {label: t for t, label, _ in events}
+    deposition_start = event_times.get("start vapor deposition")
+    deposition_end = event_times.get("end vapor deposition")
+    with np.errstate(all="ignore"):
+        min_pressure = np.nanmin(pressure) if np.isfinite(pressure).any() else None
+        max_temperature = np.nanmax(temperature) if np.isfinite(temperature).any() else None
+    return {
+        "started_at": start,
+        "ended_at": float(times[-1]) if len(times) else None,
+        "n_samples": int(len(times)),
+        "min_pressure": _nan_to_none(min_pressure),
+        "max_temperature": _nan_to_none(max_temperature),
+        "time_to_heater_ready": _first_time_below(elapsed, pressure, HEATER_READY_PRESSURE),
+        "time_to_vapor_ready": _first_time_below(elapsed, pressure, VAPOR_READY_PRESSURE),
+        "deposition_start": deposition_start,
+        "deposition_end": deposition_end,
+        "deposition_duration": (deposition_end - deposition_start
+                                if deposition_start is not None and deposition_end is not None else None),
+        "meta": json.dumps(meta, ensure_ascii=False),
+    }
+
+
+def _cleaned_column(columns, channel):
+    """補正後の列（例: "熱電対(補正)"）があればその名前を、無ければ（古いファイル）生の列名を返す。"""
+    cleaned = channel + "(補正)"
+    return cleaned if cleaned in columns else channel
+
+
+def run_priority(path):
+    return RUN_PRIORITY.get(os.path.splitext(path)[1].lower(), len(RUN_PRIORITY))
+
+
+def _run_events(path, times, start, heater, temperature, pressure, adaptive):
+    """記録されたイベント（無ければ記録値から推定したもの）を [(測定開始からの秒, ラベル, 色), ...] で返す。"""
+    recorded = read_events(path)
+    if recorded is not None:
+        return [(t - start, label, color) for t, label, color in recorded]
+    return detect_events(np.asarray(times, dtype=float) - start, heater, temperature, pressure, adaptive)
+
+
+def summarize_file(path):
+    """測定ファイル（.vdrun / .xlsx / .csv）を読み、(パス, 更新時刻, 要約値, イベント) を返す（ワーカープロセス用）。"""
+    if path.lower().endswith(".vdrun"):
+        archive = RunArchive(path)
+        ion, thermo, heater = (_cleaned_column(archive.channels, c) for c in ("電離真空計", "熱電対", "ヒーター電圧"))
+        columns = archive.read_window(channels=[c for c in (ion, thermo, heater) if c in archive.channels])
+        start = archive.meta.get("start_time") or (float(columns["time"][0]) if len(columns["time"]) else 0.0)
+        events = _run_events(path, columns["time"], start, columns.get(heater), columns[thermo], columns[ion],
+                             GAP_COLUMN in archive.channels)
+        summary = summarize(columns["time"], columns[ion], columns[thermo], events, archive.meta)
+    else:
+        import pandas as pd
+        if path.lower().endswith(".csv"):
+            df = pd.read_csv(path, encoding="utf-8-sig", float_precision="round_trip")
+        else:
+            df = pd.read_excel(path)
+        if "Epoch" in df.columns:
+            times = df["Epoch"].to_numpy(dtype=float)
+        else:
+            # 古い形式（文字列の Timestamp）はローカル時刻として epoch秒に変換する
+            times = np.array([t.timestamp() for t in pd.to_datetime(df["Timestamp"])])
+        pressure = pd.to_numeric(df[_cleaned_column(df.columns, "電離真空計")], errors="coerce").to_numpy(dtype=float)
+        temperature = pd.to_numeric(df[_cleaned_column(df.columns, "熱電対")], errors="coerce").to_numpy(dtype=float)
+        heater_column = _cleaned_column(df.columns, "ヒーター電圧")
+        heater = (pd.to_numeric(df[heater_column], errors="coerce").to_numpy(dtype=float)
+                  if heater_column in df.columns else None)
+        start = float(times[0]) if len(times) else 0.0
+        events = _run_events(path, times, start, heater, temperature, pressure, GAP_COLUMN in df.columns)
+        summary = summarize(times, pressure, temperature, events)
+    return path, os.path.getmtime(path), summary, events
+
+
+class RunCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _same_runs(self, path, summary):
+        """summary と同じ測定を別のファイルで登録した行。"""
+        if summary["started_at"] is None or summary["ended_at"] is None:
+            return []
+        return self.conn.execute(
+            "SELECT id, path, source_mtime FROM runs WHERE path != ? AND n_samples = ?"
+            " AND abs(started_at - ?) <= ? AND abs(ended_at - ?) <= ?",
+            (path, summary["n_samples"], summary["started_at"], SAME_RUN_START_SECONDS,
+             summary["ended_at"], SAME_RUN_END_SECONDS)).fetchall()
+
+    def register(self, path, summary, events=(), source_mtime=None):
+        """
+        ランを登録する（同じパスが登録済みなら上書き）。同じ測定を優先度が同じか高いファイルで登録済みなら
+        重複として記録するだけで False を返す。優先度の低いファイルで登録済みなら、そちらを重複に付け替える。
+        """
+        path = os.path.abspath(path)
+        columns = ["path", "source_mtime"] + list(summary)
+        values = [path, source_mtime] + list(summary.values())
+        with self.conn:
+            self.conn.execute("DELETE FROM runs WHERE path = ?", (path,))
+            self.conn.execute("DELETE FROM duplicates WHERE path = ?", (path,))
+            same = self._same_runs(path, summary)
+            kept = [row for row in same if run_priority(row["path"]) <= run_priority(path)]
+            if kept:
+                self.conn.execute("INSERT INTO duplicates (path, source_mtime, run_id) VALUES (?, ?, ?)",
+                                  (path, source_mtime, kept[0]["id"]))
+                return False
+            cur = self.conn.execute(f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                    values)
+            self.conn.executemany("INSERT INTO events (run_id, t, label, color) VALUES (?, ?, ?, ?)",
+                                  [(cur.lastrowid, t, label, color) for t, label, color in events])
+            # 置き換える行と、その重複を今回の行に付け替える
+            self.conn.executemany("UPDATE duplicates SET run_id = ? WHERE run_id = ?",
+                                  [(cur.lastrowid, row["id"]) for row in same])
+            self.conn.executemany("INSERT INTO duplicates (path, source_mtime, run_id) VALUES (?, ?, ?)",
+                                  [(row["path"], row["source_mtime"], cur.lastrowid) for row in same])
+            self.conn.executemany("DELETE FROM runs WHERE id = ?", [(row["id"],) for row in same])
+        return True
+
+    def is_current(self, path):
+        """登録済み（重複として記録済みを含む）で、ファイルが登録後に変更されていなければ True。"""
+        path = os.path.abspath(path)
+        row = (self.conn.execute("SELECT source_mtime FROM runs WHERE path = ?", (path,)).fetchone()
+               or self.conn.execute("SELECT source_mtime FROM duplicates WHERE path = ?", (path,)).fetchone())
+        return row is not None and row["source_mtime"] == os.path.getmtime(path)
+
+    def query(self, min_temperature=None, max_pressure=None, order_by="started_at", descending=True, limit=50):
+        """条件に合うランを返す（order_by は索引のある列を推奨）。"""
+        if order_by not in ("started_at", "min_pressure", "max_temperature", "time_to_vapor_ready",
+                            "time_to_heater_ready", "deposition_duration"):
+            raise ValueError(f"並べ替えに使えない列です: {order_by}")
+        conditions, params = [], []
+        if min_temperature is not None:
+            conditions.append("max_temperature >= ?")
+            params.append(min_temperature)
+        if max_pressure is not None:
+            conditions.append("min_pressure <= ?")
+            params.append(max_pressure)
+        if order_by.startswith("time_to") or order_by == "deposition_duration":
+            conditions.append(f"{order_by} IS NOT NULL")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT * FROM runs {where} ORDER BY {order_by} {'DESC' if descending else 'ASC'} LIMIT ?"
+        return self.conn.execute(sql, params + [limit]).fetchall()
+
+    def fastest_pumpdown(self, limit=10):
+        """2.67e-4 Pa に到達するまでの時間が短い順に返す。"""
+        return self.query(order_by="time_to_vapor_ready", descending=False, limit=limit)
+
+    def events(self, run_id):
+        return self.conn.execute("SELECT t, label, color FROM events WHERE run_id = ? ORDER BY t", (run_id,)).fetchall()
+
+
+def find_run_files(folder):
+    """
+    フォルダ内の測定ファイル（イベントのサイドカーは除く）。同じ名前の .vdrun がある測定ログ（.csv）は
+    同じ測定なので返さない（Excel 書き出しなど名前の違うものは登録時に開始・終了時刻で見分ける）。
+    """
+    files = []
+    for ext in RUN_EXTENSIONS:
+        files.extend(f for f in glob.glob(os.path.join(folder, "**", "*" + ext), recursive=True)
+                     if not f.lower().endswith(".events.csv"))
+    archives = {os.path.splitext(os.path.basename(f))[0] for f in files if f.lower().endswith(".vdrun")}
+    return sorted(f for f in files
+                  if not (f.lower().endswith(".csv") and os.path.splitext(os.path.basename(f))[0] in archives))
+
+
+def backfill(folder, catalog_path=CATALOG_PATH, workers=None):
+    """フォルダ内の測定ファイルを並列に要約して登録する（登録済みで未変更のファイルはスキップ）。"""
+    catalog = RunCatalog(catalog_path)
+    targets = [f for f in find_run_files(folder) if not catalog.is_current(f)]
+    print(f"{len(targets)} 件を登録します")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(summarize_file, f) for f in targets]
+        for future in futures:
+            try:
+                path, mtime, summary, events = future.result()
+            except Exception as e:
+                print(f"要約エラー: {e}")
+                continue
+            # 書き込みはこのプロセスだけで行う
+            if catalog.register(path, summary, events, mtime):
+                print(f"登録: {os.path.basename(path)}")
+            else:
+                print(f"登録済みの測定と同じ: {os.path.basename(path)}")
+    catalog.close()
+
+
+def _format(value, unit=""):
+    if value is None:
+        return "-"
+    return f"{value:.3g}{unit}" if isinstance(value, float) else f"{value}{unit}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="測定ランのカタログ")
+    parser.add_argument("--db", default=CATALOG_PATH, help="カタログのファイル")
+    sub = parser.add_subparsers(dest="command", required=True)
+    index_parser = sub.add_parser("index", help="フォルダ内の測定ファイルを一括登録する")
+    index_parser.add_argument("folder")
+    index_parser.add_argument("--workers", type=int, default=None)
+    query_parser = sub.add_parser("query", help="ランを検索する")
+    query_parser.add_argument("--min-temp", type=float, help="最高温度がこの値 [℃] 以上")
+    query_parser.add_argument("--max-pressure", type=float, help="最低圧力がこの値 [Pa] 以下")
+    query_parser.add_argument("--fastest-pumpdown", action="store_true", help="2.67e-4 Pa への到達が速い順")
+    query_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "index":
+        backfill(args.folder, args.db, args.workers)
+        return
+    catalog = RunCatalog(args.db)
+    if args.fastest_pumpdown:
+        rows = catalog.query(args.min_temp, args.max_pressure, "time_to_vapor_ready", False, args.limit)
+    else:
+        rows = catalog.query(args.min_temp, args.max_pressure, limit=args.limit)
+    for row in rows:
+        print(f"{row['path']} | 最低圧力 {_format(row['min_pressure'], ' Pa')} | 最高温度 {_format(row['max_temperature'], '℃')} | "
+              f"2.67e-4 Pa到達 {_format(row['time_to_vapor_ready'], ' s')} | 蒸着時間 {_format(row['deposition_duration'], ' s')}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
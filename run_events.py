@@ -0,0 +1,182 @@
+"""
+測定ファイルのイベント（基板温度測定・蒸着の開始／終了）の保存・読み込みと推定
+
+測定中のイベントマーカーは測定データと一緒に残す。いずれも (epoch秒, ラベル, 色) の並び。
+    ・.vdrun アーカイブ: アーカイブのイベント
+    ・Excel（acquisition.py の書き出し）: "Events" シート
+    ・測定ログ（CSV）: 同名のサイドカー（run1.csv → run1.events.csv）
+
+記録の無いファイル（古いファイル・手で作ったファイル）は、記録値の変化から detect_events() で推定する。
+numpy の配列演算だけで求めるので、長い測定でも1ファイル数ミリ秒で終わる。
+    ・基板温度測定の開始／終了: ヒーター電圧が入った／切れた時刻（電圧が無ければ温度の上昇）
+    ・蒸着の開始／終了: 記録間隔が短くなった／戻った時刻（蒸着中は1秒間隔で記録する）。
+      間隔が変わらないファイルと、適応サンプリング（省略数の列がある）のファイルは、
+      真空度（log10）の段差が最も大きい上昇と、その後の下降。適応サンプリングでは値が一定の間は記録せず、
+      速く変わるときは間隔を詰めるので、行の間隔は蒸着と関係なく変わる
+"""
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+
+# イベント名と、その操作を行うボタンの色（acquisition.py の add_event_marker と同じ）
+EVENT_COLORS = {
+    "start temperature": "green",
+    "end temperature": "orange",
+    "start vapor deposition": "blue",
+    "end vapor deposition": "red",
+}
+
+EVENTS_SHEET = "Events"
+EVENT_COLUMNS = ["Timestamp", "Epoch", "Label", "Color"]
+# 記録しなかった測定回数の列（acquisition.py の GAP_COLUMN）。この列があるファイルは行の間隔で蒸着を推定しない
+GAP_COLUMN = "省略数"
+
+# 推定の設定
+HEATER_ON_VOLTAGE = 1.0        # これを超えたらヒーターが入っているとみなす [V]
+TEMPERATURE_RISE = 5.0         # ヒーター電圧が無いとき、測定開始時からこれだけ上がったら昇温開始 [℃]
+FAST_INTERVAL_RATIO = 0.6      # 通常の記録間隔のこの割合より短い間隔を蒸着中とみなす
+MIN_EVENT_SAMPLES = 5          # 蒸着・ヒーターの区間とみなす最小のサンプル数
+PRESSURE_STEP_SECONDS = 300    # 真空度の段差を比べる前後の秒数
+PRESSURE_STEP_DECADES = 1.0    # 真空度の段差とみなす最小の変化（桁）
+
+
+def events_sidecar_path(path):
+    """測定ログ（CSV）のイベントのサイドカーのパス。"""
+    return os.path.splitext(path)[0] + ".events.csv"
+
+
+def _event_row(t, label, color):
+    return [datetime.fromtimestamp(t), t, label, color]
+
+
+def write_events_sheet(workbook, events):
+    """openpyxl の Workbook に "Events" シートを追加してイベントを書く（書き込み専用モードでも使える）。"""
+    ws = workbook.create_sheet(EVENTS_SHEET)
+    ws.append(EVENT_COLUMNS)
+    for t, label, color in events:
+        ws.append(_event_row(t, label, color))
+
+
+def append_event_csv(path, t, label, color):
+    """測定ログのサイドカーにイベントを1行追記する（無ければ見出し付きで作る）。"""
+    new = not os.path.exists(path)
+    with open(path, "a", encoding="utf-8-sig" if new else "utf-8", newline="") as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(EVENT_COLUMNS)
+        row = _event_row(t, label, color)
+        row[0] = row[0].strftime("%Y-%m-%d %H:%M:%S")
+        writer.writerow(row)
+
+
+def read_events(path):
+    """
+    測定ファイルに記録されたイベントを [(epoch秒, ラベル, 色), ...] で返す。
+    記録が無い（古い形式・サイドカーが無い）場合は None（推定するかどうかは呼び出し側が決める）。
+    """
+    lower = path.lower()
+    if lower.endswith(".vdrun"):
+        from run_archive import RunArchive
+        events = RunArchive(path).events
+        return [(e["t"], e["label"], e["color"]) for e in events] if events else None
+    if lower.endswith((".xlsx", ".xls")):
+        import pandas as pd
+        with pd.ExcelFile(path) as book:
+            if EVENTS_SHEET not in book.sheet_names:
+                return None
+            df = book.parse(EVENTS_SHEET)
+        return [(float(t), str(label), str(color)) for t, label, color in zip(df["Epoch"], df["Label"], df["Color"])]
+    sidecar = events_sidecar_path(path)
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar, encoding="utf-8-sig", newline="") as f:
+        return [(float(r["Epoch"]), r["Label"], r["Color"]) for r in csv.DictReader(f)]
+
+
+def _runs(mask):
+    """mask が True の区間の (開始, 終了) インデックス（終了は含まない）。"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _window_step(elapsed, values, window):
+    """
+    各時刻の直後 window 秒の時間平均と直前 window 秒の時間平均の差（NaN は除く）。前後に window 秒が無い位置は NaN。
+    各値は次の記録まで保たれていたとして時間で重み付けするので、記録の間隔が一定でなくてもよい。
+    """
+    result = np.full(len(elapsed), np.nan)
+    finite = np.isfinite(values)
+    t, v = elapsed[finite], values[finite]
+    if len(t) < 2 or t[-1] - t[0] < 2 * window:
+        return result
+    # integral[i] は t[0] から t[i] までの積分。区間の間は値が一定なので、任意の時刻へは線形補間で求まる
+    integral = np.concatenate(([0.0], np.cumsum(v[:-1] * np.diff(t))))
+    valid = (elapsed - window >= t[0]) & (elapsed + window <= t[-1])
+    at = elapsed[valid]
+    before = (np.interp(at, t, integral) - np.interp(at - window, t, integral)) / window
+    after = (np.interp(at + window, t, integral) - np.interp(at, t, integral)) / window
+    result[valid] = after - before
+    return result
+
+
+def _heater_events(elapsed, heater, temperature):
+    on = np.zeros(len(elapsed), bool) if heater is None else np.nan_to_num(heater, nan=0.0) > HEATER_ON_VOLTAGE
+    starts, ends = _runs(on)
+    keep = ends - starts >= MIN_EVENT_SAMPLES
+    starts, ends = starts[keep], ends[keep]
+    if len(starts):
+        events = [(elapsed[starts[0]], "start temperature")]
+        if ends[-1] < len(elapsed):
+            events.append((elapsed[ends[-1]], "end temperature"))
+        return events
+    if temperature is None or not np.isfinite(temperature).any():
+        return []
+    baseline = np.nanmedian(temperature[:MIN_EVENT_SAMPLES])
+    risen = np.flatnonzero(np.nan_to_num(temperature, nan=-np.inf) > baseline + TEMPERATURE_RISE)
+    return [(elapsed[risen[0]], "start temperature")] if len(risen) else []
+
+
+def _vapor_events(elapsed, pressure, adaptive):
+    intervals = np.diff(elapsed)
+    if not adaptive and len(intervals) >= MIN_EVENT_SAMPLES:
+        # 通常の記録間隔は蒸着中（短い間隔）のサンプルが多くても埋もれないよう、上位の分位で決める
+        fast = intervals < np.percentile(intervals, 90) * FAST_INTERVAL_RATIO
+        starts, ends = _runs(fast)
+        if len(starts):
+            longest = np.argmax(ends - starts)
+            if ends[longest] - starts[longest] >= MIN_EVENT_SAMPLES:
+                # intervals[i] は i 番目と i+1 番目のサンプルの間
+                events = [(elapsed[starts[longest]], "start vapor deposition")]
+                if ends[longest] < len(intervals):
+                    events.append((elapsed[ends[longest]], "end vapor deposition"))
+                return events
+    if pressure is None:
+        return []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_pressure = np.log10(np.where(pressure > 0, pressure, np.nan))
+    step = _window_step(elapsed, log_pressure, PRESSURE_STEP_SECONDS)
+    if not np.isfinite(step).any() or np.nanmax(step) < PRESSURE_STEP_DECADES:
+        return []
+    rise = int(np.nanargmax(step))
+    events = [(elapsed[rise], "start vapor deposition")]
+    later = np.where(elapsed >= elapsed[rise] + PRESSURE_STEP_SECONDS, step, np.nan)
+    if np.isfinite(later).any() and np.nanmin(later) <= -PRESSURE_STEP_DECADES:
+        events.append((elapsed[int(np.nanargmin(later))], "end vapor deposition"))
+    return events
+
+
+def detect_events(elapsed, heater=None, temperature=None, pressure=None, adaptive=False):
+    """
+    記録値の変化からイベントを推定し、[(elapsed と同じ秒の時刻, ラベル, 色), ...] を時刻順に返す。
+    elapsed は昇順の時刻、heater / temperature / pressure は同じ長さの配列（無い列は None、欠測は NaN）。
+    adaptive=True（GAP_COLUMN のある適応サンプリングのファイル）は、蒸着を行の間隔ではなく真空度から推定する。
+    """
+    elapsed = np.asarray(elapsed, dtype=float)
+    if len(elapsed) == 0:
+        return []
+    heater, temperature, pressure = (None if a is None else np.asarray(a, dtype=float)
+                                     for a in (heater, temperature, pressure))
+    events = _heater_events(elapsed, heater, temperature) + _vapor_events(elapsed, pressure, adaptive)
+    return sorted((float(t), label, EVENT_COLORS[label]) for t, label in events)
@@ -0,0 +1,171 @@
+"""
+センサー異常値フィルタ（逐次処理）
+
+測定値を1サンプルずつ受け取り、直近 window 点の移動中央値と MAD（中央値絶対偏差）から
+スパイク（外れ値）と短い欠測（"Error" の応答・数値に変換できない応答）を検出して補正値を返す。
+
+    ・外れ値: |x - 中央値| > n_sigma × 1.4826 × MAD のとき、補正値は中央値にする
+    ・欠測: 直前の補正値を max_hold サンプルまで保持し、それより長い欠測は NaN のままにする
+    ・真空度は桁で変わるので log10 の値で判定する（log=True）
+
+外れ値と判定した値も窓には入れるので、本当に値が変わった場合（段差）は窓の半分ほどで追従する。
+1サンプルあたりの比較回数は O(log w)（整列済みの窓への挿入・削除は bisect、MAD は2つの整列済み配列の k 番目）。
+"""
+import bisect
+import math
+from collections import deque
+
+# フラグ（補正の理由）
+FLAG_OK = 0
+FLAG_OUTLIER = 1    # 外れ値を中央値で置き換えた
+FLAG_HOLD = 2       # 欠測を直前の値で補った
+FLAG_MISSING = 3    # 欠測が長く、補わなかった（NaN）
+
+MAD_SCALE = 1.4826   # 正規分布で MAD を標準偏差に換算する係数
+
+# チャンネルごとの設定（acquisition.py の CHANNEL_COLUMNS と同じ名前）
+# min_spread: MAD が小さすぎるとき（値が一定のとき）に使う最小のばらつき（log=True では桁）
+CHANNEL_FILTERS = {
+    "ピラニ1": {"log": True, "min_spread": 0.05},
+    "ピラニ2": {"log": True, "min_spread": 0.05},
+    "電離真空計": {"log": True, "min_spread": 0.05},
+    "熱電対": {"log": False, "min_spread": 2.0},
+    "ヒーター電圧": {"log": False, "min_spread": 0.5},
+}
+
+
+def _kth_of_two_sorted(a, len_a, b, len_b, k):
+    """
+    昇順の2つの数列 a, b（添字→値の関数で与える）を合わせたときの k 番目（0始まり）の値を O(log k) で返す。
+    """
+    # 小さい方から k+1 個のうち a から取る個数 i を二分探索する
+    lo = max(0, k + 1 - len_b)
+    hi = min(k + 1, len_a)
+    while lo < hi:
+        i = (lo + hi) // 2
+        if a(i) < b(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    candidates = ([a(i - 1)] if i > 0 else []) + ([b(j - 1)] if j > 0 else [])
+    return max(candidates)
+
+
+class RollingMedianMAD:
+    """直近 window 点の中央値と MAD を保持する。"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def clear(self):
+        self.values.clear()
+        self.sorted = []
+
+    def push(self, x):
+        self.values.append(x)
+        bisect.insort(self.sorted, x)
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+
+    def median(self):
+        s = self.sorted
+        n = len(s)
+        return s[n // 2] if n % 2 else 0.5 * (s[n // 2 - 1] + s[n // 2])
+
+    def mad(self, m):
+        """中央値 m からの絶対偏差の中央値。m より小さい側と大きい側はそれぞれ偏差が昇順に並ぶ。"""
+        s = self.sorted
+        n = len(s)
+        split = bisect.bisect_left(s, m)
+        # 下側: m - s[split-1], m - s[split-2], ...（昇順）、上側: s[split] - m, s[split+1] - m, ...（昇順）
+        below = lambda i: m - s[split - 1 - i]
+        above = lambda j: s[split + j] - m
+
+        def kth(k):
+            return _kth_of_two_sorted(below, split, above, n - split, k)
+
+        return kth(n // 2) if n % 2 else 0.5 * (kth(n // 2 - 1) + kth(n // 2))
+
+
+class ChannelFilter:
+    """1チャンネル分のフィルタ。update() に生の値（欠測は NaN）を渡すと (補正値, フラグ) を返す。"""
+
+    def __init__(self, window=15, n_sigma=5.0, max_hold=3, min_count=5, log=False, min_spread=0.0):
+        self.stats = RollingMedianMAD(window)
+        self.n_sigma = n_sigma
+        self.max_hold = max_hold
+        self.min_count = min_count
+        self.log = log
+        self.min_spread = min_spread
+        self.reset()
+
+    def reset(self):
+        self.stats.clear()
+        self.last = float("nan")
+        self.missing_run = 0
+
+    def update(self, value):
+        x = value
+        if self.log:
+            x = math.log10(value) if value is not None and value > 0 else float("nan")
+        if x is None or math.isnan(x) or math.isinf(x):
+            self.missing_run += 1
+            if self.missing_run <= self.max_hold and not math.isnan(self.last):
+                return self.last, FLAG_HOLD
+            return float("nan"), FLAG_MISSING
+        self.missing_run = 0
+        flag = FLAG_OK
+        cleaned = value
+        if len(self.stats) >= self.min_count:
+            m = self.stats.median()
+            spread = max(MAD_SCALE * self.stats.mad(m), self.min_spread)
+            if abs(x - m) > self.n_sigma * spread:
+                flag = FLAG_OUTLIER
+                cleaned = 10 ** m if self.log else m
+        self.stats.push(x)
+        self.last = cleaned
+        return cleaned, flag
+
+
+class SensorFilter:
+    """全チャンネルをまとめて処理する。設定の無いチャンネルは既定値を使う。"""
+
+    def __init__(self, channels, window=15, n_sigma=5.0, max_hold=3):
+        self.channels = list(channels)
+        self.filters = [ChannelFilter(window, n_sigma, max_hold, **CHANNEL_FILTERS.get(c, {}))
+                        for c in self.channels]
+        self.counts = {c: {FLAG_OUTLIER: 0, FLAG_HOLD: 0, FLAG_MISSING: 0} for c in self.channels}
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+        for counts in self.counts.values():
+            for flag in counts:
+                counts[flag] = 0
+
+    def update(self, values):
+        """各チャンネルの生の値を受け取り、(補正値のリスト, フラグのリスト) を返す。"""
+        cleaned, flags = [], []
+        for c, f, v in zip(self.channels, self.filters, values):
+            value, flag = f.update(v)
+            cleaned.append(value)
+            flags.append(flag)
+            if flag != FLAG_OK:
+                self.counts[c][flag] += 1
+        return cleaned, flags
+
+
+def pack_flags(flags):
+    """チャンネルごとのフラグ（0〜3）を1つの整数にまとめる（チャンネル i は 2i ビット目から2ビット）。"""
+    return sum(flag << (2 * i) for i, flag in enumerate(flags))
+
+
+def unpack_flags(packed, n_channels):
+    return [(int(packed) >> (2 * i)) & 3 for i in range(n_channels)]
@@ -0,0 +1,162 @@
+"""
+測定器のシリアルポートの自動検出
+
+USB シリアル変換器の COM 番号は挿し直すと変わるので、測定開始時に候補のポートを全部並列に開き、
+各測定器の初期化コマンド（識別を兼ねる）への応答で種類を判定する。
+    ・デジタルマルチメータ（熱電対・ヒーター電圧）: MAIN:FUNC? に測定機能（DCV / ACV など）を返す
+    ・電離真空計: RE, F1 に OK を返す
+    ・ピラニ真空計: CO に OK を返す
+同じ種類が2台ある（ピラニ1/2、熱電対/ヒーター電圧）ときは、前回の対応（PORT_CACHE のハードウェアID）、
+設定の COM ポート、マルチメータの測定機能（熱電対は DCV、ヒーター電圧は ACV で使う）の順で決める。
+どれにも当てはまらない測定器は、残った台数が空いている役割の数以下のときだけ割り当てる
+（多いときは他のチャンバーの測定器かもしれないので、設定の COM ポートのままにする）。
+
+全ポートを同時に調べるので、かかる時間はほぼ1台分の初期化（開いてからの待ち2秒 + 応答）。
+前回の対応のハードウェアIDがすべて接続されていれば、そのポートだけを調べる。
+判定したポートは開いたまま返すので、測定ループは初期化をやり直さずにそのまま使える。
+
+    python acquisition.py --discover     （検出結果を表示するだけ）
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PORT_CACHE = "port_cache.json"   # {チャンバー名: {役割: ハードウェアID}}
+BAUDRATE = 9600
+OPEN_WAIT = 2.0        # 真空計はポートを開いてからこの秒数待ってから応答する
+PROBE_TIMEOUT = 0.5    # 1回の応答を待つ秒数
+COMMAND_WAIT = 0.3     # コマンドを送ってから読むまでの秒数
+
+# 役割（acquisition.py の CHANNEL_COLUMNS と同じ名前）と測定器の種類
+ROLE_KINDS = {
+    "ピラニ1": "pirani",
+    "ピラニ2": "pirani",
+    "電離真空計": "ion",
+    "熱電対": "dmm",
+    "ヒーター電圧": "dmm",
+}
+# マルチメータの役割ごとの測定機能（acquisition.py の getter が設定する機能）
+DMM_ROLE_FUNCTIONS = {"熱電対": "DCV", "ヒーター電圧": "ACV"}
+DMM_FUNCTIONS = ("DCV", "ACV", "DCI", "ACI", "RES", "FREQ", "TEMP")
+
+
+def _open(device):
+    import serial
+    return serial.Serial(device, BAUDRATE, timeout=PROBE_TIMEOUT, bytesize=8, stopbits=1, parity=serial.PARITY_NONE)
+
+
+def _ask(ser, command, terminator="\r"):
+    ser.reset_input_buffer()
+    ser.write((command + terminator).encode("ascii"))
+    time.sleep(COMMAND_WAIT)
+    return ser.readline().decode("ascii", errors="replace").strip()
+
+
+def probe_port(device):
+    """
+    device を開いて測定器の種類を調べ、(種類, 開いた Serial, 詳細) を返す。
+    種類は "dmm"（詳細は測定機能）・"ion"・"pirani"、判定できなければ (None, None, 応答やエラー) で、ポートは閉じる。
+    """
+    try:
+        ser = _open(device)
+    except Exception as e:
+        return None, None, str(e)
+    opened = time.monotonic()
+    try:
+        reply = _ask(ser, "MAIN:FUNC?", "\r\n").strip('"').upper()
+        function = next((f for f in DMM_FUNCTIONS if reply.startswith(f)), None)
+        if function is not None:
+            return "dmm", ser, function
+        # 真空計は開いてすぐには応答しない
+        time.sleep(max(0.0, opened + OPEN_WAIT - time.monotonic()))
+        if _ask(ser, "RE") == "OK" and _ask(ser, "F1") == "OK":
+            return "ion", ser, ""
+        if _ask(ser, "CO") == "OK":
+            return "pirani", ser, ""
+        reply = f"応答なし・不明な応答（{reply}）"
+    except Exception as e:
+        reply = str(e)
+    try:
+        ser.close()
+    except Exception:
+        pass
+    return None, None, reply
+
+
+def load_port_cache(path=PORT_CACHE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"ポートの対応の読み込みエラー: {e}")
+        return {}
+
+
+def save_port_cache(cache, path=PORT_CACHE):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"ポートの対応の保存エラー: {e}")
+
+
+def discover(configured, cached=None, exclude_ports=(), exclude_hwids=()):
+    """
+    測定器のポートを検出し、{役割: (ポート名, ハードウェアID, 開いた Serial)} を返す（見つからない役割は含まない）。
+    configured は {役割: 設定のCOMポート}、cached は前回の {役割: ハードウェアID}。
+    exclude_ports / exclude_hwids は他のチャンバーが使っている・設定しているポート（調べない）。
+    ただし exclude_ports でも、このチャンバーの前回の対応のハードウェアIDのポートは調べる。
+    """
+    from serial.tools import list_ports
+    cached = {role: hwid for role, hwid in (cached or {}).items() if role in configured}
+    hwids = {p.device: p.hwid for p in list_ports.comports()
+             if p.hwid not in exclude_hwids and (p.device not in exclude_ports or p.hwid in cached.values())}
+    by_hwid = {hwid: device for device, hwid in hwids.items()}
+    if len(cached) == len(configured) and all(hwid in by_hwid for hwid in cached.values()):
+        candidates = sorted(by_hwid[hwid] for hwid in cached.values())
+    else:
+        candidates = sorted(hwids)
+    if not candidates:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+        results = dict(zip(candidates, pool.map(probe_port, candidates)))
+
+    remaining = {}
+    for device, (kind, _, detail) in results.items():
+        if kind is None:
+            print(f"ポート検出: {device} の測定器は判定できませんでした（{detail}）")
+        else:
+            remaining.setdefault(kind, []).append(device)
+    assigned = {}
+
+    def unambiguous(role, device):
+        """空いている同じ種類の役割より残りの測定器が多くなければ True（多ければ持ち主が分からない）。"""
+        kind = ROLE_KINDS.get(role)
+        free = [r for r in configured if r not in assigned and ROLE_KINDS.get(r) == kind]
+        return len(remaining.get(kind, [])) <= len(free)
+
+    # 同じ種類が複数あるときの決め方（上から順に、当てはまるポートがあればそれにする）
+    rules = [
+        lambda role, device: hwids[device] == cached.get(role),
+        lambda role, device: device == configured.get(role),
+        lambda role, device: results[device][2] == DMM_ROLE_FUNCTIONS.get(role),
+        unambiguous,
+    ]
+    for rule in rules:
+        for role in configured:
+            if role in assigned:
+                continue
+            devices = remaining.get(ROLE_KINDS.get(role), [])
+            device = next((d for d in devices if rule(role, d)), None)
+            if device is not None:
+                devices.remove(device)
+                assigned[role] = (device, hwids[device], results[device][1])
+    # 役割の無かった測定器のポートは閉じる
+    for devices in remaining.values():
+        for device in devices:
+            print(f"ポート検出: {device} の測定器（{results[device][0]}）はどの役割か決められませんでした")
+            results[device][1].close()
+    return assigned
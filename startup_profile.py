@@ -0,0 +1,39 @@
+"""
+起動時間の計測
+
+スクリプトの先頭で import し、区切りごとに mark() を呼ぶ。
+report() で各区間の所要時間を表示し、STARTUP_LOG に1行ずつ追記する（起動時間の推移を追うため）。
+"""
+import csv
+import os
+import time
+from datetime import datetime
+
+STARTUP_LOG = "startup_times.csv"
+
+_t0 = time.perf_counter()
+_marks = []
+
+
+def mark(label):
+    """起動開始からの経過時間を label として記録する。"""
+    _marks.append((label, time.perf_counter() - _t0))
+
+
+def report(app_name):
+    """記録した区間を表示し、STARTUP_LOG に追記する。"""
+    print(f"起動時間 ({app_name}):")
+    previous = 0.0
+    for label, t in _marks:
+        print(f"  {label:<24s} +{t - previous:6.3f} s  (累計 {t:6.3f} s)")
+        previous = t
+    try:
+        new_file = not os.path.exists(STARTUP_LOG)
+        with open(STARTUP_LOG, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["date", "app", "label", "seconds"])
+            date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            writer.writerows([date, app_name, label, f"{t:.3f}"] for label, t in _marks)
+    except OSError as e:
+        print(f"起動時間の記録エラー: {e}")
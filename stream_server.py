@@ -0,0 +1,212 @@
+"""
+測定データのローカル配信サーバー（HTTP / WebSocket）
+
+acquisition.start_server_loop() の asyncio イベントループ上で動かし、ブラウザや解析スクリプトから
+測定中のデータを参照できるようにする。
+
+    GET /snapshot[?since=秒]  これまでのサンプルとイベントマーカーをJSONで返す
+    GET /stream               WebSocket。接続直後に snapshot を1回送り、以降は一定間隔でバッチを送る
+
+バッチの形式（各バッチは単独で復元できる差分符号化）:
+    {"type": "batch", "seq": 番号, "t": [最初の値, 差分, ...],
+     "values": {チャンネル名: [最初の値, 差分, ...], ...}, "events": [[秒, ラベル, 色], ...]}
+    値の欠測は null。null の次の値は直前の有効値からの差分になる。
+    seq が飛んだ場合は送信が追いつかずに捨てられたバッチがあり、直後に snapshot が再送される。
+"""
+import asyncio
+import json
+import math
+import threading
+from collections import deque
+
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 8765
+
+
+def _finite(value):
+    return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+
+def delta_encode(values):
+    """値の列を [最初の値, 差分, ...] に変換する。欠測(NaN)は None にし、差分の基準は直前の有効値とする。"""
+    encoded = []
+    base = None
+    for v in values:
+        if not _finite(v):
+            encoded.append(None)
+        elif base is None:
+            encoded.append(v)
+            base = v
+        else:
+            encoded.append(v - base)
+            base = v
+    return encoded
+
+
+def delta_decode(encoded):
+    """delta_encode の逆変換（クライアント側の参考実装）。"""
+    values = []
+    base = None
+    for d in encoded:
+        if d is None:
+            values.append(float("nan"))
+        else:
+            base = d if base is None else base + d
+            values.append(base)
+    return values
+
+
+class _Client:
+    def __init__(self, ws, queue_size):
+        self.ws = ws
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+
+class LiveStreamServer:
+    """
+    測定スレッドから publish() / publish_event() で受け取った値を保持し、HTTP と WebSocket で配信する。
+    publish 系はどのスレッドから呼んでもよい（イベントループ開始前の値も保持される）。
+    """
+
+    def __init__(self, channels, host=STREAM_HOST, port=STREAM_PORT, batch_interval=1.0,
+                 queue_size=32, history=100000):
+        self.channels = list(channels)
+        self.host = host
+        self.port = port
+        self.batch_interval = batch_interval
+        self.queue_size = queue_size
+        self.start_time = None
+        self.samples = deque(maxlen=history)   # (経過秒, [値...])
+        self.events = []                       # (経過秒, ラベル, 色)
+        self.clients = set()
+        self.seq = 0
+        self.runner = None
+        self._pending = []
+        self._pending_events = []
+        self._lock = threading.Lock()
+
+    # ----- 測定スレッド側 -----
+    def reset(self, start_time):
+        """測定開始時に呼ぶ。保持している値を消し、新しい測定として配信する。"""
+        with self._lock:
+            self.start_time = start_time
+            self._pending = [None]   # None は「履歴を消す」印
+            self._pending_events = []
+
+    def publish(self, t, values):
+        with self._lock:
+            self._pending.append((t, list(values)))
+
+    def publish_event(self, t, label, color):
+        with self._lock:
+            self._pending_events.append((t, label, color))
+
+    # ----- イベントループ側 -----
+    async def start(self):
+        """サーバーを起動する（同じイベントループで2回目以降は何もしない）。"""
+        if self.runner is not None:
+            return
+        from aiohttp import web   # 起動を速くするため、サーバーを起動するときに import する
+        app = web.Application()
+        app.router.add_get("/snapshot", self.handle_snapshot)
+        app.router.add_get("/stream", self.handle_stream)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        asyncio.ensure_future(self._broadcast_loop())
+        print(f"配信サーバー: http://{self.host}:{self.port}/snapshot")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def snapshot(self, since=None):
+        samples = [s for s in self.samples if since is None or s[0] > since]
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "start_time": self.start_time,
+            "channels": self.channels,
+            "t": [s[0] for s in samples],
+            "values": {c: [s[1][i] if _finite(s[1][i]) else None for s in samples]
+                       for i, c in enumerate(self.channels)},
+            "events": [list(e) for e in self.events],
+        }
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            events, self._pending_events = self._pending_events, []
+        if None in pending:
+            # 新しい測定が始まった：それ以前の値は捨てる
+            pending = pending[len(pending) - pending[::-1].index(None):]
+            self.samples.clear()
+            self.events.clear()
+        return pending, events
+
+    def _make_batch(self, samples, events):
+        self.seq += 1
+        return {
+            "type": "batch",
+            "seq": self.seq,
+            "t": delta_encode([s[0] for s in samples]),
+            "values": {c: delta_encode([s[1][i] for s in samples]) for i, c in enumerate(self.channels)},
+            "events": [list(e) for e in events],
+        }
+
+    async def _broadcast_loop(self):
+        while self.runner is not None:
+            await asyncio.sleep(self.batch_interval)
+            samples, events = self._take_pending()
+            if not samples and not events:
+                continue
+            self.samples.extend(samples)
+            self.events.extend(events)
+            message = json.dumps(self._make_batch(samples, events), ensure_ascii=False)
+            for client in list(self.clients):
+                if client.lagged:
+                    continue
+                try:
+                    client.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # 送信が追いつかないクライアントは溜まった分を捨て、snapshot で同期し直す
+                    client.lagged = True
+                    while not client.queue.empty():
+                        client.queue.get_nowait()
+                    client.queue.put_nowait(None)
+
+    async def handle_snapshot(self, request):
+        from aiohttp import web
+        since = request.query.get("since")
+        try:
+            since = float(since) if since is not None else None
+        except ValueError:
+            raise web.HTTPBadRequest(text="since は秒数で指定してください")
+        return web.Response(text=json.dumps(self.snapshot(since), ensure_ascii=False),
+                            content_type="application/json")
+
+    async def handle_stream(self, request):
+        from aiohttp import web
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client = _Client(ws, self.queue_size)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            async for _ in ws:
+                pass   # クライアントからの受信は使わない（切断の検出のみ）
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+        return ws
+
+    async def _send_loop(self, client):
+        await client.ws.send_str(json.dumps(self.snapshot(), ensure_ascii=False))
+        while not client.ws.closed:
+            message = await client.queue.get()
+            if message is None:
+                client.lagged = False
+                message = json.dumps(self.snapshot(), ensure_ascii=False)
+            await client.ws.send_str(message)